@@ -1,209 +1,286 @@
+import argparse
 import json
+import multiprocessing
+import os
+from collections import Counter
 
-def validate_jsonl_format(file_path):
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Expected structure with required keys and value types
+EXPECTED_STRUCTURE = {
+    "id": int,
+    "name": str,
+    "gender": str,
+    "age": int,
+    "medical_history": list,
+    "lifestyle_factor": list,
+    "vaccination_history": list,
+    "family_history": list,
+    "disease": str,
+    "level": str,
+    "symptom": dict,  # Will check nested structure separately
+    "examination_results": dict
+}
+
+# Expected nested structure for "symptom"
+EXPECTED_SYMPTOM_STRUCTURE = {
+    "symptoms": list,
+    "duration": str
+}
+
+# Translated records (same keys as KEY_MAP / SYMPTOM_KEY_MAP in scripts/translate_synthesized_data/medical_schema.py)
+EXPECTED_STRUCTURE_ZH = {
+    "id": int,
+    "名字": str,
+    "性别": str,
+    "年龄": int,
+    "病史": list,
+    "生活方式因素": list,
+    "疫苗接种史": list,
+    "家族史": list,
+    "疾病": str,
+    "级别": str,
+    "症状": dict,
+    "检查结果": dict
+}
+
+EXPECTED_SYMPTOM_STRUCTURE_ZH = {
+    "症状": list,
+    "持续时间": str
+}
+
+# schema name -> (structure, symptom key, symptom structure, level key, allowed levels)
+SCHEMAS = {
+    "en": (EXPECTED_STRUCTURE, "symptom", EXPECTED_SYMPTOM_STRUCTURE, "level", ("mild", "moderate", "severe")),
+    "zh": (EXPECTED_STRUCTURE_ZH, "症状", EXPECTED_SYMPTOM_STRUCTURE_ZH, "级别", ("轻度", "中度", "重度")),
+}
+
+CHUNK_BYTES = 16 * 1024 ** 2
+
+
+def compile_schema(structure, symptom_key, symptom_structure, level_key, levels):
     """
-    Validate that all JSON items follow the exact format:
-    {
-        "id": int,
-        "name": str,
-        "gender": str,
-        "age": int,
-        "medical_history": list,
-        "lifestyle_factor": list,
-        "vaccination_history": list,
-        "family_history": list,
-        "disease": str,
-        "level": str,
-        "symptom": {
-            "symptoms": list,
-            "duration": str
-        },
-        "examination_results": dict
-    }
+    Compile a schema once into a checker function item -> list of issues (empty if valid).
+
+    Key sets, type checks and allowed levels are built here, not per line; a
+    valid item is accepted with one key-set comparison and one isinstance per key.
     """
-    
-    # Expected structure with required keys and value types
-    EXPECTED_STRUCTURE = {
-        "id": int,
-        "name": str,
-        "gender": str,
-        "age": int,
-        "medical_history": list,
-        "lifestyle_factor": list,
-        "vaccination_history": list,
-        "family_history": list,
-        "disease": str,
-        "level": str,
-        "symptom": dict,  # Will check nested structure separately
-        "examination_results": dict
-    }
-    
-    # Expected nested structure for "symptom"
-    EXPECTED_SYMPTOM_STRUCTURE = {
-        "symptoms": list,
-        "duration": str
-    }
-    
-    invalid_items = []
-    line_numbers = []
-    total_items = 0
-    
+    expected_keys = frozenset(structure)
+    type_checks = tuple((key, expected_type, expected_type.__name__)
+                        for key, expected_type in structure.items() if key != symptom_key)
+    expected_symptom_keys = frozenset(symptom_structure)
+    symptom_checks = tuple((key, expected_type, expected_type.__name__)
+                           for key, expected_type in symptom_structure.items())
+    allowed_levels = frozenset(levels)
+    levels_text = ", ".join(f"'{level}'" for level in levels)
+
+    def check(item):
+        if not isinstance(item, dict):
+            return [f"Item should be dict, got {type(item).__name__}"]
+        issues = []
+        keys = item.keys()
+        if keys != expected_keys:
+            missing_keys = expected_keys - keys
+            if missing_keys:
+                issues.append(f"Missing keys: {sorted(missing_keys)}")
+            extra_keys = keys - expected_keys
+            if extra_keys:
+                issues.append(f"Extra keys: {sorted(extra_keys)}")
+
+        for key, expected_type, type_name in type_checks:
+            if key in item and not isinstance(item[key], expected_type):
+                issues.append(f"Key '{key}' should be {type_name}, got {type(item[key]).__name__}")
+
+        if symptom_key in item:
+            symptom = item[symptom_key]
+            if not isinstance(symptom, dict):
+                issues.append(f"Key '{symptom_key}' should be dict, got {type(symptom).__name__}")
+            else:
+                missing_symptom_keys = expected_symptom_keys - symptom.keys()
+                if missing_symptom_keys:
+                    issues.append(f"Symptom missing keys: {sorted(missing_symptom_keys)}")
+                for key, expected_type, type_name in symptom_checks:
+                    if key in symptom and not isinstance(symptom[key], expected_type):
+                        issues.append(f"Symptom key '{key}' should be {type_name}, got {type(symptom[key]).__name__}")
+
+        if level_key in item:
+            level = item[level_key]
+            if not isinstance(level, str) or level not in allowed_levels:
+                issues.append(f"'{level_key}' should be one of {levels_text}, got '{level}'")
+        return issues
+
+    return check
+
+
+# Compiled once per process (the pool workers compile them when they import this module)
+CHECKERS = {name: compile_schema(*schema) for name, schema in SCHEMAS.items()}
+
+
+def plan_chunks(file_path, chunk_bytes=CHUNK_BYTES):
+    """Split a file into byte ranges of about chunk_bytes that start and end on line boundaries."""
+    size = os.path.getsize(file_path)
+    chunks = []
+    with open(file_path, 'rb') as f:
+        begin = 0
+        while begin < size:
+            f.seek(min(begin + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            chunks.append((begin, end))
+            begin = end
+    return chunks
+
+
+def validate_chunk(task):
+    """
+    Pool worker: validate the lines of one byte range.
+
+    Returns:
+        (number of lines in the range, number of non-empty items,
+         invalid items as {"line_number" (relative to the range, 1-based), "item_id", "issues", "data"})
+    """
+    file_path, begin, end, schema, field = task
+    check = CHECKERS[schema]
+    with open(file_path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    items = 0
+    invalid = []
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        items += 1
+        try:
+            item = loads(line)
+        except ValueError as e:
+            text = line.decode('utf-8', errors='replace').strip()
+            invalid.append({
+                "line_number": line_num,
+                "item_id": "Invalid JSON",
+                "issues": [f"JSON parsing error: {str(e)}"],
+                "data": text[:100] + "..." if len(text) > 100 else text
+            })
+            continue
+
+        record = item.get(field) if field and isinstance(item, dict) else item
+        issues = check(record)
+        if issues:
+            record_id = item.get("id", "Unknown") if isinstance(item, dict) else "Unknown"
+            invalid.append({"line_number": line_num, "item_id": record_id, "issues": issues, "data": item})
+    return len(lines), items, invalid
+
+
+def validate_jsonl_format(file_path, schema="en", field=None, report_file="invalid_items.jsonl",
+                          workers=None, chunk_bytes=CHUNK_BYTES, show=20):
+    """
+    Validate that all JSON items of a JSONL file follow the MedicalRecord format.
+
+    The file is split into byte-range chunks validated in parallel by a process
+    pool (orjson is used for decoding when installed); invalid items are
+    written to report_file as JSONL, in file order, as the chunks complete,
+    so memory does not grow with the number of invalid items.
+
+    Args:
+        file_path: JSONL file to check
+        schema: "en" for the synthesized records, "zh" for the translated (Chinese-key) records
+        field: Validate item[field] instead of the item, e.g. "translated" for translation outputs
+        report_file: JSONL report of the invalid items ({"line_number", "item_id", "issues", "data"})
+        workers: Number of processes (default: CPU count; 1 validates in this process)
+        chunk_bytes: Approximate size of a chunk
+        show: Number of invalid items printed in detail
+
+    Returns:
+        (whether every item is valid, summary dict)
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(file_path, begin, end, schema, field) for begin, end in plan_chunks(file_path, chunk_bytes)]
+
     print("Starting validation of JSONL file...")
     print("=" * 60)
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            total_items += 1
-            
-            # Skip empty lines
-            if not line.strip():
-                continue
-                
-            try:
-                item = json.loads(line.strip())
-                issues = []
-                
-                # Check 1: All required top-level keys exist
-                expected_keys = set(EXPECTED_STRUCTURE.keys())
-                actual_keys = set(item.keys())
-                
-                # Check for missing keys
-                missing_keys = expected_keys - actual_keys
-                if missing_keys:
-                    issues.append(f"Missing keys: {sorted(missing_keys)}")
-                
-                # Check for extra keys
-                extra_keys = actual_keys - expected_keys
-                if extra_keys:
-                    issues.append(f"Extra keys: {sorted(extra_keys)}")
-                
-                # Check 2: Value types for top-level keys
-                for key, expected_type in EXPECTED_STRUCTURE.items():
-                    if key in item:
-                        actual_value = item[key]
-                        
-                        # Special handling for symptom dict
-                        if key == "symptom":
-                            if not isinstance(actual_value, dict):
-                                issues.append(f"Key '{key}' should be dict, got {type(actual_value).__name__}")
-                            else:
-                                # Check nested symptom structure
-                                symptom_keys = set(actual_value.keys())
-                                expected_symptom_keys = set(EXPECTED_SYMPTOM_STRUCTURE.keys())
-                                
-                                missing_symptom_keys = expected_symptom_keys - symptom_keys
-                                if missing_symptom_keys:
-                                    issues.append(f"Symptom missing keys: {sorted(missing_symptom_keys)}")
-                                
-                                # Check symptom value types
-                                for symptom_key, symptom_expected_type in EXPECTED_SYMPTOM_STRUCTURE.items():
-                                    if symptom_key in actual_value:
-                                        if not isinstance(actual_value[symptom_key], symptom_expected_type):
-                                            issues.append(f"Symptom key '{symptom_key}' should be {symptom_expected_type.__name__}, "
-                                                        f"got {type(actual_value[symptom_key]).__name__}")
-                        
-                        # Check other top-level keys
-                        elif not isinstance(actual_value, expected_type):
-                            issues.append(f"Key '{key}' should be {expected_type.__name__}, "
-                                        f"got {type(actual_value).__name__}")
-                
-                # Check 3: Specific value constraints
-                if "id" in item and not isinstance(item["id"], int):
-                    issues.append("'id' must be an integer")
-                
-                if "age" in item and not isinstance(item["age"], int):
-                    issues.append("'age' must be an integer")
-                
-                if "level" in item and item["level"] not in ["mild", "moderate", "severe"]:
-                    issues.append(f"'level' should be 'mild', 'moderate', or 'severe', got '{item.get('level')}'")
-                
-                # Check list contents (optional, but helpful)
-                list_keys = ["medical_history", "lifestyle_factor", "vaccination_history", "family_history"]
-                for list_key in list_keys:
-                    if list_key in item:
-                        if not isinstance(item[list_key], list):
-                            issues.append(f"'{list_key}' should be a list")
-                        elif list_key == "symptom" and "symptoms" in item["symptom"]:
-                            if not isinstance(item["symptom"]["symptoms"], list):
-                                issues.append("'symptoms' inside 'symptom' should be a list")
-                
-                # If any issues found, record this item
-                if issues:
-                    invalid_items.append({
-                        "line_number": line_num,
-                        "item_id": item.get("id", "Unknown"),
-                        "issues": issues,
-                        "data": item  # Include the actual data for reference
-                    })
-                    line_numbers.append(line_num)
-                    
-            except json.JSONDecodeError as e:
-                invalid_items.append({
-                    "line_number": line_num,
-                    "item_id": "Invalid JSON",
-                    "issues": [f"JSON parsing error: {str(e)}"],
-                    "data": line.strip()[:100] + "..." if len(line) > 100 else line.strip()
-                })
-                line_numbers.append(line_num)
-    
+
+    total_items = 0
+    invalid_count = 0
+    issue_counts = Counter()
+    lines_before = 0
+    pool = multiprocessing.Pool(min(workers, len(tasks))) if workers > 1 and len(tasks) > 1 else None
+    try:
+        results = pool.imap(validate_chunk, tasks) if pool is not None else map(validate_chunk, tasks)
+        with open(report_file, 'w', encoding='utf-8') as report:
+            for line_count, items, invalid in results:
+                for entry in invalid:
+                    entry["line_number"] += lines_before
+                    report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    issue_counts.update(issue.split(":")[0].split(", got")[0] for issue in entry["issues"])
+                    if invalid_count < show:
+                        print(f"\nItem at line {entry['line_number']} (ID: {entry['item_id']}):")
+                        for i, issue in enumerate(entry["issues"], 1):
+                            print(f"  {i}. {issue}")
+                    invalid_count += 1
+                total_items += items
+                lines_before += line_count
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
     # Print summary report
     print("\n" + "=" * 60)
     print("VALIDATION REPORT")
     print("=" * 60)
     print(f"Total items processed: {total_items}")
-    print(f"Valid items: {total_items - len(invalid_items)}")
-    print(f"Invalid items: {len(invalid_items)}")
-    
-    if invalid_items:
-        print(f"Line numbers with issues: {line_numbers}")
-        print("\n" + "=" * 60)
-        print("DETAILED ISSUES:")
-        print("=" * 60)
-        
-        for invalid in invalid_items:
-            print(f"\nItem at line {invalid['line_number']} (ID: {invalid['item_id']}):")
-            for i, issue in enumerate(invalid['issues'], 1):
-                print(f"  {i}. {issue}")
-            
-            # Show a snippet of the problematic data
-            if "data" in invalid and invalid["data"]:
-                data_str = json.dumps(invalid["data"], indent=2) if isinstance(invalid["data"], dict) else invalid["data"]
-                print(f"\n  Data snippet: {data_str[:200]}..." if len(data_str) > 200 else f"\n  Data: {data_str}")
-            
-            print("-" * 40)
-        
-        return False, invalid_items
-    else:
-        print("\n✓ All items follow the expected format!")
-        return True, []
-
-
-def save_invalid_items_to_file(invalid_items, output_file="invalid_items.json"):
-    """Save invalid items to a JSON file for further analysis"""
-    if invalid_items:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(invalid_items, f, indent=2, ensure_ascii=False)
-        print(f"\nInvalid items saved to: {output_file}")
+    print(f"Valid items: {total_items - invalid_count}")
+    print(f"Invalid items: {invalid_count}")
+
+    summary = {
+        "total_items": total_items,
+        "invalid_items": invalid_count,
+        "issue_counts": dict(issue_counts),
+        "report_file": report_file,
+    }
+    if invalid_count:
+        print("\nIssues by kind:")
+        for issue, count in issue_counts.most_common():
+            print(f"  {issue}: {count}")
+        print(f"\nInvalid items saved to: {report_file}")
+        return False, summary
+
+    print("\n✓ All items follow the expected format!")
+    return True, summary
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that synthesized / translated cases follow the MedicalRecord format.")
     # Replace with your actual file path
-    file_path = "./pulmonology_case_synthesized_yonghui.jsonl"  # Change this to your actual file path
-    
+    parser.add_argument("file_path", nargs="?", default="./pulmonology_case_synthesized_yonghui.jsonl")
+    parser.add_argument("--schema", choices=sorted(SCHEMAS), default="en",
+                        help="en: synthesized records, zh: translated records with Chinese keys")
+    parser.add_argument("--field", default=None,
+                        help="validate this field of every item, e.g. 'translated' for translation outputs")
+    parser.add_argument("--report", default="invalid_items.jsonl", help="JSONL report of the invalid items")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 1024 ** 2, help="MB per chunk")
+    args = parser.parse_args()
+
     try:
-        is_valid, invalid_items = validate_jsonl_format(file_path)
-        
-        # Optionally save invalid items to a file
-        # if invalid_items:
-            # save_invalid_items_to_file(invalid_items)
-        
+        is_valid, summary = validate_jsonl_format(args.file_path, schema=args.schema, field=args.field,
+                                                  report_file=args.report, workers=args.workers,
+                                                  chunk_bytes=int(args.chunk_mb * 1024 ** 2))
+
         # Exit with appropriate code for scripting
         exit(0 if is_valid else 1)
-        
+
     except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.")
+        print(f"Error: File '{args.file_path}' not found.")
         print("Please make sure the file exists and the path is correct.")
         exit(1)
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
-        exit(1)
\ No newline at end of file
+        exit(1)
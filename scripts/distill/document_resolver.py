@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class LRUTTLCache:
+    """A small thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600.0):
+        """
+        Args:
+            maxsize: Maximum number of entries kept before evicting the least recently used one
+            ttl: Seconds an entry stays valid after it was stored
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate) -> None:
+        """Drop every entry whose key satisfies predicate(key)."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DocumentMetadataResolver:
+    """
+    Resolve (dataset_id, document_id) pairs to document names in bulk.
+
+    Chunks returned by RAGFlow only carry ids, and looking the names up chunk by
+    chunk costs two HTTP round trips per chunk. The resolver instead groups the
+    distinct pairs of a result set by dataset, lists each dataset's documents
+    page by page (one call usually covers the whole dataset), and keeps every
+    name it sees in a bounded LRU+TTL cache shared by all retriever calls.
+    """
+
+    MISSING_NAME = " "
+
+    def __init__(self, rag_object: Any, maxsize: int = 4096, ttl: float = 3600.0, page_size: int = 1024):
+        """
+        Args:
+            rag_object: RAGFlow client used for list_datasets / list_documents,
+                        or a zero-argument callable returning it (so the client can be built lazily)
+            maxsize: Maximum number of cached document names
+            ttl: Seconds a cached document name stays valid
+            page_size: Page size used when listing a dataset's documents
+        """
+        self._rag_object = rag_object
+        self.page_size = page_size
+        self._names = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self._datasets = LRUTTLCache(maxsize=256, ttl=ttl)
+
+    @property
+    def rag_object(self) -> Any:
+        return self._rag_object() if callable(self._rag_object) else self._rag_object
+
+    def prime(self, dataset_id: str, document_id: str, document_name: str) -> None:
+        """Record a document name that is already known, e.g. from a REST retrieval response."""
+        if dataset_id and document_id and document_name:
+            self._names.set((dataset_id, document_id), document_name)
+
+    def invalidate_dataset(self, dataset_id: str) -> None:
+        """Forget every cached name belonging to a dataset (e.g. after it changed on the server)."""
+        self._datasets.discard_where(lambda key: key == dataset_id)
+        self._names.discard_where(lambda key: key[0] == dataset_id)
+
+    def resolve(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """
+        Resolve document names for the given (dataset_id, document_id) pairs.
+
+        Args:
+            pairs: (dataset_id, document_id) pairs, duplicates allowed
+
+        Returns:
+            Dictionary mapping each distinct pair to its document name
+            (MISSING_NAME when the document cannot be found)
+        """
+        resolved = {}
+        missing_by_dataset: Dict[str, set] = {}
+
+        for pair in dict.fromkeys(pairs):
+            name = self._names.get(pair)
+            if name is None:
+                missing_by_dataset.setdefault(pair[0], set()).add(pair[1])
+            else:
+                resolved[pair] = name
+
+        for dataset_id, document_ids in missing_by_dataset.items():
+            found = self._fetch_document_names(dataset_id, document_ids)
+            for document_id in document_ids:
+                resolved[(dataset_id, document_id)] = found.get(document_id, self.MISSING_NAME)
+
+        return resolved
+
+    def resolve_one(self, dataset_id: str, document_id: str) -> str:
+        return self.resolve([(dataset_id, document_id)])[(dataset_id, document_id)]
+
+    def _get_dataset(self, dataset_id: str) -> Optional[Any]:
+        dataset = self._datasets.get(dataset_id)
+        if dataset is None:
+            datasets = self.rag_object.list_datasets(id=dataset_id)
+            if not datasets:
+                return None
+            dataset = datasets[0]
+            self._datasets.set(dataset_id, dataset)
+        return dataset
+
+    def _fetch_document_names(self, dataset_id: str, document_ids: set) -> Dict[str, str]:
+        """
+        List the dataset's documents until all requested ids are seen, caching every name on the way.
+
+        Ids that are still missing once the whole dataset has been listed (deleted
+        documents, stale chunks) are cached as MISSING_NAME with the same TTL, so
+        they do not trigger a full listing again on every query.
+        """
+        found: Dict[str, str] = {}
+        try:
+            dataset = self._get_dataset(dataset_id)
+            if dataset is None:
+                print(f"Warning: dataset {dataset_id} not found while resolving document names.")
+                self._cache_missing(dataset_id, document_ids, found)
+                return found
+
+            page = 1
+            while True:
+                documents: List[Any] = dataset.list_documents(page=page, page_size=self.page_size)
+                for document in documents:
+                    self._names.set((dataset_id, document.id), document.name)
+                    if document.id in document_ids:
+                        found[document.id] = document.name
+                if len(found) == len(document_ids):
+                    break
+                if len(documents) < self.page_size:
+                    self._cache_missing(dataset_id, document_ids, found)
+                    break
+                page += 1
+
+        except Exception as e:
+            print(f"Error resolving document names for dataset {dataset_id}: {e}")
+
+        return found
+
+    def _cache_missing(self, dataset_id: str, document_ids: set, found: Dict[str, str]) -> None:
+        for document_id in document_ids - found.keys():
+            self._names.set((dataset_id, document_id), self.MISSING_NAME)
@@ -0,0 +1,562 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from dataset_sync import load_snapshot
+from department_registry import DepartmentRecord, DepartmentRegistry
+
+# Embeds a batch of texts into a (len(texts), dim) float array
+EmbedFn = Callable[[List[str]], Any]
+
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:\.[0-9]+)?")
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def tokenize(text: str, ngram_range: Tuple[int, int] = (1, 2)) -> List[str]:
+    """
+    Split text into index terms: character n-grams for Chinese runs, whole lowercase words otherwise.
+
+    Args:
+        text: Text to tokenize
+        ngram_range: Smallest and largest character n-gram length for Chinese runs
+
+    Returns:
+        List of terms (with repetitions)
+    """
+    terms = []
+    low, high = ngram_range
+    for run in _TOKEN_RE.findall(text.lower()):
+        if not _CJK_RE.match(run):
+            terms.append(run)
+            continue
+        for n in range(low, high + 1):
+            terms.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return terms
+
+
+class LocalGuidelineIndex:
+    """
+    Read-only local mirror of RAGFlow chunks with a BM25 inverted index and optional dense vectors.
+
+    On-disk layout of an index directory:
+        meta.json               corpus statistics and build parameters
+        datasets.json           synced dataset dicts (department registry)
+        chunks.jsonl            one chunk per line: content, dataset_id, document_id, document_name, tags
+        chunk_offsets.npy       int64[N], byte offset of each chunks.jsonl line
+        vocab.json              term -> term id
+        postings_offsets.npy    int64[V + 1], CSR offsets into the postings arrays
+        postings_docs.npy       int32, chunk ids per term
+        postings_tfs.npy        float32, term frequencies per posting
+        doc_lengths.npy         float32[N], number of terms per chunk
+        chunk_datasets.npy      int32[N], dataset index per chunk
+        tag_offsets.npy / tag_docs.npy / tags.json   CSR chunk lists per tag
+        embeddings.npy          optional float32[N, D], L2-normalized
+
+    All arrays are opened with mmap_mode="r", so an index larger than memory
+    can be served and several worker processes share the same pages.
+    """
+
+    def __init__(self, index_dir: str):
+        """
+        Args:
+            index_dir: Directory written by LocalGuidelineIndex.build
+        """
+        self.index_dir = index_dir
+
+        with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(self._path("datasets.json"), "r", encoding="utf-8") as f:
+            self.datasets = json.load(f)
+        with open(self._path("vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        with open(self._path("tags.json"), "r", encoding="utf-8") as f:
+            self.tags: Dict[str, int] = json.load(f)
+
+        self.dataset_ids: List[str] = self.meta["dataset_ids"]
+        self.ngram_range = tuple(self.meta["ngram_range"])
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+        self.num_chunks = self.meta["num_chunks"]
+        self.avg_doc_length = self.meta["avg_doc_length"] or 1.0
+
+        self.postings_offsets = self._load("postings_offsets.npy")
+        self.postings_docs = self._load("postings_docs.npy")
+        self.postings_tfs = self._load("postings_tfs.npy")
+        self.doc_lengths = self._load("doc_lengths.npy")
+        self.chunk_datasets = self._load("chunk_datasets.npy")
+        self.tag_offsets = self._load("tag_offsets.npy")
+        self.tag_docs = self._load("tag_docs.npy")
+        self.embeddings = self._load("embeddings.npy") if self.meta.get("has_embeddings") else None
+
+        # Byte offsets of chunks.jsonl lines, so a hit is read without loading the whole file
+        self._chunk_offsets = self._load("chunk_offsets.npy")
+        self._chunks_file = open(self._path("chunks.jsonl"), "rb")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(self._path(name), mmap_mode="r")
+
+    def close(self) -> None:
+        self._chunks_file.close()
+
+    @classmethod
+    def build(cls,
+              chunks: Iterable[Dict[str, Any]],
+              index_dir: str,
+              datasets: Sequence[Dict[str, Any]],
+              embed_fn: Optional[EmbedFn] = None,
+              embed_batch_size: int = 64,
+              ngram_range: Tuple[int, int] = (1, 2),
+              k1: float = 1.2,
+              b: float = 0.75) -> "LocalGuidelineIndex":
+        """
+        Build an index directory from chunk dicts.
+
+        Args:
+            chunks: Dicts with content, dataset_id, document_id, document_name and optional tags
+            index_dir: Output directory (created if missing, files are overwritten)
+            datasets: Synced dataset dicts; their name / id pairs become the department registry
+            embed_fn: Optional embedding function; when given, a dense matrix is stored as well
+            embed_batch_size: Number of chunks embedded per embed_fn call
+            ngram_range: Character n-gram lengths used for Chinese text
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+
+        Returns:
+            The opened index
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        path = lambda name: os.path.join(index_dir, name)
+
+        dataset_index = {d["id"]: i for i, d in enumerate(datasets) if d.get("id")}
+        vocab: Dict[str, int] = {}
+        tag_ids: Dict[str, int] = {}
+        term_postings: List[List[Tuple[int, int]]] = []
+        tag_postings: List[List[int]] = []
+        doc_lengths = []
+        chunk_datasets = []
+        chunk_offsets = []
+        embeddings = []
+        pending_texts: List[str] = []
+
+        def flush_embeddings():
+            if pending_texts:
+                embeddings.append(np.asarray(embed_fn(pending_texts), dtype=np.float32))
+                pending_texts.clear()
+
+        with open(path("chunks.jsonl"), "wb") as out:
+            for chunk_id, chunk in enumerate(chunks):
+                record = {
+                    "content": chunk.get("content", ""),
+                    "dataset_id": chunk.get("dataset_id", ""),
+                    "document_id": chunk.get("document_id", ""),
+                    "document_name": chunk.get("document_name", " "),
+                    "tags": list(chunk.get("tags") or []),
+                }
+                chunk_offsets.append(out.tell())
+                out.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+                terms = tokenize(record["content"], ngram_range)
+                doc_lengths.append(len(terms))
+                for term, tf in Counter(terms).items():
+                    term_id = vocab.setdefault(term, len(vocab))
+                    if term_id == len(term_postings):
+                        term_postings.append([])
+                    term_postings[term_id].append((chunk_id, tf))
+
+                for tag in set(record["tags"]):
+                    tag_id = tag_ids.setdefault(tag, len(tag_ids))
+                    if tag_id == len(tag_postings):
+                        tag_postings.append([])
+                    tag_postings[tag_id].append(chunk_id)
+
+                chunk_datasets.append(dataset_index.get(record["dataset_id"], -1))
+
+                if embed_fn is not None:
+                    pending_texts.append(record["content"])
+                    if len(pending_texts) >= embed_batch_size:
+                        flush_embeddings()
+
+        num_chunks = len(doc_lengths)
+
+        postings_offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        postings_offsets[1:] = np.cumsum([len(p) for p in term_postings])
+        postings_docs = np.fromiter((doc for p in term_postings for doc, _ in p), dtype=np.int32, count=int(postings_offsets[-1]))
+        postings_tfs = np.fromiter((tf for p in term_postings for _, tf in p), dtype=np.float32, count=int(postings_offsets[-1]))
+
+        tag_offsets = np.zeros(len(tag_postings) + 1, dtype=np.int64)
+        tag_offsets[1:] = np.cumsum([len(p) for p in tag_postings])
+        tag_docs = np.fromiter((doc for p in tag_postings for doc in p), dtype=np.int32, count=int(tag_offsets[-1]))
+
+        np.save(path("postings_offsets.npy"), postings_offsets)
+        np.save(path("postings_docs.npy"), postings_docs)
+        np.save(path("postings_tfs.npy"), postings_tfs)
+        np.save(path("doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.float32))
+        np.save(path("chunk_datasets.npy"), np.asarray(chunk_datasets, dtype=np.int32))
+        np.save(path("chunk_offsets.npy"), np.asarray(chunk_offsets, dtype=np.int64))
+        np.save(path("tag_offsets.npy"), tag_offsets)
+        np.save(path("tag_docs.npy"), tag_docs)
+
+        has_embeddings = embed_fn is not None and num_chunks > 0
+        if has_embeddings:
+            flush_embeddings()
+            matrix = np.concatenate(embeddings, axis=0)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.maximum(norms, 1e-12)
+            np.save(path("embeddings.npy"), matrix)
+
+        meta = {
+            "num_chunks": num_chunks,
+            "avg_doc_length": float(np.mean(doc_lengths)) if doc_lengths else 0.0,
+            "ngram_range": list(ngram_range),
+            "k1": k1,
+            "b": b,
+            "dataset_ids": list(dataset_index.keys()),
+            "has_embeddings": has_embeddings,
+        }
+        for name, obj in (("meta.json", meta), ("datasets.json", list(datasets)),
+                          ("vocab.json", vocab), ("tags.json", tag_ids)):
+            with open(path(name), "w", encoding="utf-8") as f:
+                json.dump(obj, f, ensure_ascii=False, default=str)
+
+        return cls(index_dir)
+
+    def get_chunk(self, chunk_id: int) -> Dict[str, Any]:
+        self._chunks_file.seek(int(self._chunk_offsets[chunk_id]))
+        return json.loads(self._chunks_file.readline())
+
+    def _tag_mask(self, tags: Iterable[str]) -> np.ndarray:
+        mask = np.zeros(self.num_chunks, dtype=bool)
+        for tag in tags:
+            tag_id = self.tags.get(tag)
+            if tag_id is not None:
+                mask[self.tag_docs[self.tag_offsets[tag_id]:self.tag_offsets[tag_id + 1]]] = True
+        return mask
+
+    def candidate_mask(self, dataset_ids: Iterable[str], tag_feas: Optional[Iterable[str]] = None,
+                       exclude_tags: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Boolean mask of the chunks that belong to the datasets and pass the tag filters."""
+        wanted = set(dataset_ids)
+        dataset_numbers = [i for i, dataset_id in enumerate(self.dataset_ids) if dataset_id in wanted]
+        mask = np.isin(self.chunk_datasets, dataset_numbers)
+        if tag_feas:
+            mask &= self._tag_mask(tag_feas)
+        if exclude_tags:
+            mask &= ~self._tag_mask(exclude_tags)
+        return mask
+
+    def bm25_scores(self, question: str) -> np.ndarray:
+        """BM25 score of every chunk for the question (zero for chunks sharing no term)."""
+        scores = np.zeros(self.num_chunks, dtype=np.float32)
+        for term, query_tf in Counter(tokenize(question, self.ngram_range)).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end]
+            df = end - start
+            idf = math.log(1.0 + (self.num_chunks - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            # Each chunk appears at most once per term, so fancy-index accumulation is safe
+            scores[docs] += query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+        return scores
+
+    def search(self,
+               question: str,
+               dataset_ids: Iterable[str],
+               k: int = 32,
+               tag_feas: Optional[Iterable[str]] = None,
+               exclude_tags: Optional[Iterable[str]] = None,
+               query_embedding: Optional[Any] = None,
+               vector_similarity_weight: float = 0.3) -> List[Tuple[int, float]]:
+        """
+        Vectorized top-k search.
+
+        Without a query embedding, scores are BM25 normalized to [0, 1] by the best
+        candidate. With one (and a dense matrix in the index), the result is the
+        RAGFlow-style blend (1 - w) * keyword + w * cosine.
+
+        Returns:
+            (chunk_id, similarity) pairs, best first
+        """
+        mask = self.candidate_mask(dataset_ids, tag_feas, exclude_tags)
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+
+        keyword = self.bm25_scores(question)[candidates]
+        top = float(keyword.max())
+        if top > 0:
+            keyword /= top
+
+        if query_embedding is not None and self.embeddings is not None:
+            query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            dense = self.embeddings[candidates] @ query
+            scores = (1.0 - vector_similarity_weight) * keyword + vector_similarity_weight * dense
+        else:
+            scores = keyword
+            # Pure keyword mode: chunks without a shared term are not matches
+            matched = scores > 0
+            candidates, scores = candidates[matched], scores[matched]
+
+        k = min(k, scores.size)
+        if k <= 0:
+            return []
+        top_k = np.argpartition(-scores, k - 1)[:k]
+        top_k = top_k[np.argsort(-scores[top_k], kind="stable")]
+        return [(int(candidates[i]), float(scores[i])) for i in top_k]
+
+
+class LocalGuidelineRetriever:
+    """
+    In-process retriever over a LocalGuidelineIndex with the same interface as
+    treatment_guideline_retriever, for batch nodes that cannot reach RAGFlow.
+    """
+
+    def __init__(self, index_dir: str, embed_fn: Optional[EmbedFn] = None, vector_similarity_weight: float = 0.3):
+        """
+        Args:
+            index_dir: Directory written by export_local_index / LocalGuidelineIndex.build
+            embed_fn: Embedding function matching the one used at build time (enables hybrid search)
+            vector_similarity_weight: Weight of the dense score in hybrid search
+        """
+        self.index = LocalGuidelineIndex(index_dir)
+        self.embed_fn = embed_fn
+        self.vector_similarity_weight = vector_similarity_weight
+        self.registry = DepartmentRegistry(self.index.datasets)
+
+    @property
+    def department_mapping(self) -> Dict[str, str]:
+        """Read-only department name to ID mapping of the index."""
+        return self.registry.snapshot.name_to_id
+
+    def sync_datasets(self) -> None:
+        """The local index is a frozen snapshot; rebuild it with export_local_index to pick up server changes."""
+        print("Warning: LocalGuidelineRetriever is offline; rebuild the index with export_local_index() to sync.")
+
+    def get_department_ids(self, department_names: List[str]) -> List[str]:
+        """
+        Get department IDs for given department names.
+
+        Args:
+            department_names: List of department names (e.g., ["呼吸科", "眼科", "神经科"])
+
+        Returns:
+            List of department IDs
+        """
+        snapshot = self.registry.snapshot
+        department_ids = []
+        missing_departments = []
+
+        for dept_name in department_names:
+            dept_id = snapshot.get_id(dept_name)
+            if dept_id:
+                department_ids.append(dept_id)
+            else:
+                missing_departments.append(dept_name)
+
+        if missing_departments:
+            print(f"Warning: The following departments were not found: {missing_departments}")
+            print(f"Available departments: {snapshot.names()}")
+
+        return department_ids
+
+    def get_department_name(self, department_id: str) -> Optional[str]:
+        return self.registry.get_name(department_id)
+
+    def get_department_record(self, department_id: str) -> Optional[DepartmentRecord]:
+        return self.registry.get_record(department_id)
+
+    def get_available_departments(self) -> List[str]:
+        return self.registry.names()
+
+    def _search(self, question: str, department_ids: List[str], k: int,
+                tag_feas: Optional[List[str]] = None, exclude_tags: Optional[List[str]] = None) -> List[Dict]:
+        query_embedding = None
+        if self.embed_fn is not None and self.index.embeddings is not None:
+            query_embedding = np.asarray(self.embed_fn([question]), dtype=np.float32)[0]
+
+        results = []
+        for chunk_id, score in self.index.search(question, department_ids, k=k, tag_feas=tag_feas,
+                                                 exclude_tags=exclude_tags, query_embedding=query_embedding,
+                                                 vector_similarity_weight=self.vector_similarity_weight):
+            chunk = self.index.get_chunk(chunk_id)
+            results.append({
+                "content": chunk["content"],
+                "department_id": chunk["dataset_id"],
+                "department_name": self.get_department_name(chunk["dataset_id"]),
+                "document_id": chunk["document_id"],
+                "document_name": chunk["document_name"],
+                "similarity_score": score,
+            })
+        return results
+
+    def retrieve_guidelines(self, query: str, department_names: List[str], k: int = 30) -> List[Dict]:
+        """
+        Retrieve information based on a medical record.
+
+        Args:
+            query: Medical record content as query
+            department_names: List of department names to search in
+            k: Number of top results to retrieve
+
+        Returns:
+            List of dictionaries containing chunk information
+        """
+        department_ids = self.get_department_ids(department_names)
+
+        if not department_ids:
+            print("Error: No valid department IDs found.")
+            return []
+
+        return [{"idx": idx, **chunk_info} for idx, chunk_info in enumerate(self._search(query, department_ids, k))]
+
+    def retrieve_treament(self, disease_name: str, department_names: List[str], query_type: str = "治疗", k: int = 32) -> List[Dict]:
+        """
+        Retrieve information about a disease from specified departments.
+
+        Args:
+            disease_name: Name of the disease (e.g., "哮喘")
+            department_names: List of department names to search in
+            query_type: Type of information to retrieve (e.g., "治疗", "症状", "诊断")
+            k: Number of top results to retrieve
+
+        Returns:
+            List of dictionaries containing chunk information
+        """
+        department_ids = self.get_department_ids(department_names)
+
+        if not department_ids:
+            print("Error: No valid department IDs found.")
+            return []
+
+        return self._search(f"{disease_name}{query_type}", department_ids, k)
+
+    def retrieve_treament_with_metadata_filteration(self, disease_name: str, department_names: List[str], tag_feas: List[str], exclude_tags: List[str], k: int = 32) -> List[Dict]:
+        """
+        Retrieve information about a disease from specified departments with metadata filtering.
+
+        Chunks must carry at least one of tag_feas (when given) and none of exclude_tags.
+
+        Args:
+            disease_name: Name of the disease (e.g., "哮喘")
+            department_names: List of department names to search in
+            tag_feas: List of tags to include
+            exclude_tags: List of tags to exclude
+            k: Number of top results to retrieve
+        Returns:
+            List of dictionaries containing chunk information
+        """
+        department_ids = self.get_department_ids(department_names)
+        return self._search(disease_name, department_ids, k, tag_feas, exclude_tags)
+
+    def retrieve_many(self, queries: Iterable[Union[str, Tuple[str, str]]], department_names: List[str], k: int = 32, tag_feas: Optional[List[str]] = None, exclude_tags: Optional[List[str]] = None, **_ignored) -> List[Dict]:
+        """
+        Retrieve chunks for many queries, in input order. Concurrency options of the
+        remote retrievers are accepted and ignored: everything runs in-process.
+        """
+        department_ids = self.get_department_ids(department_names)
+        items = []
+        for index, query in enumerate(queries):
+            question = query if isinstance(query, str) else f"{query[0]}{query[1]}"
+            try:
+                results = self._search(question, department_ids, k, tag_feas, exclude_tags)
+                items.append({"index": index, "query": question, "results": results, "error": None})
+            except Exception as e:
+                items.append({"index": index, "query": question, "results": [], "error": f"{type(e).__name__}: {e}"})
+        return items
+
+
+def iter_ragflow_chunks(retriever: Any, datasets: Sequence[Dict[str, Any]], page_size: int = 1024) -> Iterator[Dict[str, Any]]:
+    """
+    Page through every chunk of the given datasets on the RAGFlow server.
+
+    Chunks are listed over the REST API (through the retriever's pooled session)
+    rather than ragflow_sdk, whose Chunk objects drop the tag fields.
+
+    Args:
+        retriever: treatment_guideline_retriever providing rag_object and session
+        datasets: Synced dataset dicts to export
+        page_size: Page size for document and chunk listing
+
+    Yields:
+        Chunk dicts with content, dataset_id, document_id, document_name and tags
+
+    Raises:
+        requests.HTTPError / RuntimeError: If RAGFlow answers with an error status or error code,
+            so a failed listing never produces an index silently missing chunks
+    """
+    base_url = os.getenv("RAGFLOW_BASE_URL")
+    headers = {'Authorization': f'Bearer {os.getenv("RAGFLOW_API_KEY")}'}
+
+    for dataset_dict in datasets:
+        dataset_id = dataset_dict["id"]
+        found = retriever.rag_object.list_datasets(id=dataset_id)
+        if not found:
+            print(f"Warning: dataset {dataset_id} not found, skipped.")
+            continue
+
+        document_page = 1
+        while True:
+            documents = found[0].list_documents(page=document_page, page_size=page_size)
+            for document in documents:
+                chunk_page = 1
+                while True:
+                    response = retriever.session.get(
+                        f"{base_url}/api/v1/datasets/{dataset_id}/documents/{document.id}/chunks",
+                        headers=headers,
+                        params={"page": chunk_page, "page_size": page_size},
+                        timeout=retriever.request_timeout,
+                    )
+                    response.raise_for_status()
+                    result = response.json()
+                    if result.get("code", 0) != 0:
+                        raise RuntimeError(f"RAGFlow error {result.get('code')} listing chunks of document "
+                                           f"{document.id}: {result.get('message')}")
+                    chunks = (result.get("data") or {}).get("chunks") or []
+                    for chunk in chunks:
+                        tags = list(chunk.get("tag_kwd") or []) + list((chunk.get("tag_feas") or {}).keys())
+                        yield {
+                            "content": chunk.get("content", ""),
+                            "dataset_id": dataset_id,
+                            "document_id": document.id,
+                            "document_name": document.name,
+                            "tags": tags,
+                        }
+                    if len(chunks) < page_size:
+                        break
+                    chunk_page += 1
+            if len(documents) < page_size:
+                break
+            document_page += 1
+
+
+def export_local_index(retriever: Any, index_dir: str, department_names: Optional[List[str]] = None,
+                       embed_fn: Optional[EmbedFn] = None) -> LocalGuidelineIndex:
+    """
+    Mirror synced RAGFlow datasets into a local index directory.
+
+    Args:
+        retriever: treatment_guideline_retriever whose synced datasets are exported
+        index_dir: Output directory
+        department_names: Departments to export (all synced datasets when omitted)
+        embed_fn: Optional embedding function for the dense matrix
+
+    Returns:
+        The built index
+    """
+    datasets = load_snapshot(retriever.json_path)
+    if department_names is not None:
+        wanted = set(department_names)
+        datasets = [d for d in datasets if d.get("name") in wanted]
+
+    return LocalGuidelineIndex.build(iter_ragflow_chunks(retriever, datasets), index_dir, datasets, embed_fn=embed_fn)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def dataset_version(dataset: Dict[str, Any]) -> str:
+    """Version string of a synced dataset dict; changes whenever its content changes on the server."""
+    return "{}:{}:{}".format(
+        dataset.get("chunk_count", ""),
+        dataset.get("document_count", ""),
+        dataset.get("update_time", ""),
+    )
+
+
+def _version_changed(old: str, new: str) -> bool:
+    """
+    Whether two dataset_version strings differ. A field that is empty on either
+    side (e.g. update_time in a snapshot written before it was synced) is not
+    compared, so filling it in does not count as a change.
+    """
+    old_fields, new_fields = old.split(":"), new.split(":")
+    if len(old_fields) != len(new_fields):
+        return True
+    return any(a and b and a != b for a, b in zip(old_fields, new_fields))
+
+
+class RetrievalCache:
+    """
+    Persistent SQLite cache of retrieval results.
+
+    Entries are keyed on a normalized (method, question, sorted dataset_ids,
+    tag_feas, exclude_tags, k) tuple and store the chunk_info lists returned by
+    the retriever. Each entry remembers which datasets it was computed from, so
+    when sync_datasets sees a dataset's version change (chunk_count,
+    document_count or update_time) only the entries touching that dataset are
+    dropped.
+    """
+
+    def __init__(self, path: str = "./retrieval_cache.sqlite3"):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entry_datasets ("
+                " key TEXT NOT NULL, dataset_id TEXT NOT NULL, PRIMARY KEY (dataset_id, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entry_datasets_key ON entry_datasets (key)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dataset_versions ("
+                " dataset_id TEXT PRIMARY KEY, version TEXT NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(method: str, question: str, dataset_ids: Iterable[str], k: int,
+                 tag_feas: Optional[Iterable[str]] = None, exclude_tags: Optional[Iterable[str]] = None) -> str:
+        """
+        Build the cache key of a retrieval request.
+
+        Args:
+            method: Name of the retrieval method (different methods use different server defaults)
+            question: Query text sent to RAGFlow
+            dataset_ids: Dataset IDs searched
+            k: Number of top results requested
+            tag_feas: Tags to include
+            exclude_tags: Tags to exclude
+
+        Returns:
+            Hex digest identifying the request
+        """
+        normalized = [
+            method,
+            question.strip(),
+            sorted(set(dataset_ids)),
+            sorted(set(tag_feas or [])),
+            sorted(set(exclude_tags or [])),
+            int(k),
+        ]
+        raw = json.dumps(normalized, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, dataset_ids: Iterable[str], results: List[Dict]) -> None:
+        payload = json.dumps(results, ensure_ascii=False, separators=(",", ":"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, payload, created_at) VALUES (?, ?, ?)",
+                (key, payload, time.time()),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO entry_datasets (key, dataset_id) VALUES (?, ?)",
+                [(key, dataset_id) for dataset_id in set(dataset_ids)],
+            )
+
+    def update_dataset_versions(self, datasets: Iterable[Dict[str, Any]], removed: Iterable[str] = ()) -> List[str]:
+        """
+        Record the current version of each given dataset and drop the entries of changed ones.
+
+        Only the given datasets are upserted: several retrievers may share one
+        cache file while syncing different dataset lists, so a dataset missing
+        from `datasets` is left alone unless a full sync reported it in `removed`.
+
+        Args:
+            datasets: Dataset dicts as written by sync_datasets
+            removed: IDs of datasets a full sync found deleted on the server
+
+        Returns:
+            IDs of the datasets whose version changed or that were removed
+        """
+        versions = {d["id"]: dataset_version(d) for d in datasets if d.get("id")}
+        removed = [dataset_id for dataset_id in removed if dataset_id not in versions]
+        changed = []
+        with self._lock, self._conn:
+            known = dict(self._conn.execute("SELECT dataset_id, version FROM dataset_versions"))
+            for dataset_id, version in versions.items():
+                if dataset_id not in known:
+                    # Never versioned before: any entry for it predates this cache's bookkeeping
+                    self._delete_dataset_entries(dataset_id)
+                elif _version_changed(known[dataset_id], version):
+                    changed.append(dataset_id)
+            changed.extend(dataset_id for dataset_id in removed if dataset_id in known)
+
+            for dataset_id in changed:
+                self._delete_dataset_entries(dataset_id)
+            self._conn.executemany("DELETE FROM dataset_versions WHERE dataset_id = ?",
+                                   [(dataset_id,) for dataset_id in removed])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO dataset_versions (dataset_id, version) VALUES (?, ?)",
+                list(versions.items()),
+            )
+        return changed
+
+    def invalidate_dataset(self, dataset_id: str) -> None:
+        with self._lock, self._conn:
+            self._delete_dataset_entries(dataset_id)
+
+    def _delete_dataset_entries(self, dataset_id: str) -> None:
+        keys = [(key,) for (key,) in self._conn.execute(
+            "SELECT key FROM entry_datasets WHERE dataset_id = ?", (dataset_id,)
+        )]
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+        self._conn.executemany("DELETE FROM entry_datasets WHERE key = ?", keys)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM entry_datasets")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
@@ -24,4 +24,8 @@ retriever = treatment_guideline_retriever()
 retriever.sync_datasets()
 
 retrieved_result = retriever.retrieve_guidelines(query="哮喘诊断", department_names=['呼吸科'])
-print(retrieved_result)
\ No newline at end of file
+print(retrieved_result)
+
+# bulk version: one call for many cases, fanned out with bounded concurrency
+retrieved_many = retriever.retrieve_many([case['message'] for case in data], department_names=['呼吸科'], concurrency=8)
+print([(item['index'], item['error'], len(item['results'])) for item in retrieved_many])
\ No newline at end of file
@@ -1,19 +1,37 @@
-from ragflow_sdk import RAGFlow
-
 import os
-from dotenv import load_dotenv
+import math
+import threading
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
+
+from dataset_sync import BackgroundSync, SyncResult, load_snapshot, sync_dataset_list, write_snapshot
+from department_registry import DepartmentRecord, DepartmentRegistry
+from document_resolver import DocumentMetadataResolver
+from single_flight import SingleFlight, request_key
 
-load_dotenv()
+# ragflow_sdk, requests, dotenv, sqlite3 and concurrent.futures are imported on first use, so that
+# short-lived workers that only need the department mapping start fast.
+_env_loaded = False
 
-import json
-from typing import Any, List, Dict, Optional
 
-import requests
+def _load_env() -> None:
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 class treatment_guideline_retriever:
     """A module for interacting with RAGFlow API for medical department data retrieval."""
     
-    def __init__(self):
+    # Same defaults the ragflow_sdk applies in RAGFlow.retrieve
+    RETRIEVAL_DEFAULTS = {
+        "similarity_threshold": 0.2,
+        "vector_similarity_weight": 0.3,
+        "top_k": 1024,
+    }
+
+    def __init__(self, document_resolver: Optional[DocumentMetadataResolver] = None, pool_maxsize: int = 32, request_timeout: Optional[float] = 60.0, cache_path: Optional[str] = None):
         """
         Initialize the RAGFlow module.
         
@@ -21,71 +39,167 @@ class treatment_guideline_retriever:
             api_key: RAGFlow API key
             base_url: RAGFlow base URL
             json_path: Path to the datasets JSON file
+            document_resolver: Shared document name resolver (a new one is created if omitted)
+            pool_maxsize: Maximum number of keep-alive connections kept for REST calls
+            request_timeout: Timeout in seconds for REST calls (None waits forever)
+            cache_path: SQLite file for the persistent retrieval result cache
+                        (defaults to $RETRIEVAL_CACHE_PATH; caching is off when neither is set)
         """
-        self.rag_object = RAGFlow(api_key=os.getenv("RAGFLOW_API_KEY"),                     
-                                  base_url=os.getenv("RAGFLOW_BASE_URL")
-                                  )
+        _load_env()
+
+        # The RAGFlow client and the HTTP session are built on first use
+        self._rag_object = None
+        self._session = None
+        self._client_lock = threading.Lock()
+        self.pool_maxsize = pool_maxsize
+        self.request_timeout = request_timeout
+        self.document_resolver = document_resolver or DocumentMetadataResolver(lambda: self.rag_object)
+
+        cache_path = cache_path or os.getenv("RETRIEVAL_CACHE_PATH")
+        self.cache = None
+        if cache_path:
+            from retrieval_cache import RetrievalCache
+            self.cache = RetrievalCache(cache_path)
+
+        # Identical retrievals in flight at the same time share one upstream call
+        self.flights = SingleFlight()
+
         self.json_path = "./scripts/distill/departments_full_list.jsonl" 
-        self.department_mapping = self._load_department_mapping()
+        self.registry = DepartmentRegistry()
+        self._synced_datasets: List[Dict] = []
+        self._background_sync: Optional[BackgroundSync] = None
+        self._sync_lock = threading.Lock()
+        self._load_department_mapping()
+
+    @property
+    def rag_object(self) -> Any:
+        """ragflow_sdk RAGFlow client, created on first access."""
+        if self._rag_object is None:
+            with self._client_lock:
+                if self._rag_object is None:
+                    from ragflow_sdk import RAGFlow
+                    self._rag_object = RAGFlow(api_key=os.getenv("RAGFLOW_API_KEY"),
+                                               base_url=os.getenv("RAGFLOW_BASE_URL")
+                                               )
+        return self._rag_object
+
+    @property
+    def session(self) -> Any:
+        """Pooled keep-alive requests.Session for direct REST calls, created on first access."""
+        if self._session is None:
+            with self._client_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def department_mapping(self) -> Dict[str, str]:
+        """Read-only department name to ID mapping of the current registry snapshot."""
+        return self.registry.snapshot.name_to_id
     
-    def _dataset_to_dict(self, dataset: Any) -> dict:
-        """Convert a ragflow dataset object to a plain dict for JSON serialization."""
-        result = {}
-        for attr in dir(dataset):
-            if attr.startswith("_"):
-                continue
-            try:
-                val = getattr(dataset, attr)
-            except Exception:
-                continue
-            if callable(val):
-                continue
-            result[attr] = val
-
-        # Remove avatar if present (can be a very large base64 string)
-        if "avatar" in result:
-            try:
-                del result["avatar"]
-            except Exception:
-                result.pop("avatar", None)
+    def _list_datasets_page(self, page: int, page_size: int) -> List[Dict[str, Any]]:
+        """
+        Fetch one page of raw dataset records, most recently updated first.
+        
+        Raises:
+            RuntimeError: If RAGFlow answers with an error status or error code
+        """
+        base_url = os.getenv("RAGFLOW_BASE_URL")
+        api_key = os.getenv("RAGFLOW_API_KEY")
 
-        return result
+        response = self.session.get(
+            f"{base_url}/api/v1/datasets",
+            headers={'Authorization': f'Bearer {api_key}'},
+            params={"page": page, "page_size": page_size, "orderby": "update_time", "desc": "true"},
+            timeout=self.request_timeout,
+        )
 
-    def sync_datasets(self) -> None:
+        if response.status_code != 200:
+            raise RuntimeError(f"Received status code {response.status_code}")
+
+        result = response.json()
+        if result.get("code", 0) != 0:
+            raise RuntimeError(f"RAGFlow error {result.get('code')}: {result.get('message')}")
+
+        return result.get("data") or []
+
+    def sync_datasets(self, incremental: bool = True) -> SyncResult:
         """
-        Fetch list of dataset objects from the RAGflow server side 
-        and write each dataset as a JSON object in an array.
-        This should be called periodically to update the department mapping.
+        Fetch the dataset list from the RAGflow server side and update the department mapping.
+        This should be called periodically (or through start_background_sync).
+        
+        Datasets are listed newest update first; in incremental mode listing stops
+        once it reaches datasets already in the last snapshot, and only changed
+        datasets invalidate cached document names and retrieval results. Records
+        are serialized with an explicit field list into a compact JSON array.
+        
+        Args:
+            incremental: Whether to stop listing at the last known update (a full
+                         listing is also needed to notice removed datasets)
+        
+        Returns:
+            SyncResult with the ids of changed and removed datasets
         """
-        full_list = []
-        for dataset in self.rag_object.list_datasets():
-            full_list.append(self._dataset_to_dict(dataset))
+        with self._sync_lock:
+            result = sync_dataset_list(self._synced_datasets, self._list_datasets_page, incremental=incremental)
+            if not result.has_changes:
+                return result
+
+            # Written through a temporary file so readers never see a half-written file
+            write_snapshot(self.json_path, result.datasets)
+            self._synced_datasets = result.datasets
 
-        with open(self.json_path, "w", encoding="utf-8") as jf:
-            json.dump(full_list, jf, default=str, ensure_ascii=False, indent=2)
+            # Publish the new mapping; in-flight retrievals keep using the previous snapshot
+            self.registry.publish(result.datasets)
+            self._update_cache_versions(result.datasets, result.removed)
+            for dataset_id in result.changed + result.removed:
+                self.document_resolver.invalidate_dataset(dataset_id)
+
+            return result
+
+    def start_background_sync(self, interval: float = 300.0, full_every: Optional[int] = 12) -> BackgroundSync:
+        """
+        Run sync_datasets on a daemon thread every `interval` seconds.
         
-        # Reload the mapping after saving
-        self.department_mapping = self._load_department_mapping()
+        Args:
+            interval: Seconds between two syncs
+            full_every: Make every N-th sync a full one (to notice removed datasets)
+        
+        Returns:
+            The running background thread
+        """
+        self.stop_background_sync()
+        self._background_sync = BackgroundSync(self.sync_datasets, interval=interval, full_every=full_every)
+        self._background_sync.start()
+        return self._background_sync
+
+    def stop_background_sync(self) -> None:
+        """Stop the background sync thread started by start_background_sync, if any."""
+        if self._background_sync is not None:
+            self._background_sync.stop()
+            self._background_sync = None
 
     def _load_department_mapping(self) -> Dict[str, str]:
         """
-        Load department name to ID mapping from JSON file.
+        Load department name to ID mapping from JSON file and publish it to the registry.
         
         Returns:
             Dictionary mapping department names to their IDs
         """
         try:
-            with open(self.json_path, "r", encoding="utf-8") as jf:
-                datasets = json.load(jf)
+            # Served from the precompiled sidecar when it is up to date with the JSON file
+            datasets = load_snapshot(self.json_path)
             
-            mapping = {}
-            for dataset in datasets:
-                name = dataset.get("name", "")
-                dataset_id = dataset.get("id", "")
-                if name and dataset_id:
-                    mapping[name] = dataset_id
-            
-            return mapping
+            self._synced_datasets = datasets
+            self._update_cache_versions(datasets)
+            return self.registry.publish(datasets).name_to_id
 
         except FileNotFoundError:
             print(f"Warning: JSON file {self.json_path} not found. Please call sync_datasets() first.")
@@ -104,11 +218,12 @@ class treatment_guideline_retriever:
         Returns:
             List of department IDs
         """
+        snapshot = self.registry.snapshot
         department_ids = []
         missing_departments = []
         
         for dept_name in department_names:
-            dept_id = self.department_mapping.get(dept_name)
+            dept_id = snapshot.get_id(dept_name)
             if dept_id:
                 department_ids.append(dept_id)
             else:
@@ -116,7 +231,7 @@ class treatment_guideline_retriever:
         
         if missing_departments:
             print(f"Warning: The following departments were not found: {missing_departments}")
-            print(f"Available departments: {list(self.department_mapping.keys())}")
+            print(f"Available departments: {snapshot.names()}")
         
         return department_ids
 
@@ -130,10 +245,43 @@ class treatment_guideline_retriever:
         Returns:
             Department name or None if not found
         """
-        for name, dept_id in self.department_mapping.items():
-            if dept_id == department_id:
-                return name
-        return None
+        return self.registry.get_name(department_id)
+
+    def get_department_record(self, department_id: str) -> Optional[DepartmentRecord]:
+        """
+        Get synced metadata (name, chunk_count, document_count, embedding_model) for a department ID.
+        
+        Args:
+            department_id: Department ID
+        
+        Returns:
+            Department record or None if not found
+        """
+        return self.registry.get_record(department_id)
+
+    def _update_cache_versions(self, datasets: List[Dict], removed: Iterable[str] = ()) -> None:
+        """Drop cached retrieval results of datasets whose chunk_count / document_count / update_time changed, or that were removed."""
+        if self.cache is not None:
+            changed = self.cache.update_dataset_versions(datasets, removed)
+            if changed:
+                print(f"Invalidated cached retrievals of {len(changed)} changed datasets.")
+
+    def _cache_key(self, method: str, question: str, department_ids: List[str], k: int, tag_feas: Optional[List[str]] = None, exclude_tags: Optional[List[str]] = None) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(method, question, department_ids, k, tag_feas, exclude_tags)
+
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[List[Dict]]:
+        return self.cache.get(cache_key) if cache_key is not None else None
+
+    def _cache_set(self, cache_key: Optional[str], department_ids: List[str], results: List[Dict]) -> None:
+        if cache_key is not None:
+            self.cache.set(cache_key, department_ids, results)
+
+    def _coalesced(self, key: Tuple, fetch: Callable[[], List[Dict]]) -> List[Dict]:
+        """Run fetch through the single-flight group; threads that joined another thread's call get their own copy."""
+        results, joined = self.flights.do(key, fetch)
+        return [dict(chunk_info) for chunk_info in results] if joined else results
 
     def retrieve_guidelines(self, query: str, department_names: List[str]) -> List[Dict]:
         """
@@ -152,31 +300,42 @@ class treatment_guideline_retriever:
             print("Error: No valid department IDs found.")
             return []
         
-        retrieve_chunks = self.rag_object.retrieve(question=query, 
-                                                   dataset_ids=department_ids, 
-                                                   )
-
-        results = []
-        for idx, chunk in enumerate(retrieve_chunks):
-
-            _dataset_name = self.get_department_name(chunk.dataset_id)
-
-            _dataset = self.rag_object.list_datasets(id=chunk.dataset_id)
-            _document = _dataset[0].list_documents(id=chunk.document_id)
-            _document_name = _document[0].name if _document else " "
-
-            chunk_info = {
-                "idx": idx,
-                "content": chunk.content,
-                "department_id": chunk.dataset_id,
-                "department_name": _dataset_name,
-                "document_id": chunk.document_id,
-                "document_name": _document_name,
-                "similarity_score": chunk.similarity
-            }
-            results.append(chunk_info)
+        # ragflow_sdk retrieves 30 chunks when page_size is not given
+        cache_key = self._cache_key("retrieve_guidelines", query, department_ids, 30)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        def _fetch() -> List[Dict]:
+            retrieve_chunks = self.rag_object.retrieve(question=query, 
+                                                       dataset_ids=department_ids, 
+                                                       )
+
+            document_names = self.document_resolver.resolve(
+                (chunk.dataset_id, chunk.document_id) for chunk in retrieve_chunks
+            )
+
+            results = []
+            for idx, chunk in enumerate(retrieve_chunks):
+
+                _dataset_name = self.get_department_name(chunk.dataset_id)
+                _document_name = document_names[(chunk.dataset_id, chunk.document_id)]
+
+                chunk_info = {
+                    "idx": idx,
+                    "content": chunk.content,
+                    "department_id": chunk.dataset_id,
+                    "department_name": _dataset_name,
+                    "document_id": chunk.document_id,
+                    "document_name": _document_name,
+                    "similarity_score": chunk.similarity
+                }
+                results.append(chunk_info)
         
-        return results
+            self._cache_set(cache_key, department_ids, results)
+            return results
+
+        return self._coalesced(request_key("retrieve_guidelines", query, department_ids, 30), _fetch)
 
     def retrieve_treament(self, disease_name: str, department_names: List[str]  , query_type: str = "治疗", k: int = 32) -> List[Dict]:
         """
@@ -198,28 +357,38 @@ class treatment_guideline_retriever:
         
         query = f"{disease_name}{query_type}"
 
-        retrieve_chunks = self.rag_object.retrieve(question=query, dataset_ids=department_ids, page_size=k)
-
-        results = []
-        for idx, chunk in enumerate(retrieve_chunks):
-
-            _dataset_name = self.get_department_name(chunk.dataset_id)
-
-            _dataset = self.rag_object.list_datasets(id=chunk.dataset_id)
-            _document = _dataset[0].list_documents(id=chunk.document_id)
-            _document_name = _document[0].name if _document else " "
-
-            chunk_info = {
-                "content": chunk.content,
-                "department_id": chunk.dataset_id,
-                "department_name": _dataset_name,
-                "document_id": chunk.document_id,
-                "document_name": _document_name,
-                "similarity_score": chunk.similarity
-            }
-            results.append(chunk_info)
+        cache_key = self._cache_key("retrieve_treament", query, department_ids, k)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        def _fetch() -> List[Dict]:
+            retrieve_chunks = self.rag_object.retrieve(question=query, dataset_ids=department_ids, page_size=k)
+
+            document_names = self.document_resolver.resolve(
+                (chunk.dataset_id, chunk.document_id) for chunk in retrieve_chunks
+            )
+
+            results = []
+            for idx, chunk in enumerate(retrieve_chunks):
+
+                _dataset_name = self.get_department_name(chunk.dataset_id)
+                _document_name = document_names[(chunk.dataset_id, chunk.document_id)]
+
+                chunk_info = {
+                    "content": chunk.content,
+                    "department_id": chunk.dataset_id,
+                    "department_name": _dataset_name,
+                    "document_id": chunk.document_id,
+                    "document_name": _document_name,
+                    "similarity_score": chunk.similarity
+                }
+                results.append(chunk_info)
         
-        return results
+            self._cache_set(cache_key, department_ids, results)
+            return results
+
+        return self._coalesced(request_key("retrieve_treament", query, department_ids, k), _fetch)
 
     def retrieve_treament_with_metadata_filteration(self, disease_name: str, department_names: List[str], tag_feas: List[str], exclude_tags: List[str], k: int = 32) -> List[Dict]:
         """
@@ -237,15 +406,6 @@ class treatment_guideline_retriever:
 
         department_ids = self.get_department_ids(department_names)
 
-        base_url = os.getenv("RAGFLOW_BASE_URL")
-        url = f"{base_url}/api/v1/retrieval"
-        api_key = os.getenv("RAGFLOW_API_KEY")
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {api_key}',
-        }
-
         data = {
             "question": disease_name,
             "dataset_ids": department_ids,
@@ -254,36 +414,231 @@ class treatment_guideline_retriever:
             "page_size": k,
         }
 
-        try:
-            response = requests.post(url, headers=headers, json=data)
+        cache_key = self._cache_key("retrieve_treament_with_metadata_filteration", disease_name, department_ids, k, tag_feas, exclude_tags)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
-            if response.status_code == 200:
-                retrieved_result = response.json()
+        def _fetch() -> List[Dict]:
+            results = [self._to_chunk_info(chunk) for chunk in self._post_retrieval(data)]
+            self._cache_set(cache_key, department_ids, results)
+            return results
 
-            else:
-                print(f"Error: Received status code {response.status_code}")
-                retrieved_result = {}
+        try:
+            return self._coalesced(request_key("retrieve_treament_with_metadata_filteration", disease_name, department_ids, k, tag_feas, exclude_tags), _fetch)
+
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return []
 
         except Exception as e:
             print(f"Exception occurred: {e}")
-            retrieved_result = {}
+            return []
+
+    def _post_retrieval(self, data: Dict[str, Any], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        POST a payload to /api/v1/retrieval through the pooled session.
+        
+        Args:
+            data: Retrieval request body
+            timeout: Per-request timeout in seconds (defaults to self.request_timeout)
+        
+        Returns:
+            List of raw chunk dicts
+        
+        Raises:
+            RuntimeError: If RAGFlow answers with an error status or error code
+        """
+        base_url = os.getenv("RAGFLOW_BASE_URL")
+        url = f"{base_url}/api/v1/retrieval"
+        api_key = os.getenv("RAGFLOW_API_KEY")
+
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {api_key}',
+        }
+
+        response = self.session.post(url, headers=headers, json=data, timeout=timeout or self.request_timeout)
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Received status code {response.status_code}")
+
+        retrieved_result = response.json()
+        if retrieved_result.get("code", 0) != 0:
+            raise RuntimeError(f"RAGFlow error {retrieved_result.get('code')}: {retrieved_result.get('message')}")
+
+        return (retrieved_result.get('data') or {}).get('chunks', [])
+
+    def _to_chunk_info(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a raw REST chunk dict to the chunk_info format returned by the retrieve methods."""
+        self.document_resolver.prime(chunk["dataset_id"], chunk["document_id"], chunk["document_keyword"])
+
+        return {
+            "content": chunk["content"],
+            "department_id": chunk["dataset_id"],
+            "department_name": self.get_department_name(chunk["dataset_id"]),
+            "document_id": chunk["document_id"],
+            "document_name": chunk["document_keyword"],
+            "similarity_score": chunk["similarity"],
+        }
+
+    def retrieve_many(self, queries: Iterable[Union[str, Tuple[str, str]]], department_names: List[str], k: int = 32, tag_feas: Optional[List[str]] = None, exclude_tags: Optional[List[str]] = None, concurrency: int = 8, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Retrieve chunks for many queries concurrently and return the results in input order.
+        
+        Args:
+            queries: Queries as plain strings or (disease_name, query_type) pairs
+            department_names: List of department names to search in
+            k: Number of top results to retrieve per query
+            tag_feas: Optional list of tags to include
+            exclude_tags: Optional list of tags to exclude
+            concurrency: Maximum number of retrievals in flight
+            timeout: Per-request timeout in seconds (defaults to self.request_timeout)
+        
+        Returns:
+            One dictionary per query, see iter_retrieve_many
+        """
+        return list(self.iter_retrieve_many(queries, department_names, k=k, tag_feas=tag_feas,
+                                            exclude_tags=exclude_tags, concurrency=concurrency, timeout=timeout))
+
+    def iter_retrieve_many(self, queries: Iterable[Union[str, Tuple[str, str]]], department_names: List[str], k: int = 32, tag_feas: Optional[List[str]] = None, exclude_tags: Optional[List[str]] = None, concurrency: int = 8, timeout: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Generator version of retrieve_many.
+        
+        Queries are consumed lazily and fanned out over a thread pool; at most
+        2 * concurrency of them are buffered, and results are yielded in input
+        order as soon as the head of the queue is done. A failing query does
+        not raise: its item carries the error message instead.
+        
+        Yields:
+            {"index": int, "query": str, "results": List[Dict], "error": Optional[str]}
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        department_ids = self.get_department_ids(department_names)
 
-        result = []
-        for idx, chunk in enumerate(retrieved_result.get('data', {}).get('chunks', [])):
+        def _retrieve_one(question: str) -> List[Dict]:
+            if not department_ids:
+                raise RuntimeError("No valid department IDs found.")
 
-            _dataset_name = self.get_department_name(chunk["dataset_id"])
+            # Numbered with "idx", unlike treatment_RAG's retrieve_many, so the two never share a cache entry
+            cache_key = self._cache_key("retrieve_many_idx", question, department_ids, k, tag_feas, exclude_tags)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
 
-            chunk_info = {
-                "content": chunk["content"],
-                "department_id": chunk["dataset_id"],
-                "department_name": _dataset_name,
-                "document_id": chunk["document_id"],
-                "document_name": chunk["document_keyword"],
-                "similarity_score": chunk["similarity"],
+            data = {
+                "question": question,
+                "dataset_ids": department_ids,
+                "page_size": k,
             }
-            result.append(chunk_info)
+            if tag_feas:
+                data["tag_feas"] = tag_feas
+            if exclude_tags:
+                data["exclude_tags"] = exclude_tags
 
-        return result
+            def _fetch() -> List[Dict]:
+                results = [{"idx": idx, **self._to_chunk_info(chunk)} for idx, chunk in enumerate(self._post_retrieval(data, timeout=timeout))]
+                self._cache_set(cache_key, department_ids, results)
+                return results
+
+            return self._coalesced(request_key("retrieve_many_idx", question, department_ids, k, tag_feas, exclude_tags), _fetch)
+
+        def _collect(index: int, question: str, future) -> Dict:
+            try:
+                return {"index": index, "query": question, "results": future.result(), "error": None}
+            except Exception as e:
+                return {"index": index, "query": question, "results": [], "error": f"{type(e).__name__}: {e}"}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = deque()
+            for index, query in enumerate(queries):
+                question = query if isinstance(query, str) else f"{query[0]}{query[1]}"
+                pending.append((index, question, executor.submit(_retrieve_one, question)))
+                if len(pending) >= 2 * concurrency:
+                    yield _collect(*pending.popleft())
+
+            while pending:
+                yield _collect(*pending.popleft())
+
+    def iter_retrieve(self, disease_name: str, department_names: List[str], query_type: str = "治疗", k: int = 1024, page_size: int = 64, max_workers: int = 4, similarity_floor: Optional[float] = None, timeout: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Stream retrieve_treament results page by page instead of building the whole list.
+        
+        Pages are requested from /api/v1/retrieval with page / page_size, up to
+        max_workers of them in flight ahead of the consumer, and chunks are
+        yielded in rank order as soon as their page arrives. Document names come
+        with the REST response, so no per-chunk lookups are made.
+        
+        Args:
+            disease_name: Name of the disease (e.g., "哮喘")
+            department_names: List of department names to search in
+            query_type: Type of information to retrieve (e.g., "治疗", "症状", "诊断")
+            k: Maximum number of chunks to yield (RAGFlow caps retrieval at 1024)
+            page_size: Number of chunks per page request
+            max_workers: Number of pages fetched in parallel
+            similarity_floor: Stop as soon as a chunk scores below this similarity
+            timeout: Per-page request timeout in seconds (defaults to self.request_timeout)
+        
+        Yields:
+            Dictionaries containing chunk information, best first
+        """
+        department_ids = self.get_department_ids(department_names)
+        
+        if not department_ids:
+            print("Error: No valid department IDs found.")
+            return
+        
+        data = {
+            "question": f"{disease_name}{query_type}",
+            "dataset_ids": department_ids,
+            "page_size": page_size,
+            **self.RETRIEVAL_DEFAULTS,
+        }
+        num_pages = math.ceil(k / page_size)
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        def _fetch(page: int) -> List[Dict[str, Any]]:
+            return self._post_retrieval({**data, "page": page}, timeout=timeout)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {}
+        next_page = 1
+        yielded = 0
+        try:
+            while next_page <= min(max_workers, num_pages):
+                futures[next_page] = executor.submit(_fetch, next_page)
+                next_page += 1
+
+            for page in range(1, num_pages + 1):
+                try:
+                    chunks = futures.pop(page).result()
+                except Exception as e:
+                    print(f"Exception occurred while fetching page {page}: {e}")
+                    return
+
+                if next_page <= num_pages:
+                    futures[next_page] = executor.submit(_fetch, next_page)
+                    next_page += 1
+
+                for chunk in chunks:
+                    if similarity_floor is not None and chunk["similarity"] < similarity_floor:
+                        return
+                    yield self._to_chunk_info(chunk)
+                    yielded += 1
+                    if yielded >= k:
+                        return
+
+                # A short page means the result list is exhausted
+                if len(chunks) < page_size:
+                    return
+
+        finally:
+            # Early stop: drop the pages nobody will read
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def get_available_departments(self) -> List[str]:
         """
@@ -292,4 +647,4 @@ class treatment_guideline_retriever:
         Returns:
             List of available department names
         """
-        return list(self.department_mapping.keys())
\ No newline at end of file
+        return self.registry.names()
\ No newline at end of file
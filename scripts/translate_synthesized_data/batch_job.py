@@ -0,0 +1,371 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from openai import OpenAI
+from openai.types import Batch
+from tqdm import tqdm
+
+from compact_output import compact_result
+from translation_engine import (MODEL, append_batch, build_messages, get_client, iter_jsonl, parse_translation,
+                                prepare_resume, temp_path)
+
+# -----------------------------------------------------------------------------
+# Bulk translation through the OpenAI Batch API (half price, own rate limits,
+# results within 24h).
+#
+# The records are turned into chat.completions request lines with the same
+# prompt as translation_engine.build_messages, split into jobs of at most
+# MAX_REQUESTS_PER_JOB lines / MAX_JOB_BYTES bytes, uploaded and submitted.
+# The job ids are saved in <output>.batch.json (after every submission, so a
+# failure part way through never loses a billed job), so the command can be
+# stopped while the jobs run and started again later with the same arguments:
+# it then submits only the jobs not submitted yet, polls and downloads.
+# Results are mapped back to record ids and appended to OUTPUT in the usual
+# {"id", "translated_flag", "translated", "message"} format; once every job is
+# downloaded the state file and the <output>.batch/ request files are removed,
+# and a new run submits only the ids that are missing or failed (see
+# translation_engine.prepare_resume).
+#
+# LocalBatchBackend is a file-based stand-in of the API for offline tests.
+#
+# usage:
+#   python batch_job.py INPUT OUTPUT [--start 0 --end 9999] [--backend local]
+# -----------------------------------------------------------------------------
+
+ENDPOINT = "/v1/chat/completions"
+MAX_REQUESTS_PER_JOB = 50000
+MAX_JOB_BYTES = 190 * 1024 ** 2
+POLL_INTERVAL = 60
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAIBatchBackend:
+    """Files and batches endpoints of an OpenAI(-compatible) client."""
+
+    def __init__(self, client: Optional[OpenAI] = None):
+        self.client = client or get_client()
+
+    def upload(self, path: str) -> str:
+        with open(path, "rb") as f:
+            return self.client.files.create(file=f, purpose="batch").id
+
+    def create(self, input_file_id: str, metadata: Optional[Dict[str, str]] = None) -> Batch:
+        return self.client.batches.create(input_file_id=input_file_id, endpoint=ENDPOINT,
+                                          completion_window="24h", metadata=metadata)
+
+    def retrieve(self, batch_id: str) -> Batch:
+        return self.client.batches.retrieve(batch_id)
+
+    def download(self, file_id: str) -> str:
+        return self.client.files.content(file_id).text
+
+
+def echo_response(body: Dict[str, Any]) -> str:
+    """Default answer of LocalBatchBackend: the JSON object of the prompt, unchanged."""
+    prompt = body["messages"][-1]["content"]
+    return prompt.split("JSON:", 1)[-1].strip()
+
+
+class LocalBatchBackend:
+    """
+    Offline stand-in of the Batch API keeping files and jobs in a directory.
+
+    A job is answered when it is first polled after `polls_until_done` polls;
+    every request line goes to `respond(body) -> answer text` (by default the
+    record of the prompt is echoed back, a callable raising marks that line as
+    failed in the error file, like the API does).
+    """
+
+    def __init__(self, root: str, respond: Callable[[Dict[str, Any]], str] = echo_response,
+                 polls_until_done: int = 1):
+        self.root = root
+        self.respond = respond
+        self.polls_until_done = polls_until_done
+        os.makedirs(os.path.join(root, "files"), exist_ok=True)
+        os.makedirs(os.path.join(root, "batches"), exist_ok=True)
+
+    def _file_path(self, file_id: str) -> str:
+        return os.path.join(self.root, "files", file_id)
+
+    def _batch_path(self, batch_id: str) -> str:
+        return os.path.join(self.root, "batches", f"{batch_id}.json")
+
+    def _write_file(self, lines: List[str]) -> str:
+        file_id = f"file-{uuid.uuid4().hex}"
+        with open(self._file_path(file_id), "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        return file_id
+
+    def _save(self, batch: Dict[str, Any]) -> Batch:
+        with open(self._batch_path(batch["id"]), "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+        return Batch.model_validate(batch)
+
+    def upload(self, path: str) -> str:
+        with open(path, "r", encoding="utf-8") as f:
+            return self._write_file(f.readlines())
+
+    def create(self, input_file_id: str, metadata: Optional[Dict[str, str]] = None) -> Batch:
+        return self._save({
+            "id": f"batch_{uuid.uuid4().hex}", "object": "batch", "endpoint": ENDPOINT,
+            "completion_window": "24h", "created_at": int(time.time()), "input_file_id": input_file_id,
+            "status": "validating", "metadata": metadata, "polls": 0,
+        })
+
+    def retrieve(self, batch_id: str) -> Batch:
+        with open(self._batch_path(batch_id), "r", encoding="utf-8") as f:
+            batch = json.load(f)
+        if batch["status"] in TERMINAL_STATUSES:
+            return Batch.model_validate(batch)
+        batch["polls"] += 1
+        if batch["polls"] <= self.polls_until_done:
+            batch["status"] = "in_progress"
+            return self._save(batch)
+
+        outputs, errors = [], []
+        with open(self._file_path(batch["input_file_id"]), "r", encoding="utf-8") as f:
+            for line in f:
+                request = json.loads(line)
+                body = request["body"]
+                try:
+                    content = self.respond(body)
+                except Exception as e:
+                    errors.append(json.dumps({
+                        "id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"], "response": None,
+                        "error": {"code": type(e).__name__, "message": str(e)},
+                    }) + "\n")
+                    continue
+                completion = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                }
+                outputs.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": completion},
+                    "error": None,
+                }, ensure_ascii=False) + "\n")
+
+        batch.update({
+            "status": "completed",
+            "completed_at": int(time.time()),
+            "output_file_id": self._write_file(outputs),
+            "error_file_id": self._write_file(errors) if errors else None,
+            "request_counts": {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)},
+        })
+        return self._save(batch)
+
+    def download(self, file_id: str) -> str:
+        with open(self._file_path(file_id), "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def build_request_line(custom_id: str, obj: Dict[str, Any], model: str = MODEL) -> str:
+    """One Batch API request: the chat.completions call translate_json_object would make."""
+    return json.dumps({
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {"model": model, "messages": build_messages(obj), "temperature": 0},
+    }, ensure_ascii=False) + "\n"
+
+
+def write_job_files(records: Iterable[Dict[str, Any]], job_dir: str, model: str = MODEL,
+                    max_requests: int = MAX_REQUESTS_PER_JOB, max_bytes: int = MAX_JOB_BYTES) -> List[Dict[str, Any]]:
+    """
+    Write the request files of the jobs, splitting at max_requests lines or max_bytes.
+
+    Returns:
+        One entry per job: {"request_file", "offset", "ids"}; the custom_id of a line is
+        offset + its position in "ids" (so records without an id or with repeated ids are fine)
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    jobs = []
+    f, size = None, 0
+    try:
+        for position, obj in enumerate(records):
+            line = build_request_line(str(position), obj, model)
+            line_bytes = len(line.encode("utf-8"))
+            if f is not None and (len(jobs[-1]["ids"]) >= max_requests or size + line_bytes > max_bytes):
+                f.close()
+                f = None
+            if f is None:
+                path = os.path.join(job_dir, f"requests-{len(jobs):04d}.jsonl")
+                jobs.append({"request_file": path, "offset": position, "ids": []})
+                f = open(path, "w", encoding="utf-8")
+                size = 0
+            f.write(line)
+            jobs[-1]["ids"].append(obj.get("id"))
+            size += line_bytes
+    finally:
+        if f is not None:
+            f.close()
+    return jobs
+
+
+def parse_job_results(output_text: str, error_text: str, ids: List[Any], offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Map the output / error files of a job back to records, in request order.
+
+    Returns:
+        One result per id: parse_translation of the answer, or translated_flag False
+        with the API error in "error" (also for lines the job never answered)
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(ids)
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        position = int(item["custom_id"]) - offset
+        response = item.get("response") or {}
+        if response.get("status_code") == 200:
+            llm_message = response["body"]["choices"][0]["message"]["content"].strip()
+            results[position] = {"id": ids[position], **parse_translation(llm_message)}
+        else:
+            error = item.get("error") or response.get("body", {}).get("error")
+            results[position] = {"id": ids[position], "translated_flag": False, "translated": {}, "message": "",
+                                 "error": json.dumps(error, ensure_ascii=False)}
+    for line in error_text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        position = int(item["custom_id"]) - offset
+        results[position] = {"id": ids[position], "translated_flag": False, "translated": {}, "message": "",
+                             "error": json.dumps(item.get("error"), ensure_ascii=False)}
+    return [
+        result or {"id": record_id, "translated_flag": False, "translated": {}, "message": "",
+                   "error": "no result (job expired or cancelled)"}
+        for record_id, result in zip(ids, results)
+    ]
+
+
+def _save_state(state_path: str, state: Dict[str, Any]) -> None:
+    tmp_path = temp_path(state_path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def run_batch_job(input_file: str, output_file: str, start: int = 0, end: Optional[int] = None,
+                  model: str = MODEL, backend=None, poll_interval: float = POLL_INTERVAL,
+                  wait: bool = True) -> Dict[str, Any]:
+    """
+    Translate records start..end (inclusive, 0-based) of input_file with Batch API jobs.
+
+    Args:
+        input_file: Input JSONL
+        output_file: Output JSONL (appended to; ids already translated are not submitted again)
+        start: First record
+        end: Last record (inclusive), None for all
+        model: Chat model
+        backend: OpenAIBatchBackend (default) or LocalBatchBackend
+        poll_interval: Seconds between two polls
+        wait: Poll until every job is done; otherwise poll once, download what is done and return
+
+    Returns:
+        The job state ({"input_file", "start", "end", "model", "jobs": [{"batch_id", "status", "request_file", "ids", ...}]})
+
+    Raises:
+        ValueError: If <output>.batch.json was left by a run with another input file, range or model
+    """
+    backend = backend or OpenAIBatchBackend()
+    state_path = f"{output_file}.batch.json"
+    run = {"input_file": os.path.abspath(input_file), "start": start, "end": end, "model": model}
+
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        # Keys missing from a state file written before they were recorded are not checked
+        mismatched = {key: state[key] for key, value in run.items() if key in state and state[key] != value}
+        if mismatched:
+            raise ValueError(f"{state_path} belongs to another run {mismatched}; "
+                             f"finish that run (same input file, --start / --end and --model) or remove the state file")
+        print(f"Batch: resuming {len(state['jobs'])} jobs from {state_path}")
+    else:
+        done_ids = prepare_resume(output_file) if os.path.exists(output_file) else set()
+        records = (obj for obj in iter_jsonl(input_file, start=start, end=end) if obj.get("id") not in done_ids)
+        jobs = write_job_files(records, f"{output_file}.batch", model=model)
+        for job in jobs:
+            job.update({"input_file_id": None, "batch_id": None, "status": None, "downloaded": False})
+        state = {**run, "jobs": jobs}
+        _save_state(state_path, state)
+
+    # The state is saved after every upload / create, so a failure part way through
+    # never leaves submitted (billed) jobs unrecorded; a new run submits only the rest
+    pending = [job for job in state["jobs"] if not job.get("batch_id")]
+    for job in pending:
+        if not job.get("input_file_id"):
+            job["input_file_id"] = backend.upload(job["request_file"])
+            _save_state(state_path, state)
+        batch = backend.create(job["input_file_id"], metadata={"input_file": os.path.basename(input_file)})
+        job.update({"batch_id": batch.id, "status": batch.status})
+        _save_state(state_path, state)
+    if pending:
+        print(f"Batch: submitted {sum(len(job['ids']) for job in pending)} requests in {len(pending)} jobs")
+
+    progress = tqdm(total=len(state["jobs"]), desc="jobs")
+    progress.update(sum(job["downloaded"] for job in state["jobs"]))
+    while True:
+        for job in state["jobs"]:
+            if job["downloaded"]:
+                continue
+            batch = backend.retrieve(job["batch_id"])
+            job["status"] = batch.status
+            if batch.status not in TERMINAL_STATUSES:
+                continue
+            output_text = backend.download(batch.output_file_id) if batch.output_file_id else ""
+            error_text = backend.download(batch.error_file_id) if batch.error_file_id else ""
+            results = parse_job_results(output_text, error_text, job["ids"], job["offset"])
+            # The output size before the append is recorded first, so an append interrupted
+            # before the job is marked downloaded is cut off again instead of being duplicated
+            if job.get("output_size") is None:
+                job["output_size"] = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+                _save_state(state_path, state)
+            with open(output_file, "a", encoding="utf-8") as f:
+                f.truncate(job["output_size"])
+                append_batch(f, [json.dumps(compact_result(result), ensure_ascii=False) + "\n" for result in results])
+            job["downloaded"] = True
+            job["translated"] = sum(bool(result["translated_flag"]) for result in results)
+            _save_state(state_path, state)
+            progress.update(1)
+        _save_state(state_path, state)
+
+        if all(job["downloaded"] for job in state["jobs"]) or not wait:
+            break
+        time.sleep(poll_interval)
+    progress.close()
+
+    if all(job["downloaded"] for job in state["jobs"]):
+        os.remove(state_path)
+        shutil.rmtree(f"{output_file}.batch", ignore_errors=True)
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate synthesized cases (JSONL) with OpenAI Batch API jobs.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("--start", type=int, default=0, help="first record to translate (0-based)")
+    parser.add_argument("--end", type=int, default=None, help="last record to translate (inclusive)")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--backend", choices=("openai", "local"), default="openai",
+                        help="local: offline stand-in that echoes the records (see LocalBatchBackend)")
+    parser.add_argument("--local-dir", default="./batch_api_local", help="directory of the local backend")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="seconds between polls")
+    parser.add_argument("--no-wait", dest="wait", action="store_false",
+                        help="submit / poll once and exit; run again later to collect the results")
+    args = parser.parse_args(argv)
+
+    backend = LocalBatchBackend(args.local_dir) if args.backend == "local" else OpenAIBatchBackend()
+    run_batch_job(args.input_file, args.output_file, start=args.start, end=args.end, model=args.model,
+                  backend=backend, poll_interval=args.poll_interval, wait=args.wait)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import json
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from openai import OpenAI
+
+from json_stream import JsonItemStream, parse_items
+from translation_engine import CONCURRENCY, MODEL, discard_cached_response, get_client
+
+TOKEN_BUDGET = 6000     # estimated input tokens of the records packed into one request
+MAX_ITEMS = 20          # records per request, whatever their size
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count of text: exact with tiktoken (if installed), otherwise ~4 characters
+    per token for Latin text and one token per CJK character.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def pack_batches(records: Iterable[Dict[str, Any]], token_budget: int = TOKEN_BUDGET,
+                 max_items: int = MAX_ITEMS) -> Iterator[List[Dict[str, Any]]]:
+    """Group consecutive records into batches of at most token_budget estimated tokens (a larger record goes alone)."""
+    batch, batch_tokens = [], 0
+    for obj in records:
+        tokens = estimate_tokens(json.dumps(obj, ensure_ascii=False))
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(obj)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _tags(batch: List[Dict[str, Any]]) -> List[Any]:
+    # Items are tagged with the record id; positions are used if ids are missing or repeated
+    ids = [obj.get("id") for obj in batch]
+    if None in ids or len(set(map(str, ids))) != len(ids):
+        return list(range(len(batch)))
+    return ids
+
+
+def build_batch_messages(batch: List[Dict[str, Any]], tags: List[Any]) -> List[Dict[str, str]]:
+    items_str = json.dumps([{"tag": tag, "record": obj} for tag, obj in zip(tags, batch)], ensure_ascii=False)
+    prompt = f"""
+                You are a professional medical translator.
+                Each item of the following JSON array has a "tag" and a "record".
+                Translate every record from English to Chinese.
+                Keep the JSON structure of each record exactly the same.
+                Translating each key into Chinese too.
+                e.g. "name" -> "名字", "age" -> "年龄", etc.
+
+                Return only a JSON array with one item per input item, in the same order:
+                {{"tag": <the same tag>, "translated": <the translated record>}}
+                without any extra explanation.
+
+                JSON:
+                {items_str}
+
+                """
+    return [
+        {"role": "system", "content": "You are a helpful assistant who translates JSON data."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _collect_items(items: Iterable[Any], wanted: set, found: Dict[str, Dict[str, Any]]) -> None:
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        if "tag" not in item:
+            # Array wrapped in an object, e.g. {"items": [...]}
+            for value in item.values():
+                if isinstance(value, list):
+                    _collect_items(value, wanted, found)
+            continue
+        tag = str(item.get("tag"))
+        translated = item.get("translated")
+        if tag in wanted and tag not in found and isinstance(translated, dict) and translated:
+            found[tag] = translated
+
+
+def parse_batch_items(llm_message: str, tags: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Translated records of a batch answer, by str(tag).
+
+    The whole answer is parsed first; if it is not valid JSON (truncated,
+    fenced, trailing commas, one broken item), its items are decoded one by one
+    with the repairing parser of json_stream.py. Items with an unknown tag or a
+    non-object translation are dropped.
+    """
+    try:
+        parsed = json.loads(llm_message)
+        items = parsed if isinstance(parsed, list) else [parsed]
+    except json.JSONDecodeError:
+        items = parse_items(llm_message)
+
+    found = {}
+    _collect_items(items, {str(tag) for tag in tags}, found)
+    return found
+
+
+def translate_batch(batch: List[Dict[str, Any]], client: Optional[OpenAI] = None,
+                    model: str = MODEL, stream: bool = False) -> List[Dict[str, Any]]:
+    """
+    Translate a batch in one request; items that come back missing or broken are
+    split in two halves and retried, recursively, so only failed records are re-sent.
+
+    With stream, the answer is streamed and each item is decoded as soon as its
+    closing brace arrives (json_stream.py); items completed before a dropped
+    connection or a truncated answer are kept, only the rest is retried.
+
+    Returns:
+        One result per record, in batch order: {"id", "translated_flag", "translated", "message"}
+        (message is the raw answer only for records that could not be translated)
+    """
+    client = client or get_client()
+    tags = _tags(batch)
+    messages = build_batch_messages(batch, tags)
+    found = {}
+    error = None
+    if stream:
+        parts = []
+        parser = JsonItemStream()
+        wanted = {str(tag) for tag in tags}
+        try:
+            # include_usage: the final chunk carries the usage the scheduler refunds its token estimate from
+            chunks = client.chat.completions.create(model=model, messages=messages, temperature=0, stream=True,
+                                                    stream_options={"include_usage": True})
+            try:
+                for chunk in chunks:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    parts.append(text)
+                    _collect_items(parser.feed(text), wanted, found)
+            finally:
+                chunks.close()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        # End of the answer (complete or cut off): collect whatever the parser still holds before bisecting
+        _collect_items(parser.close(), wanted, found)
+        llm_message = "".join(parts).strip()
+    else:
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0
+            )
+            llm_message = response.choices[0].message.content.strip()
+            found = parse_batch_items(llm_message, tags)
+        except Exception as e:
+            llm_message, error = "", f"{type(e).__name__}: {e}"
+
+    results: List[Optional[Dict[str, Any]]] = []
+    failed = []
+    for position, (tag, obj) in enumerate(zip(tags, batch)):
+        translated = found.get(str(tag))
+        if translated is None:
+            results.append(None)
+            failed.append(position)
+        else:
+            results.append({"id": obj.get("id"), "translated_flag": True, "translated": translated, "message": ""})
+
+    if failed and len(batch) > 1:
+        retry = [batch[position] for position in failed]
+        if len(retry) == 1:
+            retried = translate_batch(retry, client, model, stream)
+        else:
+            middle = (len(retry) + 1) // 2
+            retried = (translate_batch(retry[:middle], client, model, stream)
+                       + translate_batch(retry[middle:], client, model, stream))
+        for position, result in zip(failed, retried):
+            results[position] = result
+    else:
+        if failed:
+            discard_cached_response(client)
+        for position in failed:
+            results[position] = {
+                "id": batch[position].get("id"),
+                "translated_flag": False,
+                "translated": {},
+                "message": llm_message,
+                **({"error": error} if error else {}),
+            }
+    return results
+
+
+def iter_translate_batches(records: Iterable[Dict[str, Any]], client: Optional[OpenAI] = None,
+                           model: str = MODEL, concurrency: int = CONCURRENCY,
+                           token_budget: int = TOKEN_BUDGET, max_items: int = MAX_ITEMS,
+                           stream: bool = False) -> Iterator[Dict[str, Any]]:
+    """Pack records into token-budget batches, translate up to `concurrency` batches at once, yield results in input order."""
+    client = client or get_client()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for batch in pack_batches(records, token_budget=token_budget, max_items=max_items):
+            pending.append(executor.submit(translate_batch, batch, client, model, stream))
+            if len(pending) >= 2 * concurrency:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
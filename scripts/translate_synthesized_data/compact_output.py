@@ -0,0 +1,230 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+try:
+    import zstandard
+except ImportError:     # gzip is then the only compressed codec
+    zstandard = None
+
+# -----------------------------------------------------------------------------
+# Compact, compressed output of the translation scripts.
+#
+# A compact output is a directory of size-capped JSONL shards compressed with
+# zstd (needs the `zstandard` package) or gzip, plus a manifest.json listing the
+# shards in order with their record counts, sizes and id ranges. Results are
+# written with compact_result: the raw LLM message is kept only when the
+# translation failed.
+#
+# iter_lines() / iter_results() read any output transparently: a plain JSONL,
+# a single .jsonl.gz / .jsonl.zst file, or a compact output directory (or its
+# manifest.json).
+#
+# usage:
+#   python compact_output.py pack OUTPUT.jsonl OUTPUT_DIR [--codec gzip] [--max-shard-mb 256]
+# -----------------------------------------------------------------------------
+
+CODECS = ("zstd", "gzip", "none")
+DEFAULT_CODEC = "zstd" if zstandard is not None else "gzip"
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+MANIFEST = "manifest.json"
+MAX_SHARD_BYTES = 256 * 1024 ** 2      # uncompressed bytes per shard
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+def get_result_id(result: Dict[str, Any]) -> Any:
+    # Outputs written before results were tagged only carry the id inside "translated",
+    # where the LLM sometimes translated the key itself to "编号"
+    if "id" in result:
+        return result["id"]
+    translated = result.get("translated")
+    if not isinstance(translated, dict):
+        return None
+    return translated.get("id", translated.get("编号"))
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """A result as written to disk: the raw LLM message is only kept when the translation failed."""
+    if result.get("translated_flag") and result.get("message"):
+        return {**result, "message": ""}
+    return result
+
+
+def _codec_of(path: str) -> str:
+    if path.endswith(".zst"):
+        return "zstd"
+    if path.endswith(".gz"):
+        return "gzip"
+    return "none"
+
+
+def open_text(path: str, mode: str = "r") -> TextIO:
+    """Open a (possibly .gz / .zst compressed) text file for reading ("r") or writing ("w")."""
+    codec = _codec_of(path)
+    if codec == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError(f"{path} is zstd-compressed; pip install zstandard")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class CompactWriter:
+    """
+    Write results into a compact output directory (see the module header).
+
+    Shards are written to <directory>.tmp and moved in place by close(), which
+    writes the manifest last, so a directory with a manifest is always complete.
+    """
+
+    def __init__(self, directory: str, codec: str = DEFAULT_CODEC, max_shard_bytes: int = MAX_SHARD_BYTES):
+        """
+        Args:
+            directory: Output directory (replaced when the writer is closed)
+            codec: "zstd", "gzip" or "none"
+            max_shard_bytes: Uncompressed bytes after which a new shard is started
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {CODECS}")
+        if codec == "zstd" and zstandard is None:
+            raise ImportError("codec zstd needs the zstandard package (pip install zstandard), or use codec gzip")
+        self.directory = directory
+        self.codec = codec
+        self.max_shard_bytes = max_shard_bytes
+        self.shards: List[Dict[str, Any]] = []
+        self._tmp_dir = f"{directory}.tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(self._tmp_dir)
+        self._file: Optional[TextIO] = None
+
+    def _next_shard(self) -> None:
+        self._close_shard()
+        name = f"part-{len(self.shards):05d}.jsonl{EXTENSIONS[self.codec]}"
+        self._file = open_text(os.path.join(self._tmp_dir, name), "w")
+        self.shards.append({"file": name, "records": 0, "bytes": 0, "first_id": None, "last_id": None})
+
+    def _close_shard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            shard = self.shards[-1]
+            shard["compressed_bytes"] = os.path.getsize(os.path.join(self._tmp_dir, shard["file"]))
+
+    def write(self, result: Dict[str, Any], compact: bool = True) -> None:
+        """Append one result (compacted unless compact is False)."""
+        if compact:
+            result = compact_result(result)
+        self.write_line(json.dumps(result, ensure_ascii=False) + "\n", get_result_id(result))
+
+    def write_line(self, line: str, record_id: Any = None) -> None:
+        """Append one already serialized JSONL line."""
+        size = len(line.encode("utf-8"))
+        if self._file is None or (self.shards[-1]["records"] and self.shards[-1]["bytes"] + size > self.max_shard_bytes):
+            self._next_shard()
+        self._file.write(line)
+        shard = self.shards[-1]
+        if shard["records"] == 0:
+            shard["first_id"] = record_id
+        shard["last_id"] = record_id
+        shard["records"] += 1
+        shard["bytes"] += size
+
+    def close(self) -> Dict[str, Any]:
+        """Finish the last shard, write the manifest and move the directory in place; returns the manifest."""
+        self._close_shard()
+        manifest = {
+            "format": "jsonl",
+            "codec": self.codec,
+            "records": sum(shard["records"] for shard in self.shards),
+            "bytes": sum(shard["bytes"] for shard in self.shards),
+            "compressed_bytes": sum(shard["compressed_bytes"] for shard in self.shards),
+            "shards": self.shards,
+        }
+        with open(os.path.join(self._tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(self._tmp_dir, self.directory)
+        return manifest
+
+    def __enter__(self) -> "CompactWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_shard()
+
+
+def _manifest_path(path: str) -> Optional[str]:
+    if os.path.isdir(path):
+        return os.path.join(path, MANIFEST)
+    if os.path.basename(path) == MANIFEST:
+        return path
+    return None
+
+
+def iter_lines(path: str) -> Iterator[str]:
+    """Lines of an output in any of the supported layouts, in order."""
+    manifest_path = _manifest_path(path)
+    if manifest_path is None:
+        with open_text(path) as f:
+            yield from f
+        return
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path)
+    for shard in manifest["shards"]:
+        with open_text(os.path.join(directory, shard["file"])) as f:
+            yield from f
+
+
+def iter_results(path: str) -> Iterator[Dict[str, Any]]:
+    """Parsed results of an output in any of the supported layouts (blank lines skipped)."""
+    for line in iter_lines(path):
+        if line.strip():
+            yield json.loads(line)
+
+
+def pack(input_file: str, directory: str, codec: str = DEFAULT_CODEC,
+         max_shard_bytes: int = MAX_SHARD_BYTES, compact: bool = True) -> Dict[str, Any]:
+    """Rewrite an output (any layout) as a compact output directory; returns the manifest."""
+    with CompactWriter(directory, codec=codec, max_shard_bytes=max_shard_bytes) as writer:
+        for result in iter_results(input_file):
+            writer.write(result, compact=compact)
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact, compressed, sharded output of the translation scripts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser("pack", help="rewrite an output JSONL as a compact output directory")
+    pack_parser.add_argument("input_file", help="plain / .gz / .zst JSONL or a compact output directory")
+    pack_parser.add_argument("directory")
+    pack_parser.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC)
+    pack_parser.add_argument("--max-shard-mb", type=float, default=MAX_SHARD_BYTES / 1024 ** 2,
+                             help="uncompressed MB per shard")
+    pack_parser.add_argument("--keep-message", dest="compact", action="store_false",
+                             help="keep the raw LLM message of successful translations")
+    args = parser.parse_args(argv)
+
+    manifest = pack(args.input_file, args.directory, codec=args.codec,
+                    max_shard_bytes=int(args.max_shard_mb * 1024 ** 2), compact=args.compact)
+    print(f"{manifest['records']} records in {len(manifest['shards'])} shards, "
+          f"{manifest['bytes']} -> {manifest['compressed_bytes']} bytes ({args.codec})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,35 @@
 import json
 from collections import defaultdict, Counter
 
+from compact_output import iter_lines
+
 JSON_DIR = "./data/translated_data/pulmonology_case_synthesized_yonghui_translated_0_4999.jsonl"
 
 position_key_counts = defaultdict(Counter)
 all_positions = set()
 total_objects = 0
 
-with open(JSON_DIR, 'r', encoding='utf-8') as f:
-    for line in f:
-        try:
-            obj = json.loads(line.strip())
-            if not obj:
-                continue
+# Plain / .gz / .zst JSONL or a compact output directory (compact_output.py)
+for line in iter_lines(JSON_DIR):
+    try:
+        obj = json.loads(line.strip())
+        if not obj:
+            continue
 
-            obj = obj["translated"]
-                
-            total_objects += 1
-            keys = list(obj.keys())
+        obj = obj["translated"]
             
-            # Record maximum positions found
-            all_positions.update(range(len(keys)))
+        total_objects += 1
+        keys = list(obj.keys())
+        
+        # Record maximum positions found
+        all_positions.update(range(len(keys)))
+        
+        # Count each key at its position
+        for pos, key in enumerate(keys):
+            position_key_counts[pos][key] += 1
             
-            # Count each key at its position
-            for pos, key in enumerate(keys):
-                position_key_counts[pos][key] += 1
-                
-        except json.JSONDecodeError:
-            continue
+    except json.JSONDecodeError:
+        continue
 
 # Print comprehensive statistics
 print(f"Total JSON objects: {total_objects}")
@@ -0,0 +1,207 @@
+import re
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from medical_schema import GENDER_MAP, LEVEL_MAP
+from translation_memory import KEEP_KEYS, collect_strings, reassemble
+
+# -----------------------------------------------------------------------------
+# Skip-LLM fast path: decide locally which keys / values need no translation.
+#
+# A string is routed straight to the output when it is
+#   - already Chinese: at least CJK_RATIO of its letters are CJK characters
+#   - not text: no letters at all (numbers, dates, "120/80", "36.6℃")
+#   - an identifier: URL or e-mail address
+#   - an enum value (level / gender), which is mapped with the local tables
+#   - a romanized person name under a name key ("Carlos Mendoza" comes back unchanged anyway)
+# The character classes of all strings of a chunk are computed in one numpy pass.
+#
+# iter_routed() splits every record into its local top-level fields and the
+# fields to send: a record with nothing to send never reaches the LLM, a mixed
+# one (e.g. pulmonology_case_real_junkai.jsonl) sends only the remaining fields.
+# -----------------------------------------------------------------------------
+
+CJK_RATIO = 0.5
+CHUNK_RECORDS = 256
+
+ENUM_MAP = {**LEVEL_MAP, **GENDER_MAP}
+NAME_KEYS = ("name", "名字", "姓名")
+
+_NAME = re.compile(r"^[A-Z][a-z'\-]+(?: [A-Z][a-z'\-.]*){1,3}$")
+_IDENTIFIER = re.compile(r"^(?:[a-z][a-z0-9+.\-]*://|www\.)\S+$|^[\w.+\-]+@[\w\-]+\.[\w.\-]+$")
+
+
+def analyze_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Character statistics of many strings at once.
+
+    All strings are concatenated into one array of code points; per-string
+    counts are differences of cumulative sums at the string boundaries.
+
+    Returns:
+        (CJK share of the letters of each string, number of letters of each string)
+    """
+    if not strings:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    codes = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32)
+    cjk = (((codes >= 0x3400) & (codes <= 0x4dbf)) | ((codes >= 0x4e00) & (codes <= 0x9fff))
+           | ((codes >= 0xf900) & (codes <= 0xfaff)))
+    latin = (((codes | 0x20) >= 0x61) & ((codes | 0x20) <= 0x7a)) | ((codes >= 0xc0) & (codes <= 0x24f))
+
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    cjk_sum = np.concatenate(([0], np.cumsum(cjk)))
+    latin_sum = np.concatenate(([0], np.cumsum(latin)))
+    cjk_counts = cjk_sum[bounds[1:]] - cjk_sum[bounds[:-1]]
+    letters = cjk_counts + latin_sum[bounds[1:]] - latin_sum[bounds[:-1]]
+    return cjk_counts / np.maximum(letters, 1), letters
+
+
+def route_strings(strings: Iterable[str], names: Iterable[str] = ()) -> Dict[str, str]:
+    """
+    Strings that need no LLM, with their output (the string itself or its enum translation).
+
+    Args:
+        strings: Candidate keys / values
+        names: Values found under a name key (see collect_names)
+
+    Returns:
+        {string: output} for the strings routed locally; the others must be translated
+    """
+    strings = list(strings)
+    ratios, letters = analyze_strings(strings)
+    names = set(names)
+    local = {}
+    for text, ratio, count in zip(strings, ratios.tolist(), letters.tolist()):
+        if count == 0 or ratio >= CJK_RATIO:
+            local[text] = text
+            continue
+        stripped = text.strip()
+        enum = ENUM_MAP.get(stripped.lower())
+        if enum is not None:
+            local[text] = enum
+        elif _IDENTIFIER.match(stripped) or (text in names and _NAME.match(stripped)):
+            local[text] = text
+    return local
+
+
+def collect_names(obj: Any, out: List[str] = None) -> List[str]:
+    """String values stored under one of NAME_KEYS, anywhere in a JSON value."""
+    if out is None:
+        out = []
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in NAME_KEYS and isinstance(value, str):
+                out.append(value)
+            else:
+                collect_names(value, out)
+    elif isinstance(obj, list):
+        for item in obj:
+            collect_names(item, out)
+    return out
+
+
+def split_record(obj: Dict[str, Any], routes: Dict[str, str]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Local top-level fields of a record (already in output form) and the keys that must be sent.
+
+    A field is local when its key and every key / string inside its value are in routes.
+    """
+    local = {}
+    remote = []
+    for key, value in obj.items():
+        if key in KEEP_KEYS:
+            local[key] = value
+            continue
+        if key in routes and all(text in routes for text in collect_strings(value)):
+            local[routes[key]] = reassemble(value, routes)
+        else:
+            remote.append(key)
+    return local, remote
+
+
+def merge_record(obj: Dict[str, Any], remote: List[str], local: Dict[str, Any],
+                 translated: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Put the translated remote fields back between the local ones, in input order.
+
+    The LLM answer is matched to the remote keys by position; if it has a
+    different number of fields, they are appended after the local fields.
+    """
+    translated_items = [(key, value) for key, value in translated.items() if key not in KEEP_KEYS]
+    if len(translated_items) != len(remote):
+        return {**local, **dict(translated_items)}
+    by_key = dict(zip(remote, translated_items))
+    local_fields = iter(local.items())
+    merged = {}
+    for key in obj:
+        if key in by_key:
+            translated_key, value = by_key[key]
+            merged[translated_key] = value
+        else:
+            local_key, value = next(local_fields)
+            merged[local_key] = value
+    return merged
+
+
+def iter_routed(records: Iterable[Dict[str, Any]],
+                translate: Callable[[Iterable[Dict[str, Any]]], Iterator[Dict[str, Any]]],
+                chunk_records: int = CHUNK_RECORDS) -> Iterator[Dict[str, Any]]:
+    """
+    Run a translation pipeline on the parts of records that need the LLM, yielding results in input order.
+
+    Records whose fields are all local get a result right away ("llm_skipped": True)
+    and are not passed to translate. Records with only some local fields are
+    passed with the other fields (and id), and the answer is merged back.
+    Records with no local field besides the id are passed unchanged.
+
+    Args:
+        records: Input records
+        translate: Pipeline taking records and yielding one result per record, in order
+        chunk_records: Records analyzed per numpy pass
+    """
+    records = iter(records)
+    slots = deque()     # (obj, remote keys, local fields, result if done locally)
+
+    def _to_send() -> Iterator[Dict[str, Any]]:
+        while True:
+            chunk = list(islice(records, chunk_records))
+            if not chunk:
+                return
+            strings = {}
+            names = []
+            for obj in chunk:
+                strings.update(dict.fromkeys(key for key in obj if key not in KEEP_KEYS))
+                collect_strings(obj, strings)
+                collect_names(obj, names)
+            routes = route_strings(strings, names)
+
+            for obj in chunk:
+                local, remote = split_record(obj, routes)
+                if not remote:
+                    slots.append((obj, remote, local, {
+                        "id": obj.get("id"), "translated_flag": True, "translated": local,
+                        "message": "", "llm_skipped": True,
+                    }))
+                    continue
+                slots.append((obj, remote, local, None))
+                if all(key in KEEP_KEYS for key in local):
+                    yield obj
+                else:
+                    yield {**{key: obj[key] for key in KEEP_KEYS if key in obj},
+                           **{key: obj[key] for key in remote}}
+
+    def _drain_local() -> Iterator[Dict[str, Any]]:
+        while slots and slots[0][3] is not None:
+            yield slots.popleft()[3]
+
+    for result in translate(_to_send()):
+        yield from _drain_local()
+        obj, remote, local, _ = slots.popleft()
+        if result.get("translated_flag") and not all(key in KEEP_KEYS for key in local):
+            result = {**result, "translated": merge_record(obj, remote, local, result["translated"])}
+        yield result
+    yield from _drain_local()
@@ -0,0 +1,153 @@
+import json
+import re
+from typing import Any, Iterable, Iterator, List
+
+# Characters that end a plain run inside a JSON string
+_STRING_SPECIAL = re.compile(r'["\\\n\r\t]')
+_RAW_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class JsonItemStream:
+    """
+    Incremental parser of an LLM answer that is a JSON array of items (or one object).
+
+    Text is fed as it arrives; every top-level item of the array is decoded and
+    returned as soon as its closing bracket is seen, without waiting for the
+    rest of the answer. Common defects are repaired on the fly instead of
+    failing the whole answer:
+      - ``` fences and any other text around the JSON are skipped
+      - trailing commas before } or ] are dropped
+      - raw newlines / tabs inside strings are escaped
+      - escaped newlines (a literal \\n) between tokens are treated as whitespace
+    An item that still cannot be decoded is skipped and counted in `errors`;
+    the items after it are not affected.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.top = None             # "[" or "{" once the outermost value has started
+        self.in_string = False
+        self.escape = False         # previous character was a backslash inside a string
+        self.backslash = False      # previous character was a backslash outside any string
+        self.skip_line = False      # inside a ``` fence line
+        self.errors = 0
+        self._buffer: List[str] = []
+        self._recording = False
+
+    def _item_depth(self) -> int:
+        return 1 if self.top == "[" else 0
+
+    def _emit(self, items: List[Any]) -> None:
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._recording = False
+        try:
+            items.append(json.loads(text))
+        except json.JSONDecodeError:
+            self.errors += 1
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume the next piece of the answer and return the items it completed."""
+        items = []
+        buffer = self._buffer
+        position, length = 0, len(text)
+        while position < length:
+            if self.in_string:
+                if self.escape:
+                    buffer.append(text[position])
+                    self.escape = False
+                    position += 1
+                    continue
+                match = _STRING_SPECIAL.search(text, position)
+                if match is None:
+                    buffer.append(text[position:])
+                    break
+                special = match.start()
+                if special > position:
+                    buffer.append(text[position:special])
+                c = text[special]
+                if c == "\\":
+                    buffer.append(c)
+                    self.escape = True
+                elif c == '"':
+                    buffer.append(c)
+                    self.in_string = False
+                else:
+                    buffer.append(_RAW_CONTROL[c])
+                position = special + 1
+                continue
+
+            c = text[position]
+            position += 1
+            if self.skip_line:
+                self.skip_line = c != "\n"
+                continue
+            if self.backslash:
+                self.backslash = False
+                if c in "ntr":
+                    continue
+            if c == "\\":
+                self.backslash = True
+                continue
+            if c == "`":
+                if not self._recording:
+                    self.skip_line = True
+                continue
+
+            if c in "[{":
+                if self.top is None:
+                    self.top = c
+                    if c == "[":
+                        self.depth = 1
+                        continue
+                if not self._recording:
+                    if self.depth != self._item_depth():
+                        continue
+                    self._recording = True
+                    buffer = self._buffer
+                buffer.append(c)
+                self.depth += 1
+            elif c in "]}":
+                if self.top is None:
+                    continue
+                self.depth -= 1
+                if self._recording:
+                    while buffer and buffer[-1].isspace():
+                        buffer.pop()
+                    if buffer and buffer[-1] == ",":
+                        buffer.pop()
+                    buffer.append(c)
+                    if self.depth == self._item_depth():
+                        self._emit(items)
+                        buffer = self._buffer
+                        if self.top == "{":
+                            self.top = None
+                elif self.depth <= 0:
+                    self.top = None
+                    self.depth = 0
+            elif self._recording:
+                if c == '"':
+                    self.in_string = True
+                buffer.append(c)
+        return items
+
+    def close(self) -> List[Any]:
+        """End of the answer: an unfinished item is dropped (counted in errors)."""
+        if self._recording:
+            self.errors += 1
+        self._buffer = []
+        self._recording = False
+        return []
+
+
+def iter_items(chunks: Iterable[str]) -> Iterator[Any]:
+    """Yield the items of a JSON array answer from its text chunks, each as soon as it is complete."""
+    parser = JsonItemStream()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def parse_items(text: str) -> List[Any]:
+    """All decodable items of a complete answer (see JsonItemStream for the repairs)."""
+    return list(iter_items([text]))
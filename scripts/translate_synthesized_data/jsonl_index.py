@@ -0,0 +1,266 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import uuid
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# .idx sidecar layout (little endian):
+#   header  MAGIC, source size, source mtime_ns, source inode, record count, flags,
+#           digest of the first and last SAMPLE_BYTES bytes of the indexed source
+#   offsets record_count + 1 uint64 byte offsets (record i is bytes offsets[i]..offsets[i + 1])
+#   ids     record_count int64 record ids (MISSING_ID when a record has no integer id)
+MAGIC = b"JSONLID2"
+_HEADER = struct.Struct("<8sQqQQQ16s")
+_FLAG_IDS_SORTED = 1
+MISSING_ID = -(2 ** 63)
+SAMPLE_BYTES = 64 * 1024
+
+
+class JsonlIndex:
+    """
+    Random access to a JSONL file through a byte-offset sidecar (`<path>.idx`).
+
+    The sidecar is built once (one pass over the file) and reused while the
+    file's size / mtime / inode match; a file that only grew (appended output)
+    is indexed incrementally, after checking that the indexed prefix is unchanged
+    (digest of its first and last bytes). Any other change rebuilds the index
+    from scratch. Blank lines are not records. Reads go through a
+    read-only mmap, so iterating a range touches only that range's bytes and
+    memory stays flat however large the file is.
+
+    Usage:
+        records = JsonlIndex("cases.jsonl")
+        len(records)                   # number of records
+        records[42]                    # 43rd record
+        records.get_by_id(1234)        # record with "id" == 1234
+        for obj in records.iter_range(5000, 10000): ...
+        begin, end = records.byte_range(5000, 10000)
+    """
+
+    def __init__(self, path: str, id_key: str = "id", index_path: Optional[str] = None):
+        """
+        Args:
+            path: JSONL file
+            id_key: Top-level key holding the record id
+            index_path: Sidecar location (defaults to <path>.idx)
+        """
+        self.path = path
+        self.id_key = id_key
+        self.index_path = index_path or f"{path}.idx"
+        self.offsets = array("Q", [0])
+        self.ids = array("q")
+        self.ids_sorted = True
+        self._id_positions: Optional[Dict[int, int]] = None
+        self._file = None
+        self._mmap = None
+        self.refresh()
+
+    # -- index maintenance -------------------------------------------------
+
+    def refresh(self) -> None:
+        """(Re)load the sidecar, extending or rebuilding it if the file changed since it was written."""
+        self.close()
+        stat = os.stat(self.path)
+        signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        loaded = self._load_sidecar()
+        if loaded is not None and loaded[:3] == signature:
+            self._open_mmap(stat.st_size)
+            return
+
+        indexed_size = 0
+        if loaded is not None and self._only_appended(loaded, stat):
+            # Appended to since the sidecar was written: index only the new bytes
+            indexed_size = self.offsets[-1]
+        else:
+            self.offsets = array("Q", [0])
+            self.ids = array("q")
+            self.ids_sorted = True
+
+        self._open_mmap(stat.st_size)
+        self._index_from(indexed_size, stat.st_size)
+        self._id_positions = None
+        try:
+            self._write_sidecar(signature, self._sample_digest(stat.st_size))
+        except OSError as e:
+            print(f"Warning: could not write index {self.index_path}: {e}")
+
+    def _only_appended(self, loaded: Tuple[int, int, int, bytes], stat: os.stat_result) -> bool:
+        """Whether the file is the indexed one with bytes appended (a rewrite in place, even a longer one, is not)."""
+        size, _mtime_ns, inode, digest = loaded
+        return (inode == stat.st_ino and size < stat.st_size and self._ends_with_newline(size)
+                and self._sample_digest(size) == digest)
+
+    def _sample_digest(self, size: int) -> bytes:
+        """Digest of the first and last SAMPLE_BYTES of the first `size` bytes of the file."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(size.to_bytes(8, "little"))
+        with open(self.path, "rb") as f:
+            digest.update(f.read(min(size, SAMPLE_BYTES)))
+            if size > SAMPLE_BYTES:
+                f.seek(max(SAMPLE_BYTES, size - SAMPLE_BYTES))
+                digest.update(f.read(size - f.tell()))
+        return digest.digest()
+
+    def _load_sidecar(self) -> Optional[Tuple[int, int, int, bytes]]:
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, size, mtime_ns, inode, count, flags, digest = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != MAGIC:
+                    return None
+                offsets = array("Q")
+                offsets.fromfile(f, count + 1)
+                ids = array("q")
+                ids.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return None
+        self.offsets, self.ids, self.ids_sorted = offsets, ids, bool(flags & _FLAG_IDS_SORTED)
+        return size, mtime_ns, inode, digest
+
+    def _write_sidecar(self, signature: Tuple[int, int, int], digest: bytes) -> None:
+        size, mtime_ns, inode = signature
+        flags = _FLAG_IDS_SORTED if self.ids_sorted else 0
+        # Per-process temporary name: several workers may build the same sidecar at once
+        tmp_path = f"{self.index_path}.{os.getpid()}.{uuid.uuid4().hex[:12]}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, size, mtime_ns, inode, len(self.ids), flags, digest))
+                self.offsets.tofile(f)
+                self.ids.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _ends_with_newline(self, size: int) -> bool:
+        if size == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(size - 1)
+            return f.read(1) == b"\n"
+
+    def _index_from(self, begin: int, end: int) -> None:
+        # The last offset is the end of the indexed region; it is re-appended after the new records
+        self.offsets.pop()
+        position = begin
+        last_id = self.ids[-1] if self.ids else None
+        while position < end:
+            newline = self._mmap.find(b"\n", position, end)
+            line_end = end if newline == -1 else newline + 1
+            line = self._mmap[position:line_end]
+            if line.strip():
+                self.offsets.append(position)
+                record_id = self._parse_id(line)
+                if last_id is not None and (record_id == MISSING_ID or record_id < last_id):
+                    self.ids_sorted = False
+                self.ids.append(record_id)
+                last_id = record_id
+            position = line_end
+        self.offsets.append(position)
+
+    def _parse_id(self, line: bytes) -> int:
+        try:
+            record_id = json.loads(line).get(self.id_key)
+        except (ValueError, AttributeError):
+            return MISSING_ID
+        if isinstance(record_id, int) and not isinstance(record_id, bool):
+            return record_id
+        return MISSING_ID
+
+    def _open_mmap(self, size: int) -> None:
+        if size == 0:
+            return
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "JsonlIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # -- access -------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _record_end(self, i: int) -> int:
+        # Record i ends where the next line starts; blank lines in between are harmless for json.loads
+        return self.offsets[i + 1]
+
+    def raw(self, i: int) -> bytes:
+        """Raw bytes of record i (including the trailing newline)."""
+        if not 0 <= i < len(self):
+            raise IndexError(f"record {i} out of range (0..{len(self) - 1})")
+        return self._mmap[self.offsets[i]:self._record_end(i)]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        return json.loads(self.raw(i))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_range(0, len(self))
+
+    def iter_range(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Yield records start..stop-1 (like islice), parsing only those."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(max(start, 0), stop):
+            yield json.loads(self._mmap[self.offsets[i]:self._record_end(i)])
+
+    def byte_range(self, start: int = 0, stop: Optional[int] = None) -> Tuple[int, int]:
+        """Byte span [begin, end) of records start..stop-1, e.g. to hand a shard to another process."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = min(max(start, 0), stop)
+        return self.offsets[start], self.offsets[stop]
+
+    def position_of(self, record_id: int) -> Optional[int]:
+        """Record number of the record with the given id (None if absent)."""
+        if self.ids_sorted:
+            i = bisect_left(self.ids, record_id)
+            return i if i < len(self.ids) and self.ids[i] == record_id else None
+        if self._id_positions is None:
+            self._id_positions = {}
+            for i, value in enumerate(self.ids):
+                self._id_positions.setdefault(value, i)
+        return self._id_positions.get(record_id)
+
+    def get_by_id(self, record_id: int) -> Optional[Dict[str, Any]]:
+        i = self.position_of(record_id)
+        return self[i] if i is not None else None
+
+
+def iter_byte_range(path: str, begin: int, end: int) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the records of a JSONL file whose lines start in [begin, end).
+
+    Only those bytes are read (through a read-only mmap), so shard workers can
+    use it without loading or indexing the whole file. begin must be at a line
+    start, as returned by JsonlIndex.byte_range.
+    """
+    if begin >= end:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = begin
+        while position < end:
+            newline = mm.find(b"\n", position)
+            line_end = len(mm) if newline == -1 else newline + 1
+            line = mm[position:line_end]
+            if line.strip():
+                yield json.loads(line)
+            position = line_end
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.types.responses import ParsedResponse, Response
+from pydantic import BaseModel
+
+LLM_CACHE_PATH = "./llm_response_cache.sqlite3"
+LLM_CACHE_MAX_MB = 1024
+
+
+def _canonical(value: Any) -> Any:
+    # Pydantic classes (text_format / response_format) are keyed on their JSON schema
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return {"__schema__": value.model_json_schema()}
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    # repr() of arbitrary objects carries memory addresses, which would give a new key on every run
+    raise TypeError(f"{type(value).__name__} has no stable serialization for a cache key")
+
+
+def make_key(endpoint: str, kwargs: Dict[str, Any]) -> str:
+    """
+    Content address of a request: sha256 over the endpoint and every request
+    argument (model, messages / input, temperature, response / text format, ...)
+    serialized canonically, so byte-identical requests share one entry.
+
+    Raises:
+        TypeError: If an argument is neither JSON serializable nor a pydantic model / class
+    """
+    raw = json.dumps({"endpoint": endpoint, "kwargs": kwargs}, sort_keys=True, ensure_ascii=False,
+                     separators=(",", ":"), default=_canonical)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_response(endpoint: str, response_json: str, kwargs: Dict[str, Any]) -> Any:
+    """Rebuild the response object a cached call returned, so callers cannot tell a hit from a live call."""
+    if endpoint == "chat.completions.create":
+        return ChatCompletion.model_validate_json(response_json)
+    if endpoint == "responses.parse":
+        return ParsedResponse[kwargs["text_format"]].model_validate_json(response_json)
+    return Response.model_validate_json(response_json)
+
+
+def record_stream(chunks: Iterable[ChatCompletionChunk], store: Callable[[str], None]) -> Iterator[ChatCompletionChunk]:
+    """
+    Pass a streamed chat completion through and, once it has been read to the end,
+    store it as one ChatCompletion JSON (an interrupted stream is not stored).
+    """
+    parts = []
+    last = None
+    finish_reason = None
+    try:
+        for chunk in chunks:
+            last = chunk
+            if chunk.choices:
+                choice = chunk.choices[0]
+                parts.append(choice.delta.content or "")
+                finish_reason = choice.finish_reason or finish_reason
+            yield chunk
+    finally:
+        # Closing early must close the underlying stream too (and free its scheduler slot)
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    if last is None:
+        return
+    completion = ChatCompletion.model_validate({
+        "id": last.id,
+        "object": "chat.completion",
+        "created": last.created,
+        "model": last.model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": finish_reason or "stop",
+            "message": {"role": "assistant", "content": "".join(parts)},
+        }],
+        "usage": last.usage.model_dump() if last.usage else None,
+    })
+    store(completion.model_dump_json())
+
+
+def replay_stream(response_json: str) -> Iterator[ChatCompletionChunk]:
+    """A cached chat completion as a stream of one chunk carrying the whole answer."""
+    completion = ChatCompletion.model_validate_json(response_json)
+    choice = completion.choices[0]
+    yield ChatCompletionChunk.model_validate({
+        "id": completion.id,
+        "object": "chat.completion.chunk",
+        "created": completion.created,
+        "model": completion.model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": choice.finish_reason,
+            "delta": {"role": "assistant", "content": choice.message.content},
+        }],
+    })
+
+
+class LLMResponseCache:
+    """
+    Persistent SQLite cache of LLM responses, keyed by make_key().
+
+    Payloads are the zlib-compressed response JSON. The total payload size is
+    kept under max_bytes by evicting the least recently used entries (checked
+    every `evict_every` writes). Several processes may share one file.
+    """
+
+    def __init__(self, path: str = "./llm_response_cache.sqlite3", max_bytes: int = 1024 ** 3,
+                 evict_every: int = 100):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            max_bytes: Upper bound of the stored (compressed) payloads
+            evict_every: Number of writes between two size checks
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, payload BLOB NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        """
+        Configured by LLM_CACHE_PATH (default ./llm_response_cache.sqlite3; "off" or
+        "none" disables the cache) and LLM_CACHE_MAX_MB (default 1024).
+        """
+        path = os.getenv("LLM_CACHE_PATH", LLM_CACHE_PATH).strip()
+        if path.lower() in ("", "off", "none"):
+            return None
+        max_mb = float(os.getenv("LLM_CACHE_MAX_MB", LLM_CACHE_MAX_MB))
+        return cls(path, max_bytes=int(max_mb * 1024 ** 2))
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response JSON, or None."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT payload FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def set(self, key: str, endpoint: str, response_json: str) -> None:
+        payload = zlib.compress(response_json.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, payload, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, payload, len(payload), now, now),
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% so the next check does not evict again right away
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def discard(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
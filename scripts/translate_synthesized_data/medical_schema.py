@@ -0,0 +1,294 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai import OpenAI
+from pydantic import BaseModel, ValidationError
+
+from translation_engine import MODEL, discard_cached_response, get_client, translate_json_object, translate_strings
+
+
+class MedicalRecord(BaseModel):
+    """Schema of a synthesized case (same as in test_openai_responses_parse.py)."""
+
+    class Symptom(BaseModel):
+        symptoms: List[str]
+        duration: str
+
+    id: int
+    name: str
+    gender: str
+    age: int
+    medical_history: List[str]
+    lifestyle_factor: List[str]
+    vaccination_history: List[str]
+    family_history: List[str]
+    disease: str
+    level: str
+    symptom: Symptom
+    examination_results: Dict[str, str]
+
+
+# Fixed Chinese keys, so every translated record has the same keys at the same positions
+KEY_MAP = {
+    "id": "id",
+    "name": "名字",
+    "gender": "性别",
+    "age": "年龄",
+    "medical_history": "病史",
+    "lifestyle_factor": "生活方式因素",
+    "vaccination_history": "疫苗接种史",
+    "family_history": "家族史",
+    "disease": "疾病",
+    "level": "级别",
+    "symptom": "症状",
+    "examination_results": "检查结果",
+}
+SYMPTOM_KEY_MAP = {
+    "symptoms": "症状",
+    "duration": "持续时间",
+}
+# examination_results has free keys; the frequent ones are mapped here, others are translated with the values
+EXAMINATION_KEY_MAP = {
+    "physical_examination": "体格检查",
+    "imaging_tests": "影像学检查",
+    "laboratory_tests": "实验室检查",
+    "pulmonary_function_tests": "肺功能检查",
+    "bronchoscopy": "支气管镜检查",
+    "pleural_biopsy": "胸膜活检",
+    "thoracoscopy": "胸腔镜检查",
+    "sputum_tests": "痰液检查",
+    "blood_tests": "血液检查",
+    "arterial_blood_gas": "动脉血气分析",
+}
+LEVEL_MAP = {
+    "mild": "轻度",
+    "moderate": "中度",
+    "severe": "重度",
+}
+GENDER_MAP = {
+    "male": "男",
+    "female": "女",
+}
+
+LIST_FIELDS = ("medical_history", "lifestyle_factor", "vaccination_history", "family_history")
+
+
+def conforms(obj: Dict[str, Any]) -> bool:
+    """Whether a record follows MedicalRecord (records that do not are translated as whole JSON)."""
+    # Extra keys would be dropped by assemble(), so the key sets must match exactly
+    if set(obj) != set(KEY_MAP) or not isinstance(obj.get("symptom"), dict) or set(obj["symptom"]) != set(SYMPTOM_KEY_MAP):
+        return False
+    try:
+        MedicalRecord.model_validate(obj, strict=True)
+    except ValidationError:
+        return False
+    return True
+
+
+def _examination_key_text(key: str) -> str:
+    return key.replace("_", " ")
+
+
+def extract_free_text(obj: Dict[str, Any]) -> List[str]:
+    """
+    Free-text values of a MedicalRecord, in the order assemble() consumes them.
+
+    id and age are numbers, level and (usually) gender are enums and all keys
+    except unknown examination names are in the local maps, so none of them
+    are sent.
+    """
+    texts = [obj["name"]]
+    if obj["gender"].strip().lower() not in GENDER_MAP:
+        texts.append(obj["gender"])
+    for field in LIST_FIELDS:
+        texts.extend(obj[field])
+    texts.append(obj["disease"])
+    if obj["level"].strip().lower() not in LEVEL_MAP:
+        texts.append(obj["level"])
+    texts.extend(obj["symptom"]["symptoms"])
+    texts.append(obj["symptom"]["duration"])
+    for key, value in obj["examination_results"].items():
+        if key not in EXAMINATION_KEY_MAP:
+            texts.append(_examination_key_text(key))
+        texts.append(value)
+    return texts
+
+
+def assemble(obj: Dict[str, Any], translations: List[str]) -> Dict[str, Any]:
+    """Build the Chinese-key record from a MedicalRecord and the translations of extract_free_text(obj)."""
+    texts = iter(translations)
+
+    def _enum(value: str, mapping: Dict[str, str]) -> str:
+        return mapping.get(value.strip().lower()) or next(texts)
+
+    translated = {
+        KEY_MAP["id"]: obj["id"],
+        KEY_MAP["name"]: next(texts),
+        KEY_MAP["gender"]: _enum(obj["gender"], GENDER_MAP),
+        KEY_MAP["age"]: obj["age"],
+    }
+    for field in LIST_FIELDS:
+        translated[KEY_MAP[field]] = [next(texts) for _ in obj[field]]
+    translated[KEY_MAP["disease"]] = next(texts)
+    translated[KEY_MAP["level"]] = _enum(obj["level"], LEVEL_MAP)
+    translated[KEY_MAP["symptom"]] = {
+        SYMPTOM_KEY_MAP["symptoms"]: [next(texts) for _ in obj["symptom"]["symptoms"]],
+        SYMPTOM_KEY_MAP["duration"]: next(texts),
+    }
+    examination_results = {}
+    for key in obj["examination_results"]:
+        translated_key = EXAMINATION_KEY_MAP.get(key) or next(texts)
+        examination_results[translated_key] = next(texts)
+    translated[KEY_MAP["examination_results"]] = examination_results
+    return translated
+
+
+def translate_schema_record(obj: Dict[str, Any], client: Optional[OpenAI] = None,
+                            model: str = MODEL, route_local: bool = True) -> Dict[str, Any]:
+    """
+    Translate a MedicalRecord field by field: only its free-text values are sent, as one compact array.
+
+    With route_local, values that need no translation (already Chinese, numbers,
+    a romanized name; see field_router.py) are kept as they are and not sent.
+    Records that do not follow the schema go through translate_json_object instead.
+    """
+    if not conforms(obj):
+        return translate_json_object(obj, client=client, model=model)
+
+    texts = extract_free_text(obj)
+    local = {}
+    if route_local:
+        from field_router import route_strings
+        local = route_strings(texts, names=[obj["name"]])
+    to_send = [text for text in texts if text not in local]
+    llm_message = ""
+    if to_send:
+        sent, llm_message = translate_strings(to_send, client=client or get_client(), model=model)
+        if sent is None:
+            return {"translated_flag": False, "translated": {}, "message": llm_message}
+        sent = iter(sent)
+        translations = [local[text] if text in local else next(sent) for text in texts]
+    else:
+        translations = [local[text] for text in texts]
+    return {"translated_flag": True, "translated": assemble(obj, translations), "message": llm_message}
+
+
+STRUCTURED_PROMPT = """Translate the following medical record into JSON format according to the given schema.
+The medical record is originally in english, json-formatted, and containing such information:
+Schema:
+{
+    id: int
+    name: str
+    gender: str
+    age: int
+    medical_history: List[str]
+    lifestyle_factor: List[str]
+    vaccination_history: List[str]
+    family_history: List[str]
+    disease: str
+    level: str
+    symptom: Symptom,
+    examination_results: Dict[str, str]
+},
+
+Your return should strictly follow the schema and be in valid JSON format. Only translate the content of each values (of the keys), do not change the keys (remains in English as I given to you). Here is the medical record in english:
+"""
+
+
+def localize_keys(record: Dict[str, Any], examination_keys: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    English-key MedicalRecord dict -> the fixed Chinese keys of KEY_MAP.
+
+    Examination names missing from EXAMINATION_KEY_MAP are looked up in
+    examination_keys (see translate_examination_keys) and kept as they are otherwise.
+    """
+    examination_keys = {**(examination_keys or {}), **EXAMINATION_KEY_MAP}
+    translated = {}
+    for key, value in record.items():
+        if key == "symptom":
+            value = {SYMPTOM_KEY_MAP.get(k, k): v for k, v in value.items()}
+        elif key == "examination_results":
+            value = {examination_keys.get(k, k): v for k, v in value.items()}
+        translated[KEY_MAP.get(key, key)] = value
+    return translated
+
+
+def translate_examination_keys(keys: List[str], client: Optional[OpenAI] = None,
+                               model: str = MODEL) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Translate the examination names missing from EXAMINATION_KEY_MAP as schema mode does
+    (as text, routed through field_router first), in one request.
+
+    Returns:
+        ({key: translated key}, keys left untranslated because the request failed)
+    """
+    from field_router import route_strings
+    unknown = [key for key in dict.fromkeys(keys) if key not in EXAMINATION_KEY_MAP]
+    texts = [_examination_key_text(key) for key in unknown]
+    local = route_strings(texts)
+    to_send = [text for text in dict.fromkeys(texts) if text not in local]
+    sent = {}
+    if to_send:
+        try:
+            translations, _message = translate_strings(to_send, client=client or get_client(), model=model)
+        except Exception:
+            translations = None
+        if translations is not None:
+            sent = dict(zip(to_send, translations))
+    mapping = {key: local.get(text) or sent.get(text) for key, text in zip(unknown, texts)}
+    return {key: value for key, value in mapping.items() if value}, [key for key, value in mapping.items() if not value]
+
+
+def translate_structured_record(obj: Dict[str, Any], client: Optional[OpenAI] = None,
+                                model: str = MODEL) -> Dict[str, Any]:
+    """
+    Translate a MedicalRecord with structured output (responses.parse, text_format=MedicalRecord).
+
+    The answer is a validated MedicalRecord, so it cannot fail to parse; keys are
+    then mapped locally as in schema mode and id / age / level / gender are taken
+    from the input. Examination names missing from EXAMINATION_KEY_MAP are
+    translated in a second, small request as in schema mode; if that request
+    fails they stay in English and are listed in "untranslated_keys".
+    Results carry "schema_validated": True. Records that do not follow the
+    schema, refusals and API errors of the parse endpoint fall back to the
+    free-text prompt (translate_json_object), with the reason in "structured_error".
+    """
+    if not conforms(obj):
+        return translate_json_object(obj, client=client, model=model)
+
+    client = client or get_client()
+    try:
+        response = client.responses.parse(
+            model=model,
+            input=[
+                {"role": "system", "content": "You are a good translator in medical field."},
+                {"role": "user", "content": STRUCTURED_PROMPT + json.dumps(obj, ensure_ascii=False)},
+            ],
+            text_format=MedicalRecord,
+            temperature=0,
+        )
+        parsed = response.output_parsed
+        if parsed is None:
+            discard_cached_response(client)
+            raise ValueError("no parsed output (refusal or empty answer)")
+    except Exception as e:
+        result = translate_json_object(obj, client=client, model=model)
+        result["structured_error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    record = parsed.model_dump()
+    record["id"] = obj["id"]
+    record["age"] = obj["age"]
+    record["level"] = LEVEL_MAP.get(obj["level"].strip().lower(), record["level"])
+    record["gender"] = GENDER_MAP.get(obj["gender"].strip().lower(), record["gender"])
+    examination_keys, untranslated = translate_examination_keys(list(record["examination_results"]),
+                                                                client=client, model=model)
+    result = {
+        "translated_flag": True,
+        "translated": localize_keys(record, examination_keys),
+        "message": parsed.model_dump_json(),
+        "schema_validated": True,
+    }
+    if untranslated:
+        result["untranslated_keys"] = untranslated
+    return result
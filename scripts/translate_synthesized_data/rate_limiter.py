@@ -0,0 +1,422 @@
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Mapping, Optional
+
+import openai
+
+from llm_cache import LLMResponseCache, load_response, make_key, record_stream, replay_stream
+
+try:
+    import fcntl
+except ImportError:     # Windows: the budget is then only shared between the threads of one process
+    fcntl = None
+
+# Errors worth retrying; everything else (bad request, auth, ...) is raised at once
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of a rate-limit reset header: "20ms", "1s", "6m0s", "1h2m3.5s" or a plain number of seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(kwargs: Dict[str, Any]) -> int:
+    """Rough prompt size of a request (~3 characters per token), charged before the call and corrected with usage after."""
+    payload = kwargs.get("messages") or kwargs.get("input") or ""
+    return len(json.dumps(payload, ensure_ascii=False, default=str)) // 3
+
+
+class FileTokenBucket:
+    """
+    Requests-per-minute and tokens-per-minute buckets shared by every process on
+    the machine through a small JSON state file guarded by flock.
+
+    Limits come from the constructor or, once a response was seen, from the
+    x-ratelimit-limit-* headers; a dimension without a known limit is not
+    throttled. A 429 anywhere pauses all processes for the retry delay.
+    """
+
+    def __init__(self, path: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        """
+        Args:
+            path: State file (created if missing)
+            requests_per_minute: Request budget (None: learn it from the response headers)
+            tokens_per_minute: Token budget (None: learn it from the response headers)
+        """
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+
+    def _update(self, fn: Callable[[Dict[str, Any], float], Any]) -> Any:
+        """Run fn(state, now) on the refilled state under the process and file locks, then save the state."""
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    state = {}
+                now = time.time()
+                if self.requests_per_minute:
+                    state["rpm"] = self.requests_per_minute
+                if self.tokens_per_minute:
+                    state["tpm"] = self.tokens_per_minute
+                self._refill(state, now)
+
+                result = fn(state, now)
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _refill(state: Dict[str, Any], now: float) -> None:
+        elapsed = max(now - state.get("updated", now), 0.0)
+        for limit_key, available_key in (("rpm", "requests"), ("tpm", "tokens")):
+            limit = state.get(limit_key)
+            if limit:
+                available = state.get(available_key, limit)
+                state[available_key] = min(limit, available + limit * elapsed / 60.0)
+        state["updated"] = now
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until one request and `tokens` tokens are available, then take them."""
+        def _take(state: Dict[str, Any], now: float) -> float:
+            paused = state.get("paused_until", 0) - now
+            if paused > 0:
+                return paused
+            wait = 0.0
+            if state.get("rpm") and state["requests"] < 1:
+                wait = max(wait, (1 - state["requests"]) * 60.0 / state["rpm"])
+            if state.get("tpm"):
+                # A request larger than the whole budget only waits for a full bucket
+                needed = min(tokens, state["tpm"])
+                if state["tokens"] < needed:
+                    wait = max(wait, (needed - state["tokens"]) * 60.0 / state["tpm"])
+            if wait > 0:
+                return wait
+            if state.get("rpm"):
+                state["requests"] -= 1
+            if state.get("tpm"):
+                state["tokens"] -= tokens
+            return 0.0
+
+        while True:
+            wait = self._update(_take)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 5.0) + random.uniform(0, 0.05))
+
+    def refund(self, tokens: int) -> None:
+        """Give back (or, if negative, charge) tokens once the real usage of a request is known."""
+        def _refund(state: Dict[str, Any], now: float) -> None:
+            if state.get("tpm"):
+                state["tokens"] = min(state["tpm"], state["tokens"] + tokens)
+        self._update(_refund)
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Adopt the provider's limits and never assume more remaining budget than it reports."""
+        def _observe(state: Dict[str, Any], now: float) -> None:
+            for dimension, limit_key, available_key in (("requests", "rpm", "requests"), ("tokens", "tpm", "tokens")):
+                limit = _header_float(headers, f"x-ratelimit-limit-{dimension}")
+                remaining = _header_float(headers, f"x-ratelimit-remaining-{dimension}")
+                if limit and not (self.requests_per_minute if dimension == "requests" else self.tokens_per_minute):
+                    state[limit_key] = limit
+                    state.setdefault(available_key, limit)
+                if remaining is not None and state.get(limit_key):
+                    state[available_key] = min(state[available_key], remaining)
+        self._update(_observe)
+
+    def pause(self, seconds: float) -> None:
+        """Stop every process from sending for `seconds` (after a 429)."""
+        def _pause(state: Dict[str, Any], now: float) -> None:
+            state["paused_until"] = max(state.get("paused_until", 0), now + seconds)
+        self._update(_pause)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease:
+    +1 per window of successful calls, halved on a 429 (at most once per second,
+    so one burst of 429s counts as one signal).
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, success: bool, throttled: bool) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+            elif success:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class HeldStream:
+    """
+    A streamed response that keeps its AIMDLimiter slot until the stream is read
+    to the end or closed (the body arrives after the call returns), then refunds
+    the token bucket from the usage of the final chunk when the server sends one.
+    """
+
+    def __init__(self, stream: Any, limiter: AIMDLimiter, bucket: Optional[FileTokenBucket], estimate: int):
+        self._limiter = limiter
+        self._bucket = bucket
+        self._estimate = estimate
+        self._total_tokens = None
+        self._closed = False
+        self._stream = stream
+        self._chunks = iter(stream)
+
+    def __iter__(self) -> "HeldStream":
+        return self
+
+    def __next__(self) -> Any:
+        if self._closed:
+            raise StopIteration
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._finish(success=True)
+            raise
+        except BaseException:
+            self._finish(success=False)
+            raise
+        usage = getattr(chunk, "usage", None)
+        if getattr(usage, "total_tokens", None) is not None:
+            self._total_tokens = usage.total_tokens
+        return chunk
+
+    def _finish(self, success: bool) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._limiter.release(success, False)
+            if self._bucket is not None and self._total_tokens is not None:
+                self._bucket.refund(self._estimate - self._total_tokens)
+
+    def close(self) -> None:
+        """Stop reading (closes the HTTP response) and free the limiter slot."""
+        self._finish(success=False)
+
+    def __enter__(self) -> "HeldStream":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        # A stream dropped without being read or closed must not hold its slot forever
+        self.close()
+
+
+class LLMScheduler:
+    """
+    Gate in front of OpenAI-compatible calls: shared token bucket, AIMD
+    concurrency, and retries with full-jitter exponential backoff (or the
+    server's retry-after) for 429s, timeouts, connection and 5xx errors.
+    """
+
+    def __init__(self, bucket: Optional[FileTokenBucket] = None, limiter: Optional[AIMDLimiter] = None,
+                 max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.bucket = bucket
+        self.limiter = limiter or AIMDLimiter()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+
+    @classmethod
+    def from_env(cls, base_url: Optional[str] = None) -> "LLMScheduler":
+        """
+        Configured by LLM_RPM / LLM_TPM (budgets, otherwise learned from headers),
+        LLM_MAX_CONCURRENCY and LLM_RATE_LIMIT_FILE (default: one file per base URL in the temp dir).
+        """
+        digest = hashlib.sha1((base_url or "").encode("utf-8")).hexdigest()[:10]
+        path = os.getenv("LLM_RATE_LIMIT_FILE") or os.path.join(tempfile.gettempdir(), f"llm_rate_limit_{digest}.json")
+        rpm = os.getenv("LLM_RPM")
+        tpm = os.getenv("LLM_TPM")
+        bucket = FileTokenBucket(path, float(rpm) if rpm else None, float(tpm) if tpm else None)
+        limiter = AIMDLimiter(maximum=int(os.getenv("LLM_MAX_CONCURRENCY", "64")))
+        return cls(bucket=bucket, limiter=limiter)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        retry_after = _header_float(headers, "retry-after-ms")
+        if retry_after is not None:
+            retry_after /= 1000.0
+        else:
+            retry_after = _header_float(headers, "retry-after")
+        if retry_after is None:
+            retry_after = parse_duration(headers.get("x-ratelimit-reset-requests")) if isinstance(error, openai.RateLimitError) else None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, 0.5)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, raw_method: Callable[..., Any], **kwargs) -> Any:
+        """
+        Call a `with_raw_response` method of the OpenAI client under the scheduler.
+
+        With stream=True the result is a HeldStream: the call's concurrency slot
+        stays taken while the body is streamed, and is released once the stream
+        is exhausted or closed.
+
+        Returns:
+            The parsed response, like the plain method would
+
+        Raises:
+            The last error once max_retries is exhausted, or any non-retryable error
+        """
+        estimate = estimate_request_tokens(kwargs)
+        streaming = bool(kwargs.get("stream"))
+        for attempt in range(self.max_retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire(estimate)
+            self.limiter.acquire()
+            success = throttled = False
+            try:
+                raw = raw_method(**kwargs)
+                if self.bucket is not None:
+                    self.bucket.observe_headers(raw.headers)
+                result = raw.parse()
+                success = True
+            except RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+            finally:
+                if not (success and streaming):
+                    self.limiter.release(success, throttled)
+
+            if success and streaming:
+                return HeldStream(result, self.limiter, self.bucket, estimate)
+            if success:
+                usage = getattr(result, "usage", None)
+                total_tokens = getattr(usage, "total_tokens", None)
+                if self.bucket is not None and total_tokens is not None:
+                    self.bucket.refund(estimate - total_tokens)
+                return result
+
+            self.retries += 1
+            if throttled:
+                self.throttled += 1
+                if self.bucket is not None:
+                    self.bucket.pause(delay)
+            time.sleep(delay)
+
+
+class ScheduledClient:
+    """
+    Drop-in wrapper of an OpenAI client whose chat.completions.create,
+    responses.create and responses.parse go through an LLMScheduler; every
+    other attribute (files, batches, ...) is the wrapped client's.
+
+    With a response cache, a request identical to an earlier one (same model,
+    messages, temperature, format, ...) is answered from the cache without
+    touching the scheduler or the network.
+    """
+
+    def __init__(self, client: openai.OpenAI, scheduler: LLMScheduler, cache: Optional[LLMResponseCache] = None):
+        self.client = client
+        self.scheduler = scheduler
+        self.cache = cache
+        self._local = threading.local()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: self._call("chat.completions.create",
+                                               client.chat.completions.with_raw_response.create, kwargs),
+        ))
+        self.responses = SimpleNamespace(
+            create=lambda **kwargs: self._call("responses.create", client.responses.with_raw_response.create, kwargs),
+            parse=lambda **kwargs: self._call("responses.parse", client.responses.with_raw_response.parse, kwargs),
+        )
+
+    def _call(self, endpoint: str, raw_method: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+        if self.cache is None:
+            return self.scheduler.call(raw_method, **kwargs)
+        try:
+            key = make_key(endpoint, kwargs)
+        except TypeError:
+            # Arguments without a stable key are never cached
+            self._local.key = None
+            return self.scheduler.call(raw_method, **kwargs)
+        self._local.key = key
+        cached = self.cache.get(key)
+        streamed = endpoint == "chat.completions.create" and kwargs.get("stream")
+        if cached is not None:
+            return replay_stream(cached) if streamed else load_response(endpoint, cached, kwargs)
+        result = self.scheduler.call(raw_method, **kwargs)
+        if streamed:
+            # Stored once the caller has read the whole stream
+            return record_stream(result, lambda response_json: self.cache.set(key, endpoint, response_json))
+        self.cache.set(key, endpoint, result.model_dump_json())
+        return result
+
+    def discard_last(self) -> None:
+        """Drop the cached answer of this thread's last call (an answer that could not be used must not be replayed)."""
+        key = getattr(self._local, "key", None)
+        if self.cache is not None and key is not None:
+            self.cache.discard(key)
+            self._local.key = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
@@ -0,0 +1,306 @@
+import argparse
+import heapq
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from compact_output import CODECS, MAX_SHARD_BYTES, CompactWriter, compact_result, get_result_id
+from jsonl_index import JsonlIndex, iter_byte_range
+from translation_engine import append_batch, prepare_resume
+
+# -----------------------------------------------------------------------------
+# Run one pipeline stage over a JSONL file with one process per shard.
+#
+# The input is split into `workers` byte-range shards of (almost) equal record
+# counts using the .idx sidecar; every shard runs in its own process (own
+# client, own connection pool, own rate budget) and writes <output>.shards/
+# shard-XXXX.jsonl with the resumable, fsynced writer of translation_engine.
+# When all shards are done they are merged into OUTPUT ordered by id, and
+# <output>.manifest.json records counts, failures and timings per shard.
+# With --compress, OUTPUT is written as a compact output directory instead
+# (compressed, size-capped shards + manifest.json, see compact_output.py).
+#
+# Re-running the same command resumes: each shard skips the ids it already has
+# and retries the failed ones. The shard plan is kept in <output>.shards/plan.json,
+# so a resumed run always uses the original boundaries.
+#
+# A stage is "module:function" taking (records, **stage_args) and yielding one
+# result dict with an "id" per record; a result counts as failed when it has an
+# "error" or translated_flag false.
+#
+# usage:
+#   python sharded_runner.py INPUT OUTPUT --workers 4 --stage translate --stage-arg concurrency=16
+# -----------------------------------------------------------------------------
+
+STAGES = {
+    "translate": "translation_engine:translate_records",
+}
+
+
+def load_stage(spec: str) -> Callable[..., Iterator[Dict[str, Any]]]:
+    module_name, _, function_name = STAGES.get(spec, spec).partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def result_succeeded(result: Dict[str, Any]) -> bool:
+    return not result.get("error") and result.get("translated_flag") is not False
+
+
+def plan_shards(input_file: str, workers: int) -> List[Dict[str, Any]]:
+    """Split input_file into `workers` contiguous shards with (almost) equal record counts."""
+    with JsonlIndex(input_file) as records:
+        total = len(records)
+        bounds = [total * i // workers for i in range(workers + 1)]
+        shards = []
+        for shard, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+            begin, end = records.byte_range(start, stop)
+            shards.append({"shard": shard, "start": start, "stop": stop, "begin": begin, "end": end})
+    return shards
+
+
+def _shard_path(shard_dir: str, shard: int) -> str:
+    return os.path.join(shard_dir, f"shard-{shard:04d}.jsonl")
+
+
+def run_shard(input_file: str, shard: Dict[str, Any], shard_file: str, stage: str,
+              stage_args: Dict[str, Any], flush_every: int = 32) -> None:
+    """Worker process: run the stage over one byte range, appending to (and resuming) shard_file."""
+    done_ids = set()
+    if os.path.exists(shard_file):
+        done_ids = prepare_resume(shard_file, succeeded=result_succeeded)
+
+    records = (obj for obj in iter_byte_range(input_file, shard["begin"], shard["end"])
+               if obj.get("id") not in done_ids)
+    results = load_stage(stage)(records, **stage_args)
+
+    with open(shard_file, 'a', encoding='utf-8') as f:
+        batch = []
+        try:
+            for result in results:
+                batch.append(json.dumps(compact_result(result), ensure_ascii=False) + "\n")
+                if len(batch) >= flush_every:
+                    append_batch(f, batch)
+                    batch = []
+        finally:
+            if batch:
+                append_batch(f, batch)
+
+
+def _id_sort_key(record_id: Any) -> Tuple[int, Any]:
+    if isinstance(record_id, int):
+        return 0, record_id
+    return 1, str(record_id)
+
+
+def _iter_shard(shard_file: str, begin: int = 0, end: Optional[int] = None
+                ) -> Iterator[Tuple[int, Tuple[int, Any], str, Dict[str, Any]]]:
+    """(byte offset, id sort key, line, result) of the complete lines of a shard between begin and end."""
+    with open(shard_file, 'rb') as f:
+        f.seek(begin)
+        position = begin
+        for raw in f:
+            offset = position
+            if end is not None and offset >= end:
+                break
+            position += len(raw)
+            if not raw.endswith(b"\n"):
+                continue
+            line = raw.decode("utf-8")
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield offset, _id_sort_key(get_result_id(result)), line, result
+
+
+def _sorted_shard(shard_file: str) -> Iterator[Tuple[Tuple[int, Any], str, Dict[str, Any]]]:
+    """
+    The entries of a shard ordered by id, without loading the whole shard.
+
+    A shard is written in input order and retried records are appended at its
+    end, so only the tail from the first out-of-order id on is loaded and
+    sorted; the in-order prefix before it is streamed and merged with that tail.
+    """
+    if not os.path.exists(shard_file):
+        return iter(())
+    tail_begin = None
+    previous = None
+    scan = _iter_shard(shard_file)
+    for offset, key, _line, _result in scan:
+        if previous is not None and key < previous:
+            tail_begin = offset
+            break
+        previous = key
+    scan.close()
+
+    if tail_begin is None:
+        return (entry[1:] for entry in _iter_shard(shard_file))
+    tail = sorted((entry[1:] for entry in _iter_shard(shard_file, tail_begin)), key=lambda entry: entry[0])
+    prefix = (entry[1:] for entry in _iter_shard(shard_file, 0, tail_begin))
+    return heapq.merge(prefix, tail, key=lambda entry: entry[0])
+
+
+def merge_shards(shards: List[Dict[str, Any]], shard_dir: str, output_file: str, codec: Optional[str] = None,
+                 max_shard_bytes: int = MAX_SHARD_BYTES) -> None:
+    """
+    Merge the shard outputs into output_file ordered by id and fill in per-shard counts.
+
+    With a codec ("zstd" / "gzip"), output_file is a compact output directory (compact_output.CompactWriter).
+    """
+    for shard in shards:
+        shard.update({"count": 0, "failed": 0, "failed_ids": []})
+
+    def _stream(shard_no: int):
+        for key, line, result in _sorted_shard(_shard_path(shard_dir, shard_no)):
+            yield key, shard_no, line, result
+
+    def _merged():
+        streams = [_stream(shard["shard"]) for shard in shards]
+        for _key, shard_no, line, result in heapq.merge(*streams, key=lambda entry: (entry[0], entry[1])):
+            shard = shards[shard_no]
+            shard["count"] += 1
+            if not result_succeeded(result):
+                shard["failed"] += 1
+                shard["failed_ids"].append(get_result_id(result))
+            yield line, result
+
+    if codec:
+        with CompactWriter(output_file, codec=codec, max_shard_bytes=max_shard_bytes) as writer:
+            for line, result in _merged():
+                writer.write_line(line, get_result_id(result))
+        return
+
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        batch = []
+        for line, _result in _merged():
+            batch.append(line)
+            if len(batch) >= 1024:
+                f.write("".join(batch))
+                batch = []
+        append_batch(f, batch)
+    os.replace(tmp_path, output_file)
+
+
+def run_sharded(input_file: str, output_file: str, workers: int = 4, stage: str = "translate",
+                stage_args: Optional[Dict[str, Any]] = None, flush_every: int = 32, codec: Optional[str] = None,
+                max_shard_bytes: int = MAX_SHARD_BYTES) -> Dict[str, Any]:
+    """
+    Run a stage over input_file with one process per shard and merge the results.
+
+    Args:
+        input_file: Input JSONL (records with an "id")
+        output_file: Merged, id-ordered output JSONL
+        workers: Number of shards / processes
+        stage: Name in STAGES or "module:function"
+        stage_args: Keyword arguments passed to the stage in every process
+        flush_every: Lines per fsynced write in the shard files
+        codec: "zstd" / "gzip" to write output_file as a compact output directory
+        max_shard_bytes: Uncompressed bytes per compressed shard (with codec)
+
+    Returns:
+        The manifest (also written to <output_file>.manifest.json)
+    """
+    stage_args = stage_args or {}
+    shard_dir = f"{output_file}.shards"
+    plan_file = os.path.join(shard_dir, "plan.json")
+    os.makedirs(shard_dir, exist_ok=True)
+
+    if os.path.exists(plan_file):
+        with open(plan_file, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        if plan["input_file"] != os.path.abspath(input_file):
+            raise ValueError(f"{shard_dir} belongs to {plan['input_file']}; use another output file or remove it")
+        if plan["input_size"] != os.path.getsize(input_file):
+            raise ValueError(f"{input_file} changed since {plan_file} was written; the shard boundaries are stale")
+        if len(plan["shards"]) != workers:
+            print(f"Resuming with the original {len(plan['shards'])} shards (--workers {workers} ignored)")
+    else:
+        plan = {
+            "input_file": os.path.abspath(input_file),
+            "input_size": os.path.getsize(input_file),
+            "shards": plan_shards(input_file, workers),
+        }
+        with open(plan_file, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, indent=2)
+    shards = plan["shards"]
+
+    started = time.time()
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for shard in shards:
+        process = ctx.Process(
+            target=run_shard,
+            args=(input_file, shard, _shard_path(shard_dir, shard["shard"]), stage, stage_args, flush_every),
+            name=f"shard-{shard['shard']}",
+        )
+        process.start()
+        processes.append((shard, process, time.time()))
+
+    for shard, process, shard_started in processes:
+        process.join()
+        shard["exitcode"] = process.exitcode
+        shard["seconds"] = round(time.time() - shard_started, 1)
+        if process.exitcode != 0:
+            print(f"Warning: shard {shard['shard']} exited with code {process.exitcode}, re-run to resume it")
+
+    merge_shards(shards, shard_dir, output_file, codec=codec, max_shard_bytes=max_shard_bytes)
+
+    manifest = {
+        "input_file": input_file,
+        "output_file": output_file,
+        "stage": stage,
+        "stage_args": stage_args,
+        "workers": len(shards),
+        "input_records": sum(shard["stop"] - shard["start"] for shard in shards),
+        "output_records": sum(shard["count"] for shard in shards),
+        "failed": sum(shard["failed"] for shard in shards),
+        "failed_ids": [i for shard in shards for i in shard["failed_ids"]],
+        "crashed_shards": [shard["shard"] for shard in shards if shard["exitcode"] != 0],
+        "seconds": round(time.time() - started, 1),
+        "shards": shards,
+    }
+    with open(f"{output_file}.manifest.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    print(f"{manifest['output_records']}/{manifest['input_records']} records written to {output_file}, "
+          f"{manifest['failed']} failed, {len(manifest['crashed_shards'])} crashed shards")
+    return manifest
+
+
+def _parse_stage_arg(raw: str) -> Tuple[str, Any]:
+    key, _, value = raw.partition("=")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a pipeline stage over a JSONL file with one process per shard.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("--workers", type=int, default=4, help="number of shards / processes")
+    parser.add_argument("--stage", default="translate", help=f"one of {sorted(STAGES)} or module:function")
+    parser.add_argument("--stage-arg", action="append", default=[], metavar="KEY=VALUE",
+                        help="keyword argument for the stage (VALUE parsed as JSON when possible), repeatable")
+    parser.add_argument("--flush-every", type=int, default=32, help="lines per fsynced write")
+    parser.add_argument("--compress", choices=[codec for codec in CODECS if codec != "none"], default=None,
+                        help="write OUTPUT as a directory of compressed, size-capped shards with a manifest")
+    parser.add_argument("--max-shard-mb", type=float, default=MAX_SHARD_BYTES / 1024 ** 2,
+                        help="uncompressed MB per compressed shard")
+    args = parser.parse_args(argv)
+
+    stage_args = dict(_parse_stage_arg(raw) for raw in args.stage_arg)
+    manifest = run_sharded(args.input_file, args.output_file, workers=args.workers, stage=args.stage,
+                           stage_args=stage_args, flush_every=args.flush_every, codec=args.compress,
+                           max_shard_bytes=int(args.max_shard_mb * 1024 ** 2))
+    sys.exit(1 if manifest["crashed_shards"] else 0)
+
+
+if __name__ == "__main__":
+    main()
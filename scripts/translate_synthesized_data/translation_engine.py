@@ -0,0 +1,431 @@
+import argparse
+import json
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tqdm import tqdm
+from openai import OpenAI
+from dotenv import load_dotenv
+
+from compact_output import compact_result, get_result_id
+from jsonl_index import JsonlIndex
+from llm_cache import LLMResponseCache
+from rate_limiter import LLMScheduler, ScheduledClient
+
+load_dotenv()
+
+MODEL = "gpt-4o-mini"
+CONCURRENCY = 16
+TRANSLATION_MEMORY_PATH = "./translation_memory.sqlite3"
+
+_client = None
+
+
+def get_client() -> ScheduledClient:
+    """
+    Shared OpenAI client (thread-safe, one connection pool for all workers).
+
+    Every call goes through the rate-limit scheduler (rate_limiter.py), which
+    also owns retries, so the client's own retries are off. Identical requests
+    are answered from the response cache (llm_cache.py, LLM_CACHE_PATH).
+    """
+    global _client
+    if _client is None:
+        base_url = os.getenv("OPENAI_BASE_URL")
+        client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=base_url,
+            max_retries=0,
+        )
+        _client = ScheduledClient(client, LLMScheduler.from_env(base_url), cache=LLMResponseCache.from_env())
+    return _client
+
+
+def discard_cached_response(client: Any) -> None:
+    """Forget the cached answer of the calling thread's last request, so a rerun asks the LLM again."""
+    discard_last = getattr(client, "discard_last", None)
+    if discard_last is not None:
+        discard_last()
+
+
+def read_jsonl(file_path, limit=None):
+    with JsonlIndex(file_path) as records:
+        return list(records.iter_range(0, limit))
+
+
+def iter_jsonl(file_path, start=0, end=None):
+    """Yield records start..end (inclusive, 0-based) through the .idx sidecar, parsing only those."""
+    with JsonlIndex(file_path) as records:
+        yield from records.iter_range(start, None if end is None else end + 1)
+
+
+def build_prompt(obj: Dict[str, Any]) -> str:
+    obj_str = json.dumps(obj, ensure_ascii=False)
+    prompt = f"""
+                You are a professional medical translator. 
+                Translate the following JSON object from English to Chinese. 
+                Keep the JSON structure exactly the same.
+                Translating each key into Chinese too.
+                e.g. "name" -> "名字", "age" -> "年龄", etc.
+
+                Only return a valid JSON object without any extra explanation.
+
+                Your output will be passed to a python json.loads() function, 
+                so ensure it is adaptable for that.
+                Your return should not start with ```json and not containing 
+                excape nextline excharacters.
+
+                JSON:
+                {obj_str}
+
+                """
+    return prompt
+
+
+def build_messages(obj: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": "You are a helpful assistant who translates JSON data."},
+        {"role": "user", "content": build_prompt(obj)}
+    ]
+
+
+def parse_translation(llm_message: str) -> Dict[str, Any]:
+    """Turn the raw LLM answer into the output record (translated_flag / translated / message)."""
+    # Try parsing the returned JSON
+    try:
+        translated_obj = json.loads(llm_message)
+    except json.JSONDecodeError:
+        translated_obj = {}
+
+    if translated_obj == {}:
+        translated_flag = False
+    else:
+        translated_flag = True
+
+    # Include the raw LLM message and scheme_followed
+    result = {
+        "translated_flag": translated_flag,
+        "translated": translated_obj,
+        "message": llm_message,
+    }
+    return result
+
+
+def translate_json_object(obj: Dict[str, Any], client: Optional[OpenAI] = None, model: str = MODEL) -> Dict[str, Any]:
+    client = client or get_client()
+    response = client.chat.completions.create(
+        model=model,
+        messages=build_messages(obj),
+        temperature=0
+    )
+
+    llm_message = response.choices[0].message.content.strip()
+    result = parse_translation(llm_message)
+    if not result["translated_flag"]:
+        discard_cached_response(client)
+    return result
+
+
+def build_strings_messages(strings: List[str]) -> List[Dict[str, str]]:
+    strings_str = json.dumps(strings, ensure_ascii=False)
+    prompt = f"""
+                You are a professional medical translator.
+                Translate each string of the following JSON array from English to Chinese.
+                Return only a JSON array of the translated strings, in the same order
+                and with the same number of items, without any extra explanation.
+
+                JSON:
+                {strings_str}
+
+                """
+    return [
+        {"role": "system", "content": "You are a helpful assistant who translates JSON data."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def parse_string_translations(llm_message: str, expected: int) -> Optional[List[str]]:
+    """The translated strings, or None if the answer is not a JSON array of `expected` strings."""
+    try:
+        translated = json.loads(llm_message)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(translated, list) or len(translated) != expected:
+        return None
+    if not all(isinstance(item, str) for item in translated):
+        return None
+    return translated
+
+
+def translate_strings(strings: List[str], client: Optional[OpenAI] = None,
+                      model: str = MODEL) -> Tuple[Optional[List[str]], str]:
+    """
+    Translate a list of strings in one request.
+
+    Returns:
+        (translations in input order or None if the answer could not be used, raw LLM message)
+    """
+    client = client or get_client()
+    response = client.chat.completions.create(
+        model=model,
+        messages=build_strings_messages(strings),
+        temperature=0
+    )
+
+    llm_message = response.choices[0].message.content.strip()
+    translations = parse_string_translations(llm_message, len(strings))
+    if translations is None:
+        discard_cached_response(client)
+    return translations, llm_message
+
+
+def iter_translate(records: Iterable[Dict[str, Any]],
+                   translate_fn: Callable[[Dict[str, Any]], Dict[str, Any]] = translate_json_object,
+                   concurrency: int = CONCURRENCY) -> Iterator[Dict[str, Any]]:
+    """
+    Translate records over a thread pool and yield the results in input order.
+
+    Records are consumed lazily; at most 2 * concurrency of them are in flight or
+    waiting for an earlier one to finish. Each result is tagged with the record id.
+    A failing request does not stop the run: its result has translated_flag False
+    and the error in "error".
+
+    Args:
+        records: Input records (dicts with an "id")
+        translate_fn: Callable record -> {"translated_flag", "translated", "message"}
+        concurrency: Number of requests in flight
+
+    Yields:
+        {"id", "translated_flag", "translated", "message"} (+ "error" on failure)
+    """
+    def _collect(obj, future) -> Dict[str, Any]:
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {
+                "translated_flag": False,
+                "translated": {},
+                "message": "",
+                "error": f"{type(e).__name__}: {e}",
+            }
+        return {"id": obj.get("id"), **result}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for obj in records:
+            pending.append((obj, executor.submit(translate_fn, obj)))
+            if len(pending) >= 2 * concurrency:
+                yield _collect(*pending.popleft())
+
+        while pending:
+            yield _collect(*pending.popleft())
+
+
+def append_batch(f, lines: List[str]) -> None:
+    """Append a batch of lines with one write, then flush and fsync it."""
+    f.write("".join(lines))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def temp_path(path: str) -> str:
+    """A temporary file name next to path that no other process or thread uses."""
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex[:12]}.tmp"
+
+
+def translation_succeeded(result: Dict[str, Any]) -> bool:
+    return bool(result.get("translated_flag"))
+
+
+def prepare_resume(output_file: str, succeeded: Callable[[Dict[str, Any]], bool] = translation_succeeded) -> set:
+    """
+    Scan an existing output file and return the ids that are done.
+
+    The file is rewritten (through a temporary file, atomically) when it needs
+    repair: a torn last line from an interrupted run, failed results
+    (translated_flag false), results whose id cannot be resolved (see
+    get_result_id) and repeated ids are dropped, and the dropped records are
+    re-queued, so appending the remaining records afterwards yields each id
+    exactly once.
+
+    Args:
+        output_file: Output JSONL of a previous (possibly interrupted) run
+        succeeded: Predicate telling whether a result is done (other pipeline stages pass their own)
+
+    Returns:
+        Set of record ids already processed successfully
+    """
+    done_ids = set()
+    kept = []
+    dropped = 0
+    with open(output_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                dropped += 1
+                continue
+            result_id = get_result_id(result)
+            if (not line.endswith("\n") or not succeeded(result) or result_id is None
+                    or result_id in done_ids):
+                dropped += 1
+                continue
+            done_ids.add(result_id)
+            kept.append(line)
+
+    if dropped:
+        tmp_path = temp_path(output_file)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            append_batch(f, kept)
+        os.replace(tmp_path, output_file)
+        print(f"Resume: dropped {dropped} failed / incomplete / unidentified / duplicated lines from {output_file}")
+
+    return done_ids
+
+
+MODES = ("json", "memory", "schema", "batch", "stream", "structured")
+
+
+def translate_records(records: Iterable[Dict[str, Any]], concurrency: int = CONCURRENCY,
+                      model: str = MODEL, mode: str = "json", memory_path: Optional[str] = None,
+                      skip_local: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Pipeline stage (also used by sharded_runner): translate records with this process's own client.
+
+    Args:
+        records: Input records
+        concurrency: Number of requests in flight
+        model: Chat model
+        mode: "json" sends every record as a whole (translate_json_object);
+              "memory" sends only strings missing from the translation memory;
+              "schema" maps keys / id / age / level locally and sends only the
+              free-text values of a MedicalRecord (medical_schema.py);
+              "batch" packs several records per request up to a token budget
+              and retries only the records that came back broken (batch_translator.py);
+              "stream" is "batch" with streamed answers, each record decoded as soon
+              as it is complete (json_stream.py);
+              "structured" uses responses.parse(text_format=MedicalRecord), falling
+              back to "json" for records it cannot handle (medical_schema.py)
+        memory_path: SQLite file of the translation memory (mode "memory")
+        skip_local: Keep fields that need no translation (already Chinese, numbers,
+              enums, names) out of the requests; records made only of such fields
+              are not sent at all (field_router.py)
+
+    Yields:
+        Results in input order, see iter_translate
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown translation mode {mode!r}, expected one of {MODES}")
+    client = get_client()
+
+    def _translate(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        if mode == "memory":
+            from translation_memory import TranslationMemory, translate_records_with_memory
+            memory = TranslationMemory(memory_path or TRANSLATION_MEMORY_PATH, model=model)
+            return translate_records_with_memory(records, memory, client=client, model=model,
+                                                 concurrency=concurrency, route_local=skip_local)
+        if mode == "schema":
+            from medical_schema import translate_schema_record
+            return iter_translate(records, lambda obj: translate_schema_record(obj, client=client, model=model,
+                                                                               route_local=skip_local),
+                                  concurrency=concurrency)
+        if mode == "structured":
+            from medical_schema import translate_structured_record
+            return iter_translate(records, lambda obj: translate_structured_record(obj, client=client, model=model),
+                                  concurrency=concurrency)
+        if mode in ("batch", "stream"):
+            from batch_translator import iter_translate_batches
+            return iter_translate_batches(records, client=client, model=model, concurrency=concurrency,
+                                          stream=mode == "stream")
+        return iter_translate(records, lambda obj: translate_json_object(obj, client=client, model=model),
+                              concurrency=concurrency)
+
+    if skip_local:
+        from field_router import iter_routed
+        return iter_routed(records, _translate)
+    return _translate(records)
+
+
+def translate_file(input_file: str, output_file: str, start: int = 0, end: Optional[int] = None,
+                   concurrency: int = CONCURRENCY, model: str = MODEL, resume: bool = True,
+                   flush_every: int = 32, mode: str = "json", memory_path: Optional[str] = None,
+                   skip_local: bool = True, keep_message: bool = False) -> None:
+    """
+    Translate records start..end (inclusive, 0-based) of input_file into output_file.
+
+    With resume, an existing output file is kept and appended to: records whose
+    id is already translated are skipped, failed ones are translated again (see
+    prepare_resume). Results are written in batches of flush_every lines, each
+    batch fsynced, so an interrupted run loses at most the batch in progress.
+    """
+    with JsonlIndex(input_file) as records:
+        num_records = len(records)
+    last = num_records - 1 if end is None else min(end, num_records - 1)
+    total = max(last - start + 1, 0)
+
+    done_ids = set()
+    if resume and os.path.exists(output_file):
+        done_ids = prepare_resume(output_file)
+        print(f"Resume: {len(done_ids)} records already translated in {output_file}")
+
+    progress = tqdm(total=total)
+
+    def _pending_records():
+        for obj in iter_jsonl(input_file, start=start, end=end):
+            if obj.get("id") in done_ids:
+                progress.update(1)
+            else:
+                yield obj
+
+    with open(output_file, 'a' if resume else 'w', encoding='utf-8') as f:
+        results = translate_records(_pending_records(), concurrency=concurrency, model=model,
+                                    mode=mode, memory_path=memory_path, skip_local=skip_local)
+        batch = []
+        try:
+            for result in results:
+                progress.update(1)
+                if not keep_message:
+                    result = compact_result(result)
+                batch.append(json.dumps(result, ensure_ascii=False) + "\n")
+                if len(batch) >= flush_every:
+                    append_batch(f, batch)
+                    batch = []
+        finally:
+            if batch:
+                append_batch(f, batch)
+            progress.close()
+            cache = getattr(get_client(), "cache", None)
+            if cache is not None:
+                print(f"LLM cache: {cache.stats()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate synthesized cases (JSONL) with concurrent LLM requests.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("--start", type=int, default=0, help="first record to translate (0-based)")
+    parser.add_argument("--end", type=int, default=None, help="last record to translate (inclusive)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="requests in flight")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="overwrite the output file instead of resuming it")
+    parser.add_argument("--flush-every", type=int, default=32, help="lines per fsynced write")
+    parser.add_argument("--mode", choices=MODES, default="json", help="see translate_records")
+    parser.add_argument("--memory", default=None, help=f"translation memory file (default {TRANSLATION_MEMORY_PATH})")
+    parser.add_argument("--no-skip-local", dest="skip_local", action="store_false",
+                        help="send every field to the LLM, even Chinese / numeric / enum / name fields")
+    parser.add_argument("--keep-message", action="store_true",
+                        help="also write the raw LLM message of successful translations")
+    args = parser.parse_args(argv)
+
+    translate_file(args.input_file, args.output_file, start=args.start, end=args.end,
+                   concurrency=args.concurrency, model=args.model, resume=args.resume,
+                   flush_every=args.flush_every, mode=args.mode, memory_path=args.memory,
+                   skip_local=args.skip_local, keep_message=args.keep_message)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from openai import OpenAI
+
+from translation_engine import CONCURRENCY, MODEL, get_client, translate_strings
+
+# Keys whose values are identifiers, not text: kept as they are (the id is also what resume matches on)
+KEEP_KEYS = ("id",)
+
+
+class TranslationMemory:
+    """
+    Persistent SQLite store of string translations (English -> Chinese), per model.
+
+    The synthesized cases reuse a small vocabulary (keys, symptoms, lifestyle
+    factors, disease names, levels), so after the first few hundred records
+    most strings are served from here. Several processes may share one file.
+    """
+
+    def __init__(self, path: str = "./translation_memory.sqlite3", model: str = MODEL):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            model: Model the stored translations belong to
+        """
+        self.path = path
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " model TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (model, source))"
+            )
+
+    def get_many(self, strings: Iterable[str]) -> Dict[str, str]:
+        """Stored translations of the given strings (missing ones are left out)."""
+        strings = list(strings)
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for i in range(0, len(strings), 500):
+                chunk = strings[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT source, target FROM translations WHERE model = ? AND source IN ({placeholders})",
+                    [self.model, *chunk],
+                ))
+        self.hits += len(found)
+        self.misses += len(strings) - len(found)
+        return found
+
+    def set_many(self, translations: Dict[str, str]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (model, source, target, created_at) VALUES (?, ?, ?, ?)",
+                [(self.model, source, target, now) for source, target in translations.items()],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations WHERE model = ?", (self.model,)).fetchone()[0]
+
+
+def collect_strings(obj: Any, out: Optional[Dict[str, None]] = None) -> Dict[str, None]:
+    """Leaf strings (and keys) of a JSON value that need translating, in first-seen order."""
+    if out is None:
+        out = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in KEEP_KEYS:
+                continue
+            out.setdefault(key)
+            collect_strings(value, out)
+    elif isinstance(obj, list):
+        for item in obj:
+            collect_strings(item, out)
+    elif isinstance(obj, str) and obj.strip():
+        out.setdefault(obj)
+    return out
+
+
+def reassemble(obj: Any, translations: Dict[str, str]) -> Any:
+    """Rebuild a JSON value with every key / leaf string replaced by its translation (KeyError if one is missing)."""
+    if isinstance(obj, dict):
+        return {
+            key if key in KEEP_KEYS else translations[key]: value if key in KEEP_KEYS else reassemble(value, translations)
+            for key, value in obj.items()
+        }
+    if isinstance(obj, list):
+        return [reassemble(item, translations) for item in obj]
+    if isinstance(obj, str) and obj.strip():
+        return translations[obj]
+    return obj
+
+
+def translate_records_with_memory(records: Iterable[Dict[str, Any]], memory: TranslationMemory,
+                                  client: Optional[OpenAI] = None, model: str = MODEL,
+                                  concurrency: int = CONCURRENCY, chunk_records: int = 64,
+                                  batch_strings: int = 80, route_local: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Translate records through the translation memory, yielding results in input order.
+
+    Records are taken chunk_records at a time; the distinct strings of a chunk
+    are looked up in the memory, the novel ones are translated in batches of
+    batch_strings (up to `concurrency` batches in flight), stored, and every
+    record is reassembled. A record with a string whose batch failed gets
+    translated_flag False and the raw answer of that batch as message.
+    With route_local, strings that need no translation (Chinese, numbers, enums,
+    names; see field_router.py) are resolved locally and neither looked up nor sent.
+
+    Yields:
+        {"id", "translated_flag", "translated", "message"} (+ "error" on failure)
+    """
+    client = client or get_client()
+    records = iter(records)
+
+    def _translate_batch(batch: List[str]):
+        try:
+            translated, llm_message = translate_strings(batch, client=client, model=model)
+            return translated, llm_message, None
+        except Exception as e:
+            return None, "", f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            chunk = list(islice(records, chunk_records))
+            if not chunk:
+                break
+
+            needed = {}
+            for obj in chunk:
+                collect_strings(obj, needed)
+            local = {}
+            if route_local:
+                from field_router import collect_names, route_strings
+                names = []
+                for obj in chunk:
+                    collect_names(obj, names)
+                local = route_strings(needed, names)
+            translations = memory.get_many(text for text in needed if text not in local)
+            translations.update(local)
+            novel = [text for text in needed if text not in translations]
+
+            failures = {}
+            batches = [novel[i:i + batch_strings] for i in range(0, len(novel), batch_strings)]
+            learned = {}
+            for batch, (translated, llm_message, error) in zip(batches, executor.map(_translate_batch, batches)):
+                if translated is None:
+                    failure = {"message": llm_message, **({"error": error} if error else {})}
+                    failures.update((text, failure) for text in batch)
+                else:
+                    learned.update(zip(batch, translated))
+            if learned:
+                memory.set_many(learned)
+                translations.update(learned)
+
+            for obj in chunk:
+                try:
+                    yield {
+                        "id": obj.get("id"),
+                        "translated_flag": True,
+                        "translated": reassemble(obj, translations),
+                        "message": "",
+                    }
+                except KeyError as e:
+                    yield {
+                        "id": obj.get("id"),
+                        "translated_flag": False,
+                        "translated": {},
+                        **failures.get(e.args[0], {"message": ""}),
+                    }
@@ -0,0 +1,418 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+
+from dataset_sync import SyncResult, load_snapshot, merge_dataset_list, write_snapshot
+from department_registry import DepartmentRecord, DepartmentRegistry
+from retrieval_cache import RetrievalCache
+from single_flight import AsyncSingleFlight, request_key
+
+
+class AsyncTreatmentGuidelineRetriever:
+    """
+    Asyncio counterpart of treatment_guideline_retriever.
+
+    All requests go through one pooled, keep-alive httpx.AsyncClient, so a single
+    process can keep hundreds of retrievals in flight without paying a new
+    TCP/TLS handshake per call. Chunks come straight from the /api/v1/retrieval
+    endpoint, whose `document_keyword` field already carries the document name.
+
+    Usage:
+        async with AsyncTreatmentGuidelineRetriever() as retriever:
+            results = await retriever.retrieve_treament("哮喘", ["呼吸科"])
+    """
+
+    # Same defaults the ragflow_sdk applies in RAGFlow.retrieve
+    RETRIEVAL_DEFAULTS = {
+        "similarity_threshold": 0.2,
+        "vector_similarity_weight": 0.3,
+        "top_k": 1024,
+    }
+
+    def __init__(self,
+                 json_path: str = "./datasets_full.json",
+                 max_connections: int = 200,
+                 max_keepalive_connections: int = 50,
+                 keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 10.0,
+                 read_timeout: float = 60.0,
+                 pool_timeout: Optional[float] = None,
+                 cache_path: Optional[str] = None):
+        """
+        Initialize the async retriever.
+
+        Args:
+            json_path: Path to the datasets JSON file written by sync_datasets()
+            max_connections: Maximum number of concurrent connections to RAGFlow
+            max_keepalive_connections: Maximum number of idle connections kept open
+            keepalive_expiry: Seconds an idle connection is kept open
+            connect_timeout: Timeout for establishing a connection
+            read_timeout: Timeout for reading a response
+            pool_timeout: Timeout for waiting on a free connection (None waits forever)
+            cache_path: SQLite file for the persistent retrieval result cache
+                        (defaults to $RETRIEVAL_CACHE_PATH; caching is off when neither is set)
+        """
+        self.base_url = os.getenv("RAGFLOW_BASE_URL")
+        self.api_key = os.getenv("RAGFLOW_API_KEY")
+        self.json_path = json_path
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': f'Bearer {self.api_key}',
+            },
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=connect_timeout,
+                read=read_timeout,
+                write=read_timeout,
+                pool=pool_timeout,
+            ),
+        )
+
+        cache_path = cache_path or os.getenv("RETRIEVAL_CACHE_PATH")
+        self.cache = RetrievalCache(cache_path) if cache_path else None
+
+        # Identical retrievals in flight at the same time share one upstream call
+        self.flights = AsyncSingleFlight()
+
+        self.registry = DepartmentRegistry()
+        self._synced_datasets: List[Dict] = []
+        self._load_department_mapping()
+
+    async def __aenter__(self) -> "AsyncTreatmentGuidelineRetriever":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client."""
+        await self.client.aclose()
+
+    @property
+    def department_mapping(self) -> Dict[str, str]:
+        """Read-only department name to ID mapping of the current registry snapshot."""
+        return self.registry.snapshot.name_to_id
+
+    def _load_department_mapping(self) -> Dict[str, str]:
+        """
+        Load department name to ID mapping from JSON file and publish it to the registry.
+
+        Returns:
+            Dictionary mapping department names to their IDs
+        """
+        try:
+            datasets = load_snapshot(self.json_path)
+
+            self._synced_datasets = datasets
+            self._update_cache_versions(datasets)
+            return self.registry.publish(datasets).name_to_id
+
+        except FileNotFoundError:
+            print(f"Warning: JSON file {self.json_path} not found. Please call sync_datasets() first.")
+            return {}
+        except Exception as e:
+            print(f"Error loading department mapping: {e}")
+            return {}
+
+    async def sync_datasets(self, page_size: int = 100) -> SyncResult:
+        """
+        Fetch the dataset list from the RAGflow server side through the pooled client,
+        and when anything changed, write it to json_path as a compact snapshot and
+        publish the new department mapping.
+
+        Args:
+            page_size: Number of datasets requested per page
+
+        Returns:
+            SyncResult with the ids of changed and removed datasets
+
+        Raises:
+            RuntimeError: If RAGFlow answers with an error status or error code
+        """
+        fetched = []
+        page = 1
+        while True:
+            response = await self.client.get("/api/v1/datasets", params={
+                "page": page, "page_size": page_size, "orderby": "update_time", "desc": "true",
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f"Received status code {response.status_code}")
+
+            listed = response.json()
+            if listed.get("code", 0) != 0:
+                raise RuntimeError(f"RAGFlow error {listed.get('code')}: {listed.get('message')}")
+
+            datasets = listed.get("data") or []
+            fetched.extend(datasets)
+            if len(datasets) < page_size:
+                break
+            page += 1
+
+        result = merge_dataset_list(self._synced_datasets, fetched, full=True)
+        if result.has_changes:
+            write_snapshot(self.json_path, result.datasets)
+            self._synced_datasets = result.datasets
+            self.registry.publish(result.datasets)
+            await asyncio.to_thread(self._update_cache_versions, result.datasets, result.removed)
+        return result
+
+    def _update_cache_versions(self, datasets: List[Dict], removed: Iterable[str] = ()) -> None:
+        """Drop cached retrieval results of datasets whose chunk_count / document_count / update_time changed, or that were removed."""
+        if self.cache is not None:
+            changed = self.cache.update_dataset_versions(datasets, removed)
+            if changed:
+                print(f"Invalidated cached retrievals of {len(changed)} changed datasets.")
+
+    def get_department_ids(self, department_names: List[str]) -> List[str]:
+        """
+        Get department IDs for given department names.
+
+        Args:
+            department_names: List of department names (e.g., ["呼吸科", "眼科", "神经科"])
+
+        Returns:
+            List of department IDs
+        """
+        snapshot = self.registry.snapshot
+        department_ids = []
+        missing_departments = []
+
+        for dept_name in department_names:
+            dept_id = snapshot.get_id(dept_name)
+            if dept_id:
+                department_ids.append(dept_id)
+            else:
+                missing_departments.append(dept_name)
+
+        if missing_departments:
+            print(f"Warning: The following departments were not found: {missing_departments}")
+            print(f"Available departments: {snapshot.names()}")
+
+        return department_ids
+
+    def get_department_name(self, department_id: str) -> Optional[str]:
+        """
+        Get department name for a given department ID.
+
+        Args:
+            department_id: Department ID
+
+        Returns:
+            Department name or None if not found
+        """
+        return self.registry.get_name(department_id)
+
+    def get_department_record(self, department_id: str) -> Optional[DepartmentRecord]:
+        """
+        Get synced metadata (name, chunk_count, document_count, embedding_model) for a department ID.
+
+        Args:
+            department_id: Department ID
+
+        Returns:
+            Department record or None if not found
+        """
+        return self.registry.get_record(department_id)
+
+    def get_available_departments(self) -> List[str]:
+        """
+        Get list of available department names.
+
+        Returns:
+            List of available department names
+        """
+        return self.registry.names()
+
+    async def _retrieve_chunk_infos(self, method: str, data: Dict[str, Any], department_ids: List[str], with_idx: bool = False, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Run one retrieval request and convert its chunks, served from the retrieval cache when possible.
+
+        Concurrent calls for the same request wait on one upstream call; the
+        timeout only bounds the wait of each caller, not the shared request.
+
+        Args:
+            method: Retrieval method name, part of the cache key
+            data: Retrieval request body
+            department_ids: Dataset IDs searched
+            with_idx: Whether to number the returned chunks with an "idx" key
+            timeout: Overall timeout in seconds, on top of the client timeouts
+
+        Raises:
+            RuntimeError: If RAGFlow answers with an error status or error code
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(method, data["question"], department_ids, data["page_size"],
+                                            data.get("tag_feas"), data.get("exclude_tags"))
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        async def _fetch() -> List[Dict]:
+            results = [self._to_chunk_info(chunk) for chunk in await self._post_retrieval(data)]
+            if with_idx:
+                results = [{"idx": idx, **chunk_info} for idx, chunk_info in enumerate(results)]
+
+            if cache_key is not None:
+                await asyncio.to_thread(self.cache.set, cache_key, department_ids, results)
+            return results
+
+        key = (request_key(method, data["question"], department_ids, data["page_size"],
+                           data.get("tag_feas"), data.get("exclude_tags")), with_idx)
+        results, joined = await asyncio.wait_for(self.flights.do(key, _fetch), timeout)
+        return [dict(chunk_info) for chunk_info in results] if joined else results
+
+    async def _retrieve_or_report(self, method: str, data: Dict[str, Any], department_ids: List[str], with_idx: bool = False) -> List[Dict]:
+        """_retrieve_chunk_infos that reports errors and returns an empty result, like the sync retriever does."""
+        try:
+            return await self._retrieve_chunk_infos(method, data, department_ids, with_idx=with_idx)
+
+        except RuntimeError as e:
+            print(f"Error: {e}")
+
+        except Exception as e:
+            print(f"Exception occurred: {e!r}")
+
+        return []
+
+    async def _post_retrieval(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        POST a payload to /api/v1/retrieval and return the raw chunk dicts.
+
+        Raises:
+            RuntimeError: If RAGFlow answers with an error status or error code
+        """
+        response = await self.client.post("/api/v1/retrieval", json=data)
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Received status code {response.status_code}")
+
+        retrieved_result = response.json()
+        if retrieved_result.get("code", 0) != 0:
+            raise RuntimeError(f"RAGFlow error {retrieved_result.get('code')}: {retrieved_result.get('message')}")
+
+        return (retrieved_result.get('data') or {}).get('chunks', [])
+
+    def _to_chunk_info(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": chunk["content"],
+            "department_id": chunk["dataset_id"],
+            "department_name": self.get_department_name(chunk["dataset_id"]),
+            "document_id": chunk["document_id"],
+            "document_name": chunk.get("document_keyword", " "),
+            "similarity_score": chunk["similarity"],
+        }
+
+    async def retrieve_treament(self, disease_name: str, department_names: List[str], query_type: str = "治疗", k: int = 32) -> List[Dict]:
+        """
+        Retrieve information about a disease from specified departments.
+
+        Args:
+            disease_name: Name of the disease (e.g., "哮喘")
+            department_names: List of department names to search in
+            query_type: Type of information to retrieve (e.g., "治疗", "症状", "诊断")
+            k: Number of top results to retrieve
+
+        Returns:
+            List of dictionaries containing chunk information
+        """
+        department_ids = self.get_department_ids(department_names)
+
+        if not department_ids:
+            print("Error: No valid department IDs found.")
+            return []
+
+        data = {
+            "question": f"{disease_name}{query_type}",
+            "dataset_ids": department_ids,
+            "page": 1,
+            "page_size": k,
+            **self.RETRIEVAL_DEFAULTS,
+        }
+
+        return await self._retrieve_or_report("retrieve_treament", data, department_ids)
+
+    async def retrieve_treament_with_metadata_filteration(self, disease_name: str, department_names: List[str], tag_feas: List[str], exclude_tags: List[str], k: int = 32) -> List[Dict]:
+        """
+        Retrieve information about a disease from specified departments with metadata filtering.
+
+        Args:
+            disease_name: Name of the disease (e.g., "哮喘")
+            department_names: List of department names to search in
+            tag_feas: List of tags to include
+            exclude_tags: List of tags to exclude
+            k: Number of top results to retrieve
+        Returns:
+            List of dictionaries containing chunk information
+        """
+        department_ids = self.get_department_ids(department_names)
+
+        data = {
+            "question": disease_name,
+            "dataset_ids": department_ids,
+            "tag_feas": tag_feas,
+            "exclude_tags": exclude_tags,
+            "page_size": k,
+        }
+
+        return await self._retrieve_or_report("retrieve_treament_with_metadata_filteration", data, department_ids)
+
+    async def retrieve_many(self, queries: Iterable[Union[str, Tuple[str, str]]], department_names: List[str], k: int = 32, tag_feas: Optional[List[str]] = None, exclude_tags: Optional[List[str]] = None, concurrency: int = 64, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Retrieve chunks for many queries concurrently and return the results in input order.
+
+        Args:
+            queries: Queries as plain strings or (disease_name, query_type) pairs
+            department_names: List of department names to search in
+            k: Number of top results to retrieve per query
+            tag_feas: Optional list of tags to include
+            exclude_tags: Optional list of tags to exclude
+            concurrency: Maximum number of retrievals in flight
+            timeout: Per-request timeout in seconds, on top of the client timeouts
+
+        Returns:
+            One {"index", "query", "results", "error"} dictionary per query;
+            a failing query carries its error message instead of raising
+        """
+        department_ids = self.get_department_ids(department_names)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _retrieve_one(index: int, query: Union[str, Tuple[str, str]]) -> Dict:
+            question = query if isinstance(query, str) else f"{query[0]}{query[1]}"
+            try:
+                if not department_ids:
+                    raise RuntimeError("No valid department IDs found.")
+
+                data = {
+                    "question": question,
+                    "dataset_ids": department_ids,
+                    "page_size": k,
+                }
+                if tag_feas:
+                    data["tag_feas"] = tag_feas
+                if exclude_tags:
+                    data["exclude_tags"] = exclude_tags
+
+                async with semaphore:
+                    results = await self._retrieve_chunk_infos("retrieve_many", data, department_ids,
+                                                               with_idx=False, timeout=timeout)
+
+                return {"index": index, "query": question, "results": results, "error": None}
+
+            except Exception as e:
+                return {"index": index, "query": question, "results": [], "error": f"{type(e).__name__}: {e}"}
+
+        return await asyncio.gather(*(_retrieve_one(index, query) for index, query in enumerate(queries)))
@@ -0,0 +1,71 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# -----------------------------------------------------------------------------
+# startup-time benchmark for treatment_guideline_retriever
+#
+# Every run is a fresh interpreter (like a short-lived worker process) that
+# measures `import treatment_guideline_retriever` and `treatment_guideline_retriever()`
+# separately. Results are printed and appended to HISTORY_FILE, so regressions
+# show up when comparing against earlier commits.
+#
+# usage (from scripts/treatment_RAG): python bench_startup.py [runs]
+# -----------------------------------------------------------------------------
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+HISTORY_FILE = "./bench_startup_history.jsonl"
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+from treatment_guideline_retriever import treatment_guideline_retriever
+t1 = time.perf_counter()
+retriever = treatment_guideline_retriever()
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "construct_ms": (t2 - t1) * 1000,
+                  "departments": len(retriever.get_available_departments())}))
+"""
+
+
+def run_once() -> dict:
+    out = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True).stdout
+    # The retriever may print warnings; the measurement is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+if __name__ == "__main__":
+    # Warm-up run: builds the compiled mapping snapshot and the OS file cache
+    run_once()
+
+    samples = [run_once() for _ in range(RUNS)]
+    import_ms = [s["import_ms"] for s in samples]
+    construct_ms = [s["construct_ms"] for s in samples]
+    total_ms = [i + c for i, c in zip(import_ms, construct_ms)]
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "runs": RUNS,
+        "departments": samples[-1]["departments"],
+        "import_ms": summarize(import_ms),
+        "construct_ms": summarize(construct_ms),
+        "total_ms": summarize(total_ms),
+    }
+
+    print(f"import     median {report['import_ms']['median']:8.2f} ms  (min {report['import_ms']['min']:.2f}, max {report['import_ms']['max']:.2f})")
+    print(f"construct  median {report['construct_ms']['median']:8.2f} ms  (min {report['construct_ms']['min']:.2f}, max {report['construct_ms']['max']:.2f})")
+    print(f"total      median {report['total_ms']['median']:8.2f} ms")
+
+    with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report) + "\n")
@@ -0,0 +1,225 @@
+import json
+import marshal
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+# Fields kept from the server-side dataset records. Everything else (avatar,
+# parser_config, ...) is dropped, which keeps the snapshot small and avoids
+# touching lazy SDK attributes.
+DATASET_FIELDS = (
+    "id",
+    "name",
+    "chunk_count",
+    "document_count",
+    "embedding_model",
+    "chunk_method",
+    "permission",
+    "pagerank",
+    "tenant_id",
+    "description",
+    "create_time",
+    "update_time",
+)
+
+
+class SyncResult(NamedTuple):
+    """Outcome of one dataset sync."""
+
+    datasets: List[Dict[str, Any]]
+    changed: List[str]
+    removed: List[str]
+    full: bool
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.changed or self.removed)
+
+
+def serialize_dataset(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only DATASET_FIELDS of a server-side dataset record."""
+    return {field: raw[field] for field in DATASET_FIELDS if field in raw}
+
+
+def _compiled_path(json_path: str) -> str:
+    return f"{json_path}.marshal"
+
+
+def _replace_atomically(path: str, mode: str, write: Callable[[Any], None]) -> os.stat_result:
+    """
+    Write a file through a uniquely named temporary file in the same directory and
+    move it in place, so concurrent writers (e.g. many workers starting at once)
+    never share a temporary file and readers never see a half-written one.
+
+    Returns:
+        The stat of the written file
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:12]}.tmp"
+    try:
+        with open(tmp_path, mode.replace("w", "x"), encoding=None if "b" in mode else "utf-8") as f:
+            write(f)
+            f.flush()
+            stat = os.fstat(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return stat
+
+
+def _write_compiled(json_path: str, datasets: Sequence[Dict[str, Any]], json_stat: os.stat_result) -> None:
+    """
+    Write the precompiled sidecar of a snapshot: the explicit-field records as a
+    marshal blob, stamped with the size and mtime of the JSON file they were read
+    from, so a stale sidecar is detected without reading the JSON.
+    """
+    payload = (json_stat.st_size, json_stat.st_mtime_ns, [serialize_dataset(d) for d in datasets])
+    _replace_atomically(_compiled_path(json_path), "wb", lambda f: marshal.dump(payload, f))
+
+
+def load_snapshot(json_path: str) -> List[Dict[str, Any]]:
+    """
+    Read a dataset snapshot (compact or the legacy indented dump).
+
+    The precompiled marshal sidecar is used when it matches the JSON file; otherwise
+    the JSON is parsed once and the sidecar is (re)built for the next process.
+    Several processes may rebuild it at the same time: each writes its own
+    temporary file, and a process that fails to install its copy still returns
+    the datasets it read.
+
+    Raises:
+        FileNotFoundError: If the JSON snapshot does not exist
+    """
+    stat = os.stat(json_path)
+    try:
+        with open(_compiled_path(json_path), "rb") as f:
+            size, mtime_ns, datasets = marshal.load(f)
+        if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return datasets
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(json_path, "r", encoding="utf-8") as jf:
+        # Stamp the sidecar with the file actually read, even if the snapshot is replaced meanwhile
+        stat = os.fstat(jf.fileno())
+        datasets = [serialize_dataset(d) for d in json.load(jf)]
+    try:
+        _write_compiled(json_path, datasets, stat)
+    except OSError as e:
+        print(f"Warning: could not write compiled snapshot for {json_path}: {e}")
+    return datasets
+
+
+def write_snapshot(json_path: str, datasets: Sequence[Dict[str, Any]]) -> None:
+    """Write the snapshot as compact JSON (plus its compiled sidecar) through temporary files."""
+    stat = _replace_atomically(json_path, "w", lambda jf: json.dump(list(datasets), jf, default=str,
+                                                                     ensure_ascii=False, separators=(",", ":")))
+    _write_compiled(json_path, datasets, stat)
+
+
+def merge_dataset_list(previous: Sequence[Dict[str, Any]], fetched: Sequence[Dict[str, Any]], full: bool) -> SyncResult:
+    """
+    Merge freshly fetched dataset records into the previous snapshot.
+
+    Args:
+        previous: Datasets of the last snapshot
+        fetched: Raw records returned by the server, newest update first
+        full: Whether fetched is the complete server-side list (enables removal detection)
+
+    Returns:
+        SyncResult with the merged list (newest update first) and the changed / removed ids
+    """
+    previous_by_id = {d.get("id"): d for d in previous}
+    fetched = [serialize_dataset(raw) for raw in fetched]
+    fetched_ids = {d.get("id") for d in fetched}
+
+    changed = [d["id"] for d in fetched if previous_by_id.get(d.get("id")) != d]
+
+    if full:
+        merged = fetched
+        removed = [dataset_id for dataset_id in previous_by_id if dataset_id not in fetched_ids]
+    else:
+        merged = fetched + [d for d in previous if d.get("id") not in fetched_ids]
+        removed = []
+
+    return SyncResult(datasets=merged, changed=changed, removed=removed, full=full)
+
+
+def sync_dataset_list(previous: Sequence[Dict[str, Any]],
+                      fetch_page: Callable[[int, int], List[Dict[str, Any]]],
+                      page_size: int = 100,
+                      incremental: bool = True) -> SyncResult:
+    """
+    Fetch dataset records, stopping early when the rest is known to be unchanged.
+
+    fetch_page must return datasets ordered by update_time, newest first. In
+    incremental mode paging stops at the first page that reaches the newest
+    update_time of the previous snapshot, so a quiet server costs one small
+    request. A previous snapshot without update_time (legacy dump) forces a full
+    listing, and only a full listing can detect removed datasets.
+
+    Args:
+        previous: Datasets of the last snapshot
+        fetch_page: Callable (page, page_size) -> raw dataset records
+        page_size: Number of datasets requested per page
+        incremental: Whether early stop is allowed
+
+    Returns:
+        SyncResult
+    """
+    update_times = [d.get("update_time") for d in previous]
+    watermark = max(update_times) if previous and None not in update_times else None
+    full = not incremental or watermark is None
+
+    fetched = []
+    page = 1
+    while True:
+        rows = fetch_page(page, page_size)
+        fetched.extend(rows)
+        if len(rows) < page_size:
+            break
+        if not full and any((row.get("update_time") or 0) <= watermark for row in rows):
+            break
+        page += 1
+
+    return merge_dataset_list(previous, fetched, full=full)
+
+
+class BackgroundSync(threading.Thread):
+    """
+    Daemon thread calling a sync function every `interval` seconds.
+
+    Every `full_every`-th run is a full sync (to notice removed datasets); the
+    others are incremental. Errors are reported and the thread keeps going.
+    """
+
+    def __init__(self, sync_fn: Callable[..., Any], interval: float = 300.0, full_every: Optional[int] = 12):
+        """
+        Args:
+            sync_fn: Callable accepting incremental=<bool>, typically retriever.sync_datasets
+            interval: Seconds between two syncs
+            full_every: Run a full sync every N runs (None: never)
+        """
+        super().__init__(name="dataset-sync", daemon=True)
+        self.sync_fn = sync_fn
+        self.interval = interval
+        self.full_every = full_every
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        runs = 0
+        while not self._stop_event.wait(self.interval):
+            runs += 1
+            incremental = not (self.full_every and runs % self.full_every == 0)
+            try:
+                self.sync_fn(incremental=incremental)
+            except Exception as e:
+                print(f"Error during background dataset sync: {e}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        self.join(timeout)
@@ -0,0 +1,125 @@
+import itertools
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+
+class DepartmentRecord(NamedTuple):
+    """Immutable per-dataset metadata kept by the registry."""
+
+    id: str
+    name: str
+    chunk_count: int = 0
+    document_count: int = 0
+    embedding_model: str = ""
+
+    @classmethod
+    def from_dataset_dict(cls, dataset: Dict[str, Any]) -> Optional["DepartmentRecord"]:
+        """Build a record from a synced dataset dict, or None if it has no name / id."""
+        name = dataset.get("name", "")
+        dataset_id = dataset.get("id", "")
+        if not (name and dataset_id):
+            return None
+        return cls(
+            id=dataset_id,
+            name=name,
+            chunk_count=int(dataset.get("chunk_count") or 0),
+            document_count=int(dataset.get("document_count") or 0),
+            embedding_model=dataset.get("embedding_model") or "",
+        )
+
+
+class DepartmentSnapshot:
+    """
+    One immutable, versioned view of the department mapping.
+
+    Both indexes are read-only mappings, so a snapshot can be handed to any
+    number of threads without locking.
+    """
+
+    __slots__ = ("version", "name_to_id", "by_id")
+
+    def __init__(self, version: int, records: Iterable[DepartmentRecord]):
+        name_to_id = {}
+        by_id = {}
+        for record in records:
+            name_to_id[record.name] = record.id
+            by_id[record.id] = record
+        self.version = version
+        self.name_to_id: Mapping[str, str] = MappingProxyType(name_to_id)
+        self.by_id: Mapping[str, DepartmentRecord] = MappingProxyType(by_id)
+
+    def get_id(self, name: str) -> Optional[str]:
+        return self.name_to_id.get(name)
+
+    def get_name(self, department_id: str) -> Optional[str]:
+        record = self.by_id.get(department_id)
+        return record.name if record else None
+
+    def get_record(self, department_id: str) -> Optional[DepartmentRecord]:
+        return self.by_id.get(department_id)
+
+    def names(self) -> List[str]:
+        return list(self.name_to_id.keys())
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+
+class DepartmentRegistry:
+    """
+    Bidirectional department name <-> dataset id registry with hot-swappable snapshots.
+
+    Readers grab `registry.snapshot` once and use it for the whole request;
+    `publish` builds a complete new snapshot off to the side and swaps the
+    reference in a single assignment, so retrievals never block and never
+    observe a half-built mapping.
+    """
+
+    def __init__(self, datasets: Optional[Iterable[Dict[str, Any]]] = None):
+        self._versions = itertools.count(1)
+        self._publish_lock = threading.Lock()
+        self._snapshot = DepartmentSnapshot(0, ())
+        if datasets is not None:
+            self.publish(datasets)
+
+    @property
+    def snapshot(self) -> DepartmentSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def publish(self, datasets: Iterable[Dict[str, Any]]) -> DepartmentSnapshot:
+        """
+        Build a new snapshot from synced dataset dicts and swap it in atomically.
+
+        Args:
+            datasets: Dataset dicts as written by sync_datasets
+
+        Returns:
+            The newly published snapshot
+        """
+        records = []
+        for dataset in datasets:
+            record = DepartmentRecord.from_dataset_dict(dataset)
+            if record is not None:
+                records.append(record)
+
+        with self._publish_lock:
+            snapshot = DepartmentSnapshot(next(self._versions), records)
+            self._snapshot = snapshot
+        return snapshot
+
+    def get_id(self, name: str) -> Optional[str]:
+        return self._snapshot.get_id(name)
+
+    def get_name(self, department_id: str) -> Optional[str]:
+        return self._snapshot.get_name(department_id)
+
+    def get_record(self, department_id: str) -> Optional[DepartmentRecord]:
+        return self._snapshot.get_record(department_id)
+
+    def names(self) -> List[str]:
+        return self._snapshot.names()
@@ -0,0 +1,131 @@
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+def request_key(method: str, question: str, dataset_ids: Iterable[str], k: int,
+                tag_feas: Optional[Iterable[str]] = None, exclude_tags: Optional[Iterable[str]] = None) -> Tuple:
+    """
+    Hashable key of a retrieval request, normalized the same way as RetrievalCache.make_key
+    (stripped question, order-insensitive dataset IDs and tags).
+    """
+    return (
+        method,
+        question.strip(),
+        tuple(sorted(set(dataset_ids))),
+        tuple(sorted(set(tag_feas or []))),
+        tuple(sorted(set(exclude_tags or []))),
+        int(k),
+    )
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical calls made from several threads into one.
+
+    The first thread calling do(key, fn) runs fn; threads arriving with the same
+    key while it is in flight wait for it and get the same result (or exception).
+    Once the call has finished the key is forgotten, so later calls run again
+    (that is what the retrieval cache is for).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Args:
+            key: Identity of the call
+            fn: Zero-argument callable doing the actual work
+
+        Returns:
+            (result, joined) where joined tells whether the result was produced by
+            another thread's call; that result object is shared, so copy it before mutating
+
+        Raises:
+            Whatever fn raised
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            joined = call is not None
+            if joined:
+                self.coalesced += 1
+            else:
+                call = self._calls[key] = _Call()
+
+        if joined:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight, for use inside one event loop.
+
+    The shared call runs as its own task and every caller awaits it shielded, so a
+    caller that is cancelled or times out does not cancel the request the others
+    are waiting for.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Any] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Args:
+            key: Identity of the call
+            coro_fn: Zero-argument coroutine function doing the actual work
+
+        Returns:
+            (result, joined), see SingleFlight.do
+        """
+        # Imported here so the thread-based retriever does not pay for asyncio at startup
+        import asyncio
+
+        task = self._calls.get(key)
+        joined = task is not None
+        if joined:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), joined
+
+    def _forget(self, key: Hashable, task: Any) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller gave up waiting
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,149 @@
+import os
+import tempfile
+
+import numpy as np
+
+from dataset_sync import write_snapshot
+from local_guideline_index import LocalGuidelineIndex, LocalGuidelineRetriever, export_local_index, iter_ragflow_chunks
+
+# Offline build / retrieve check of the local index on a few synthetic chunks (no RAGFlow server needed).
+# usage (from scripts/treatment_RAG): python test_local_guideline_index.py   (or: python -m pytest test_local_guideline_index.py)
+
+DATASETS = [
+    {"id": "ds-resp", "name": "呼吸科", "chunk_count": 3, "document_count": 2},
+    {"id": "ds-eye", "name": "眼科", "chunk_count": 1, "document_count": 1},
+]
+
+CHUNKS = [
+    {"content": "哮喘的治疗以吸入糖皮质激素为主", "dataset_id": "ds-resp", "document_id": "doc-1",
+     "document_name": "哮喘指南.pdf", "tags": ["治疗"]},
+    {"content": "哮喘的诊断依据肺功能检查", "dataset_id": "ds-resp", "document_id": "doc-1",
+     "document_name": "哮喘指南.pdf", "tags": ["诊断"]},
+    {"content": "慢阻肺的治疗包括支气管扩张剂", "dataset_id": "ds-resp", "document_id": "doc-2",
+     "document_name": "慢阻肺指南.pdf", "tags": ["治疗"]},
+    {"content": "青光眼的治疗以降低眼压为主", "dataset_id": "ds-eye", "document_id": "doc-3",
+     "document_name": "青光眼指南.pdf", "tags": ["治疗"]},
+]
+
+
+def toy_embed(texts):
+    """Deterministic bag-of-characters embedding, enough to exercise the hybrid path."""
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for char in text:
+            vectors[row, ord(char) % 64] += 1.0
+    return vectors
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"Received status code {self.status_code}")
+
+    def json(self):
+        return self.payload
+
+
+class FakeDocument:
+    def __init__(self, document_id, name):
+        self.id = document_id
+        self.name = name
+
+
+class FakeDataset:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def list_documents(self, page, page_size):
+        return self.documents[(page - 1) * page_size:page * page_size]
+
+
+class FakeRetriever:
+    """Stands in for treatment_guideline_retriever: rag_object, session and json_path, served from CHUNKS."""
+
+    request_timeout = 5
+
+    def __init__(self, json_path, chunk_payload=None):
+        self.json_path = json_path
+        self.rag_object = self
+        self.session = self
+        self.chunk_payload = chunk_payload
+
+    def list_datasets(self, id):
+        documents = {c["document_id"]: c["document_name"] for c in CHUNKS if c["dataset_id"] == id}
+        return [FakeDataset([FakeDocument(d, name) for d, name in documents.items()])]
+
+    def get(self, url, headers, params, timeout):
+        if self.chunk_payload is not None:
+            return FakeResponse(*self.chunk_payload)
+        document_id = url.split("/documents/")[1].split("/")[0]
+        chunks = [{"content": c["content"], "tag_kwd": c["tags"]} for c in CHUNKS if c["document_id"] == document_id]
+        return FakeResponse({"code": 0, "data": {"chunks": chunks[(params["page"] - 1) * params["page_size"]:]}})
+
+
+def test_build_and_retrieve():
+    with tempfile.TemporaryDirectory() as index_dir:
+        LocalGuidelineIndex.build(CHUNKS, index_dir, DATASETS).close()
+        retriever = LocalGuidelineRetriever(index_dir)
+
+        assert retriever.get_department_ids(["呼吸科", "眼科"]) == ["ds-resp", "ds-eye"]
+
+        results = retriever.retrieve_treament("哮喘", ["呼吸科"], k=2)
+        assert [r["document_name"] for r in results] == ["哮喘指南.pdf", "哮喘指南.pdf"]
+        assert results[0]["content"] == CHUNKS[0]["content"]
+        assert results[0]["similarity_score"] == 1.0
+
+        # Department filter: the glaucoma chunk is only found in 眼科
+        assert "doc-3" not in [r["document_id"] for r in retriever.retrieve_treament("青光眼", ["呼吸科"])]
+        assert retriever.retrieve_treament("青光眼", ["眼科"])[0]["document_id"] == "doc-3"
+
+        # Tag filters
+        filtered = retriever.retrieve_treament_with_metadata_filteration("哮喘", ["呼吸科"], ["诊断"], [])
+        assert [r["content"] for r in filtered] == [CHUNKS[1]["content"]]
+        excluded = retriever.retrieve_treament_with_metadata_filteration("哮喘", ["呼吸科"], [], ["诊断"])
+        assert CHUNKS[1]["content"] not in [r["content"] for r in excluded]
+
+        guidelines = retriever.retrieve_guidelines("哮喘诊断", ["呼吸科"], k=3)
+        assert [r["idx"] for r in guidelines] == list(range(len(guidelines)))
+        retriever.index.close()
+
+
+def test_hybrid_retrieve():
+    with tempfile.TemporaryDirectory() as index_dir:
+        LocalGuidelineIndex.build(CHUNKS, index_dir, DATASETS, embed_fn=toy_embed, embed_batch_size=2).close()
+        retriever = LocalGuidelineRetriever(index_dir, embed_fn=toy_embed)
+        assert retriever.index.embeddings.shape == (len(CHUNKS), 64)
+        results = retriever.retrieve_treament("慢阻肺", ["呼吸科"], k=3)
+        assert results[0]["document_id"] == "doc-2"
+        retriever.index.close()
+
+
+def test_export_from_snapshot():
+    with tempfile.TemporaryDirectory() as work_dir:
+        json_path = os.path.join(work_dir, "datasets_full.json")
+        write_snapshot(json_path, DATASETS)
+        index = export_local_index(FakeRetriever(json_path), os.path.join(work_dir, "index"), department_names=["呼吸科"])
+        assert index.num_chunks == 3
+        assert index.dataset_ids == ["ds-resp"]
+        index.close()
+
+
+def test_export_refuses_error_payload():
+    for payload in [({"code": 0, "data": {}}, 401), ({"code": 102, "message": "Authentication error"},)]:
+        retriever = FakeRetriever("unused.json", chunk_payload=payload)
+        try:
+            list(iter_ragflow_chunks(retriever, DATASETS[:1]))
+        except RuntimeError:
+            continue
+        raise AssertionError(f"chunk listing error {payload} was not raised")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -75,4 +75,30 @@ returned_treatment_guidelines_with_metadata_filteration = retriever.retrieve_tre
     k=2
 )
 
-# print(returned_treatment_guidelines_with_metadata_filteration)
\ No newline at end of file
+# print(returned_treatment_guidelines_with_metadata_filteration)
+
+# -----------------------------------------------------------------------------
+# bulk retrieval (call retriever.retrieve_many)
+# -----------------------------------------------------------------------------
+
+# queries can be plain strings or (disease_name, query_type) pairs
+# results come back in input order; a failed query carries "error" instead of raising
+
+queries = [("哮喘", "治疗"), ("肺炎", "诊断"), "慢性阻塞性肺疾病治疗"]
+
+returned_many = retriever.retrieve_many(queries, department_names=departments, k=8, concurrency=16, timeout=30)
+
+# return type: list of dicts
+# {"index": 0, "query": "哮喘治疗", "results": [chunk_info, ...], "error": None}
+
+# print(returned_many)
+
+# -----------------------------------------------------------------------------
+# streaming large k (call retriever.iter_retrieve)
+# -----------------------------------------------------------------------------
+
+# pages are fetched in parallel and chunks are yielded as soon as their page arrives;
+# iteration stops at the first chunk below similarity_floor
+
+for chunk_info in retriever.iter_retrieve(disease_name=disease, department_names=departments, k=1024, page_size=64, similarity_floor=0.5):
+    pass  # print(chunk_info)
\ No newline at end of file